@@ -0,0 +1,264 @@
+import ast
+import math
+import operator
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_integer_dtype, is_numeric_dtype
+
+Evaluator = Callable[[pd.DataFrame], object]
+
+
+class ExpressionError(RuntimeError):
+    pass
+
+
+# the largest Python integer a power may produce, the most times text may be repeated, and the longest text a
+# repetition may produce, so an expression such as `9**9**9`, `"a" * 10**10` or `"a" * 9999 * 9999` can't tie up or
+# exhaust the server
+MAX_INTEGER_BITS = 4096
+MAX_REPEAT = 10_000
+MAX_REPEATED_LENGTH = 1_000_000
+
+
+def _power(base, exponent):
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * math.log2(abs(base)) > MAX_INTEGER_BITS:
+            raise ExpressionError(f"{base} ** {exponent} is too large")
+    return operator.pow(base, exponent)
+
+
+def _is_text(value) -> bool:
+    if isinstance(value, pd.Series):
+        return not is_numeric_dtype(value) and not is_bool_dtype(value)
+    return isinstance(value, (str, bytes, list, tuple))
+
+
+def _most_repeats(count) -> Optional[int]:
+    """Return the largest repeat count in ``count``, or None if it can't repeat text."""
+    if isinstance(count, pd.Series):
+        counts = count.dropna()
+        if not is_integer_dtype(counts) or is_bool_dtype(counts):
+            return None
+        return int(counts.max()) if len(counts) else 0
+    return count if isinstance(count, int) else None
+
+
+def _longest(text) -> int:
+    if isinstance(text, pd.Series):
+        try:
+            lengths = text.str.len().dropna()
+        except AttributeError:
+            # not text, e.g. dates, which can't be repeated anyway
+            return 0
+        return int(lengths.max()) if len(lengths) else 0
+    return len(text)
+
+
+def _multiply(left, right):
+    for text, count in ((left, right), (right, left)):
+        repeats = _most_repeats(count) if _is_text(text) else None
+        if repeats is None or repeats <= 0:
+            continue
+        if repeats > MAX_REPEAT:
+            raise ExpressionError(f"Text can be repeated at most {MAX_REPEAT:,} times")
+        # chained repetitions stay within the count, e.g. `"a" * 9999 * 9999`, but not within the length
+        if _longest(text) * repeats > MAX_REPEATED_LENGTH:
+            raise ExpressionError(f"Repeated text can be at most {MAX_REPEATED_LENGTH:,} characters long")
+    return operator.mul(left, right)
+
+
+def _truth(value):
+    # `and`, `or` and `not` test truth, so non-boolean columns are converted first rather than combined bitwise
+    if isinstance(value, pd.Series):
+        return value if value.dtype == bool else value.fillna(False).astype(bool)
+    return bool(value)
+
+
+def _not(value):
+    value = _truth(value)
+    return ~value if isinstance(value, pd.Series) else not value
+
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _multiply,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _power,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+}
+
+_UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: _not,
+    ast.Invert: operator.invert,
+}
+
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+def _series(value) -> pd.Series:
+    if not isinstance(value, pd.Series):
+        raise ExpressionError("This function needs a column, not a constant")
+    return value
+
+
+def _text(value) -> pd.Series:
+    return _series(value).astype("string[pyarrow]")
+
+
+def _numeric(value):
+    return pd.to_numeric(value, errors="coerce") if isinstance(value, pd.Series) else value
+
+
+FUNCTIONS: Dict[str, Callable] = {
+    # numbers
+    "abs": lambda x: np.abs(_numeric(x)),
+    "round": lambda x, digits=0: np.round(_numeric(x), digits),
+    "sqrt": lambda x: np.sqrt(_numeric(x)),
+    "log": lambda x: np.log(_numeric(x)),
+    "log10": lambda x: np.log10(_numeric(x)),
+    "exp": lambda x: np.exp(_numeric(x)),
+    "floor": lambda x: np.floor(_numeric(x)),
+    "ceil": lambda x: np.ceil(_numeric(x)),
+    "number": _numeric,
+    # text
+    "text": _text,
+    "lower": lambda x: _text(x).str.lower(),
+    "upper": lambda x: _text(x).str.upper(),
+    "strip": lambda x: _text(x).str.strip(),
+    "length": lambda x: _text(x).str.len(),
+    "contains": lambda x, s: _text(x).str.contains(s, regex=False),
+    "startswith": lambda x, s: _text(x).str.startswith(s),
+    "endswith": lambda x, s: _text(x).str.endswith(s),
+    "replace": lambda x, old, new: _text(x).str.replace(old, new, regex=False),
+    # dates
+    "date": lambda x: pd.to_datetime(_series(x), errors="coerce"),
+    "year": lambda x: pd.to_datetime(_series(x), errors="coerce").dt.year,
+    "month": lambda x: pd.to_datetime(_series(x), errors="coerce").dt.month,
+    "day": lambda x: pd.to_datetime(_series(x), errors="coerce").dt.day,
+    # missing values
+    "isnull": lambda x: _series(x).isna(),
+    "notnull": lambda x: _series(x).notna(),
+    "fillna": lambda x, value: _series(x).fillna(value),
+}
+
+
+def _compile_node(node: ast.AST, columns: Dict[str, str]) -> Evaluator:
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, columns)
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda df: value
+
+    if isinstance(node, ast.Name):
+        name = columns.get(node.id, node.id)
+        return lambda df: df[name]
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        op = _BINARY_OPERATORS[type(node.op)]
+        left, right = _compile_node(node.left, columns), _compile_node(node.right, columns)
+        return lambda df: op(left(df), right(df))
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        op = _UNARY_OPERATORS[type(node.op)]
+        operand = _compile_node(node.operand, columns)
+        return lambda df: op(operand(df))
+
+    if isinstance(node, ast.BoolOp):
+        op = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        values = [_compile_node(value, columns) for value in node.values]
+
+        def _bool_op(df):
+            result = _truth(values[0](df))
+            for value in values[1:]:
+                result = op(result, _truth(value(df)))
+            return result
+
+        return _bool_op
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARISONS for op in node.ops):
+        # chained comparisons such as `0 < x <= 10` are combined with `and`, as in Python
+        operands = [_compile_node(operand, columns) for operand in [node.left, *node.comparators]]
+        ops = [_COMPARISONS[type(op)] for op in node.ops]
+
+        def _compare(df):
+            values = [operand(df) for operand in operands]
+            result = ops[0](values[0], values[1])
+            for op, left, right in zip(ops[1:], values[1:], values[2:]):
+                result = result & op(left, right)
+            return result
+
+        return _compare
+
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = (_compile_node(n, columns) for n in (node.test, node.body, node.orelse))
+        return lambda df: pd.Series(np.where(test(df), body(df), orelse(df)), index=df.index)
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        if node.func.id not in FUNCTIONS:
+            raise ExpressionError(f"Unknown function {node.func.id!r}; available: {', '.join(sorted(FUNCTIONS))}")
+        function = FUNCTIONS[node.func.id]
+        args = [_compile_node(arg, columns) for arg in node.args]
+        return lambda df: function(*(arg(df) for arg in args))
+
+    raise ExpressionError(f"Unsupported syntax: {ast.unparse(node)!r}")
+
+
+class CompiledExpression:
+    """A column expression compiled into a tree of vectorized pandas/numpy operations.
+
+    Expressions use Python syntax restricted to arithmetic, comparisons, ``and``/``or``/``not``,
+    ``a if condition else b`` and the functions in `FUNCTIONS`. Columns are referenced by name, or in
+    backticks when the name isn't a valid identifier (e.g. ``upper(`First Name`)``).
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        columns = {}
+
+        def _quote_column(match: re.Match) -> str:
+            placeholder = f"__column_{len(columns)}"
+            columns[placeholder] = match.group(1)
+            return placeholder
+
+        try:
+            tree = ast.parse(re.sub(r"`([^`]+)`", _quote_column, text.strip()), mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression: {e.msg}") from e
+        self.columns = columns
+        self._evaluate = _compile_node(tree, columns)
+
+    def __call__(self, data: pd.DataFrame) -> pd.Series:
+        try:
+            result = self._evaluate(data)
+        except KeyError as e:
+            raise ExpressionError(f"Unknown column {e.args[0]!r}") from e
+        except (TypeError, ValueError, AttributeError, ArithmeticError) as e:
+            raise ExpressionError(str(e) or type(e).__name__) from e
+        except MemoryError as e:
+            raise ExpressionError("The expression needs more memory than is available") from e
+        if not isinstance(result, pd.Series):
+            result = pd.Series(result, index=data.index)
+        return result
+
+
+@lru_cache(maxsize=128)
+def compile_expression(text: str) -> CompiledExpression:
+    return CompiledExpression(text)
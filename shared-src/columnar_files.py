@@ -0,0 +1,199 @@
+import operator
+import re
+from dataclasses import dataclass
+from typing import List, NamedTuple, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PARQUET_MAGIC = b"PAR1"
+ARROW_MAGIC = b"ARROW1"  # Arrow IPC files, which is also the Feather v2 format
+
+FILTER_OPERATORS = {
+    "==": operator.eq,
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+_FILTER_PATTERN = re.compile(r"^\s*(`[^`]+`|.+?)\s*(==|!=|<=|>=|=|<|>)\s*(.*?)\s*$")
+
+
+class ColumnFilterError(RuntimeError):
+    pass
+
+
+class ColumnFilter(NamedTuple):
+    """A ``column <op> value`` comparison that can be pushed down to a Parquet or Arrow file scan."""
+
+    column: str
+    op: str
+    value: str
+
+    def expression(self, schema: pa.Schema) -> ds.Expression:
+        """Build the filter expression, with ``value`` converted to the column's type."""
+        try:
+            field = schema.field(self.column)
+        except KeyError:
+            raise ColumnFilterError(f"Unknown column {self.column!r}")
+        try:
+            if pa.types.is_date(field.type) or pa.types.is_timestamp(field.type):
+                value = _temporal_scalar(self.value, field.type)
+            else:
+                value = pc.cast(pa.scalar(self.value), field.type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError) as e:
+            raise ColumnFilterError(f"Can't compare {self.column!r} ({field.type}) with {self.value!r}") from e
+        return FILTER_OPERATORS[self.op](pc.field(self.column), value)
+
+
+def _temporal_scalar(value: str, type: pa.DataType) -> pa.Scalar:
+    # Arrow can't cast text to dates, nor to timestamps with a time zone unless the text has an offset, so the
+    # value is parsed by pandas; times without a zone are taken to be in the column's zone
+    timestamp = pd.Timestamp(value)
+    if pa.types.is_date(type):
+        return pa.scalar(timestamp.date(), type=type)
+    if type.tz is not None:
+        timestamp = timestamp.tz_localize(type.tz) if timestamp.tzinfo is None else timestamp.tz_convert(type.tz)
+    elif timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    return pa.scalar(timestamp, type=type)
+
+
+def parse_column_filters(text: str) -> List[ColumnFilter]:
+    """Parse one ``column <op> value`` filter per line, e.g. ``year >= 2020`` or ```State Code` == WA``.
+
+    Column names containing operator characters can be quoted in backticks, and values in single or double quotes.
+    """
+    filters = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = _FILTER_PATTERN.match(line)
+        if match is None or not match.group(3):
+            raise ColumnFilterError(f"Expected `column <op> value`, got {line.strip()!r}")
+        column, op, value = match.groups()
+        column = column.strip("`")
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+            value = value[1:-1]
+        filters.append(ColumnFilter(column, op, value))
+    return filters
+
+
+def columnar_format(file) -> Optional[str]:
+    """Return "parquet" or "arrow" if the upload is a Parquet or Arrow IPC/Feather file, going by its magic bytes."""
+    with file.getbuffer() as buffer:
+        header = bytes(buffer[:6])
+    if header.startswith(PARQUET_MAGIC):
+        return "parquet"
+    if header.startswith(ARROW_MAGIC):
+        return "arrow"
+    return None
+
+
+def _fragment(file, file_format: str) -> ds.Fragment:
+    # wrap the upload's buffer without copying it
+    source = pa.BufferReader(pa.py_buffer(file.getbuffer()))
+    if file_format == "parquet":
+        return ds.ParquetFileFormat().make_fragment(source)
+    return ds.IpcFileFormat().make_fragment(source)
+
+
+@dataclass
+class ColumnarFileInfo:
+    """What can be learned about a Parquet or Arrow file from its footer, without decoding any data."""
+
+    format: str
+    schema: pa.Schema
+    num_rows: int
+    num_row_groups: int
+
+
+def read_columnar_info(file) -> ColumnarFileInfo:
+    file_format = columnar_format(file)
+    if file_format == "parquet":
+        metadata = pq.ParquetFile(pa.BufferReader(pa.py_buffer(file.getbuffer()))).metadata
+        return ColumnarFileInfo(
+            file_format, metadata.schema.to_arrow_schema(), metadata.num_rows, metadata.num_row_groups
+        )
+    reader = pa.ipc.open_file(pa.BufferReader(pa.py_buffer(file.getbuffer())))
+    num_rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    return ColumnarFileInfo(file_format, reader.schema, num_rows, reader.num_record_batches)
+
+
+def filter_expression(filters: Sequence[ColumnFilter], schema: pa.Schema) -> Optional[ds.Expression]:
+    expression = None
+    for column_filter in filters:
+        term = ColumnFilter(*column_filter).expression(schema)
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def matching_row_groups(file, filters: Sequence[ColumnFilter]) -> int:
+    """Return how many row groups of a Parquet upload may hold rows matching ``filters``, from their statistics."""
+    fragment = _fragment(file, "parquet")
+    expression = filter_expression(filters, fragment.physical_schema)
+    if expression is None:
+        return fragment.num_row_groups
+    return fragment.subset(expression).num_row_groups
+
+
+def scan_columnar_upload(
+    file, columns: Optional[Sequence[str]] = None, filters: Sequence[ColumnFilter] = (), batch_size: int = 131_072
+):
+    """Return the schema and a record batch iterator over the selected columns and rows of a columnar upload.
+
+    Only the requested columns are decoded. For Parquet, row groups whose statistics rule out every filter are
+    skipped without being read.
+    """
+    fragment = _fragment(file, columnar_format(file))
+    expression = filter_expression(filters, fragment.physical_schema)
+    columns = list(columns) if columns else None
+    scanner = fragment.scanner(columns=columns, filter=expression, batch_size=batch_size)
+    return scanner.projected_schema, scanner.to_batches()
+
+
+def table_to_pandas(table: pa.Table) -> pd.DataFrame:
+    """Convert an Arrow table to pandas, keeping string columns zero-copy as Arrow-backed string arrays.
+
+    Columns that pandas metadata records as object dtype (e.g. data loaded with every column as text) are converted
+    to object columns as before, so they round-trip unchanged.
+    """
+    pandas_metadata = table.schema.pandas_metadata or {}
+    object_columns = {
+        column["name"] for column in pandas_metadata.get("columns", []) if column["numpy_type"] == "object"
+    }
+    arrow_string_columns = [
+        field.name
+        for field in table.schema
+        if field.name not in object_columns and (pa.types.is_string(field.type) or pa.types.is_large_string(field.type))
+    ]
+    data = table.drop(arrow_string_columns).to_pandas(split_blocks=True)
+    for column in arrow_string_columns:
+        values = table.column(column)
+        if pa.types.is_large_string(values.type):
+            values = values.cast(pa.string())
+        data[column] = pd.arrays.ArrowStringArray(values)
+    return data[table.column_names]
+
+
+def read_columnar_upload(
+    file, columns: Optional[Sequence[str]] = None, filters: Sequence[ColumnFilter] = ()
+) -> pd.DataFrame:
+    """Read the selected columns and rows of a Parquet or Arrow IPC/Feather upload into a DataFrame.
+
+    Args:
+        file: The uploaded file.
+        columns (Optional[Sequence[str]], optional): The columns to read. Defaults to all of them.
+        filters (Sequence[ColumnFilter], optional): Only rows matching all of these are read. Defaults to none.
+
+    Returns:
+        pd.DataFrame: The data, with string columns backed by the Arrow buffers they were decoded into.
+    """
+    schema, batches = scan_columnar_upload(file, columns, filters)
+    return table_to_pandas(pa.Table.from_batches(batches, schema=schema))
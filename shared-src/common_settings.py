@@ -13,6 +13,7 @@ class AppSettings(BaseSettings):
 
     newsapi_cache_dir: Path
     app_debug: bool = True
+    upload_cache_max_mb: int = 2048
 
     @property
     def credentials_dir(self) -> Path:
@@ -48,3 +49,13 @@ class AppSettings(BaseSettings):
     @property
     def pdf_uploads(self) -> Path:
         return self.streamlit_app_output_dir / "pdf-upload-dir"
+
+    @property
+    def fit_cache_dir(self) -> Path:
+        return self.streamlit_app_output_dir / "rating-curve-fits"
+
+    @property
+    def upload_cache_dir(self) -> Path:
+        p = self.streamlit_app_output_dir / "upload-cache"
+        p.mkdir(exist_ok=True, parents=True)
+        return p
@@ -0,0 +1,644 @@
+import hashlib
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from logzero import logger
+
+from columnar_files import table_to_pandas
+from page_helpers import DatasetHandle, DtypeReport, SampleReport, as_dataframe, upload_content_hash
+
+# reports attached to a parsed upload's ``attrs``, which are stored in the cached file's schema metadata
+PERSISTED_REPORTS = {"dtype_report": DtypeReport, "sample_report": SampleReport}
+
+
+class ParsedUploadCache:
+    """A disk-backed cache of parsed uploads, stored as uncompressed Arrow IPC files.
+
+    Entries are keyed by the upload's content hash plus the parse options used, so the same file uploaded by
+    different sessions shares one parsed copy. Cached files are memory-mapped back in on a hit, and the last
+    ``max_loaded`` uploads loaded are kept mapped, so rerunning a page doesn't convert the file again. The least
+    recently used entries are evicted once the cache grows past ``max_bytes``, except those whose files are still
+    in use by this process (see `hold`).
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, max_loaded: int = 4):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_loaded = max_loaded
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._loaded: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._users: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(file, **parse_options) -> str:
+        options = json.dumps({"type": file.type, **parse_options}, sort_keys=True)
+        return hashlib.sha256(f"{upload_content_hash(file)}:{options}".encode()).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.arrow"
+
+    def hold(self, key: str, user: object):
+        """Keep the entry for ``key`` from being evicted while ``user``, e.g. an object mapping its file, is alive."""
+        with self._lock:
+            self._users[key] = self._users.get(key, 0) + 1
+        weakref.finalize(user, self._release, key)
+
+    def _release(self, key: str):
+        with self._lock:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+
+    def _remember(self, key: str, data: pd.DataFrame):
+        with self._lock:
+            self._loaded[key] = data
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self.path_for(key)
+        with self._lock:
+            data = self._loaded.get(key)
+            if data is not None:
+                self._loaded.move_to_end(key)
+        try:
+            # bump the modification time, which is what the LRU eviction orders by
+            os.utime(path)
+            if data is not None:
+                return data
+            with pa.memory_map(str(path)) as source:
+                table = pa.ipc.open_file(source).read_all()
+        except FileNotFoundError:
+            return None
+
+        data = table_to_pandas(table)
+        metadata = table.schema.metadata or {}
+        for name, report_type in PERSISTED_REPORTS.items():
+            if name.encode() in metadata:
+                data.attrs[name] = report_type(**json.loads(metadata[name.encode()]))
+        self.hold(key, data)
+        self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: pd.DataFrame):
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        for name in PERSISTED_REPORTS:
+            if report := data.attrs.get(name):
+                metadata[name.encode()] = json.dumps(asdict(report)).encode()
+        table = table.replace_schema_metadata(metadata)
+
+        def _write_table(path: Path):
+            with pa.OSFile(str(path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+        self._write(key, _write_table)
+
+    def _write(self, key: str, write_fn: Callable[[Path], None]):
+        # write to a temporary name first so concurrent readers never see a partial file
+        tmp_path = self.cache_dir / f"{key}.{uuid4().hex}.tmp"
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, self.path_for(key))
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.evict()
+
+    def evict(self):
+        entries = sorted(self.cache_dir.glob("*.arrow"), key=lambda p: p.stat().st_mtime)
+        total_bytes = sum(p.stat().st_size for p in entries)
+        with self._lock:
+            in_use = set(self._users)
+        for entry in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if entry.stem in in_use:
+                continue
+            total_bytes -= entry.stat().st_size
+            logger.debug(f"Evicting {entry.name} from the upload cache")
+            entry.unlink(missing_ok=True)
+
+    def load(self, file, loader: Callable[..., pd.DataFrame], **parse_options) -> Tuple[str, pd.DataFrame]:
+        """Return the cache key and parsed upload, parsing it with ``loader(file, **parse_options)`` on a miss."""
+        key = self.cache_key(file, **parse_options)
+        data = self.get(key)
+        if data is None:
+            logger.info(f"Parsing upload {file.name} (cache miss)")
+            file.seek(0)
+            data = loader(file, **parse_options)
+            self.put(key, data)
+            self._remember(key, data)
+        return key, data
+
+    def spill(self, file, writer: Callable[..., None], **parse_options) -> Tuple[str, Path]:
+        """Return the cache key and path of the upload as written by ``writer(file, path, **parse_options)``.
+
+        Unlike `load`, the upload is never parsed into a DataFrame here; ``writer`` streams it to an Arrow IPC
+        file that a `lazy_dataset.LazyDataset` can query from disk. `hold` the entry while the file is being queried.
+        """
+        key = self.cache_key(file, spilled=True, **parse_options)
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            logger.info(f"Spilling upload {file.name} to disk (cache miss)")
+            file.seek(0)
+            self._write(key, lambda tmp_path: writer(file, tmp_path, **parse_options))
+        return key, path
+
+
+ROW_TEXT_SEPARATOR = "\x1f"
+
+
+def _trigram_codes(text: np.ndarray) -> np.ndarray:
+    text = text.astype(np.uint32)
+    return (text[:-2] << 16) | (text[1:-1] << 8) | text[2:]
+
+
+def _intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersect two ascending arrays of unique values by binary searching the smaller one into the larger."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    idx = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return a[b[idx] == a]
+
+
+def lowercase_query(query: str) -> str:
+    """Lowercase ``query`` exactly as `RowSearchIndex` lowercases the row text.
+
+    Python's ``str.lower`` differs from Arrow's ``utf8_lower`` on a few characters, e.g. "İ" and a final "Σ", and a
+    query lowercased one way wouldn't match row text lowercased the other.
+    """
+    return pc.utf8_lower(pa.scalar(query, type=pa.string())).as_py()
+
+
+class RowSearchIndex:
+    """A case-insensitive substring index over every cell of a DataFrame.
+
+    Each row is rendered once into a lowercase text column, and a trigram inverted index maps every 3-byte
+    sequence to the sorted positions of the rows containing it. A search intersects the posting lists of the
+    query's trigrams and only verifies the surviving candidate rows against the row text.
+    """
+
+    def __init__(self, data: Union[DatasetHandle, pd.DataFrame], chunk_rows: int = 100_000):
+        data = as_dataframe(data)
+        self.num_rows = len(data)
+        self.row_text = self._build_row_text(data)
+        self.trigrams, self.posting_offsets, self.postings = self._build_postings(chunk_rows)
+
+    @staticmethod
+    def _build_row_text(data: pd.DataFrame) -> pa.LargeStringArray:
+        columns = [
+            pc.utf8_lower(pa.array(data[column].astype("string[pyarrow]").fillna(""), type=pa.string()))
+            for column in data.columns
+        ]
+        if not columns:
+            return pa.array([""] * len(data), type=pa.large_string())
+        row_text = pc.binary_join_element_wise(*columns, ROW_TEXT_SEPARATOR) if len(columns) > 1 else columns[0]
+        if isinstance(row_text, pa.ChunkedArray):
+            row_text = row_text.combine_chunks()
+        return row_text.cast(pa.large_string())
+
+    def _text_buffers(self) -> Tuple[np.ndarray, np.ndarray]:
+        _, offsets, text = self.row_text.buffers()
+        offsets = np.frombuffer(offsets, dtype=np.int64)[
+            self.row_text.offset : self.row_text.offset + self.num_rows + 1
+        ]
+        text = np.frombuffer(text, dtype=np.uint8) if text is not None else np.empty(0, dtype=np.uint8)
+        return offsets, text
+
+    def _build_postings(self, chunk_rows: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        offsets, text = self._text_buffers()
+        pairs = []
+        for start_row in range(0, self.num_rows, chunk_rows):
+            rows = np.arange(start_row, min(start_row + chunk_rows, self.num_rows))
+            starts, ends = offsets[rows], offsets[rows + 1]
+            chunk_text = text[starts[0] : ends[-1]]
+            if len(chunk_text) < 3:
+                continue
+            codes = _trigram_codes(chunk_text)
+            # each trigram belongs to the row its first byte is in, and must not run past the end of that row
+            row_of_byte = np.repeat(rows, ends - starts)[: len(codes)]
+            in_row = np.arange(len(codes)) + starts[0] + 2 < ends[row_of_byte - start_row]
+            pairs.append(np.unique((codes[in_row].astype(np.uint64) << 32) | row_of_byte[in_row].astype(np.uint64)))
+
+        pairs = np.concatenate(pairs) if pairs else np.empty(0, dtype=np.uint64)
+        # each chunk is already a sorted run, which the stable (merge based) sort takes advantage of
+        pairs = np.sort(pairs, kind="stable")
+        codes = (pairs >> 32).astype(np.uint32)
+        posting_offsets = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [len(pairs)]))
+        if not len(pairs):
+            posting_offsets = np.zeros(1, dtype=np.int64)
+        return codes[posting_offsets[:-1]], posting_offsets, (pairs & 0xFFFFFFFF).astype(np.int32)
+
+    def _postings_for(self, trigram: int) -> np.ndarray:
+        idx = np.searchsorted(self.trigrams, trigram)
+        if idx == len(self.trigrams) or self.trigrams[idx] != trigram:
+            return np.empty(0, dtype=np.int64)
+        return self.postings[self.posting_offsets[idx] : self.posting_offsets[idx + 1]]
+
+    def candidates(self, query: str) -> Optional[np.ndarray]:
+        """Return the rows that contain every trigram of ``query``, or None if the query is too short to use them."""
+        encoded = np.frombuffer(lowercase_query(query).encode(), dtype=np.uint8)
+        if len(encoded) < 3:
+            return None
+        posting_lists = sorted((self._postings_for(code) for code in np.unique(_trigram_codes(encoded))), key=len)
+        candidates = posting_lists[0]
+        for postings in posting_lists[1:]:
+            if not len(candidates):
+                break
+            candidates = _intersect_sorted(candidates, postings)
+        return candidates
+
+    def search(self, query: str, regex: bool = False, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return the sorted positions of the rows matching ``query``, case-insensitively.
+
+        Args:
+            query (str): The substring to look for, or a regular expression when ``regex`` is set.
+            regex (bool, optional): Treat ``query`` as a regular expression, which scans the row text instead of
+                using the trigram index. Defaults to False.
+            rows (Optional[np.ndarray], optional): Only consider these row positions, in ascending order.
+                Defaults to every row.
+
+        Returns:
+            np.ndarray: Positions of the matching rows, in ascending order.
+        """
+        if not regex:
+            query = lowercase_query(query)
+        candidates = None if regex else self.candidates(query)
+        if rows is not None:
+            candidates = rows if candidates is None else _intersect_sorted(candidates, rows)
+        if candidates is None:
+            candidates = np.arange(self.num_rows)
+
+        text = self.row_text.take(pa.array(candidates)) if len(candidates) != self.num_rows else self.row_text
+        if regex:
+            matches = pc.match_substring_regex(text, query, ignore_case=True)
+        else:
+            matches = pc.match_substring(text, query)
+        return candidates[matches.to_numpy(zero_copy_only=False)]
+
+
+@dataclass
+class IncrementalRowFilter:
+    """Wraps a `RowSearchIndex` to narrow successive filters from the previous result.
+
+    When the new query contains the previous one (e.g. "smi" -> "smit" -> "smith"), only the rows that matched
+    the previous query can match, so the search is restricted to them. Anything else falls back to a full search.
+    """
+
+    index: RowSearchIndex
+    last_query: Optional[str] = None
+    last_rows: Optional[np.ndarray] = None
+
+    def search(self, query: str, regex: bool = False) -> np.ndarray:
+        if regex:
+            return self.index.search(query, regex=True)
+
+        query = lowercase_query(query)
+        rows = None
+        if self.last_query and self.last_query in query:
+            rows = self.last_rows
+        result = self.index.search(query, rows=rows)
+        self.last_query, self.last_rows = query, result
+        return result
+
+
+def sort_ranks(column: pd.Series) -> np.ndarray:
+    """Return each value's rank among the distinct values of ``column``, with missing values ranked last.
+
+    Ranks are computed once per column and can be combined with `sort_permutation` for any multi-column sort.
+    """
+    try:
+        codes, _ = pd.factorize(column, sort=True)
+    except TypeError:
+        # mixed types that can't be compared with each other sort by their text, as in the row filter
+        codes, _ = pd.factorize(column.astype(str).where(column.notna()), sort=True)
+    codes = codes.astype(np.int64)
+    codes[codes < 0] = codes.max(initial=-1) + 1
+    return codes
+
+
+def sort_permutation(ranks: Sequence[np.ndarray]) -> np.ndarray:
+    """Return the row positions in ascending order of ``ranks[0]``, then ``ranks[1]``, and so on (stable)."""
+    if len(ranks) == 1:
+        return np.argsort(ranks[0], kind="stable")
+    return np.lexsort(ranks[::-1])
+
+
+def restrict_permutation(permutation: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """Put a subset of rows into the order of a permutation of all rows, without sorting again.
+
+    Args:
+        permutation (np.ndarray): Positions of every row in sorted order, as from `sort_permutation`.
+        rows (Optional[np.ndarray]): The positions of the rows to keep, such as the result of a row filter.
+            Defaults to every row.
+
+    Returns:
+        np.ndarray: Indices into ``rows`` giving its rows in sorted order.
+    """
+    if rows is None:
+        return permutation
+    position = np.full(len(permutation), -1, dtype=np.int64)
+    position[rows] = np.arange(len(rows))
+    ordered = position[permutation]
+    return ordered[ordered >= 0]
+
+
+@dataclass
+class ColumnProfile:
+    """Summary statistics for one column, computed from a single hash-based value count."""
+
+    name: str
+    dtype: str
+    inferred_type: str
+    count: int
+    nulls: int
+    distinct: int
+    min: object
+    max: object
+    value_counts: pd.Series
+
+    @property
+    def is_unique(self) -> bool:
+        return self.distinct == self.count
+
+    @property
+    def most_common(self) -> object:
+        return self.value_counts.index[0] if len(self.value_counts) else None
+
+    def top_values(self, k: int = 10) -> pd.Series:
+        return self.value_counts.head(k)
+
+
+def profile_column(name: str, column: pd.Series) -> ColumnProfile:
+    try:
+        counts = column.value_counts(dropna=False, sort=False)
+    except TypeError:
+        # unhashable cells, such as the lists produced by grouping rows
+        counts = column.astype(str).value_counts(dropna=False, sort=False)
+
+    counts = counts[counts > 0]  # categoricals also report their unused categories
+    null_keys = counts.index.isna()
+    nulls = int(counts[null_keys].sum())
+    value_counts = counts[~null_keys].sort_values(ascending=False, kind="stable")
+    values = value_counts.index
+    if isinstance(values, pd.CategoricalIndex):
+        values = pd.Index(np.asarray(values))
+    try:
+        min_value, max_value = (values.min(), values.max()) if len(values) else (None, None)
+    except (TypeError, ValueError):
+        min_value = max_value = None
+    return ColumnProfile(
+        name=name,
+        dtype=str(column.dtype),
+        inferred_type=pd.api.types.infer_dtype(values, skipna=True),
+        count=len(column),
+        nulls=nulls,
+        distinct=len(values),
+        min=min_value,
+        max=max_value,
+        value_counts=value_counts,
+    )
+
+
+def profile_columns(
+    data: Union[DatasetHandle, pd.DataFrame], max_workers: Optional[int] = None
+) -> Dict[str, ColumnProfile]:
+    """Profile every column of ``data`` in parallel on a thread pool."""
+    data = as_dataframe(data)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        profiles = executor.map(profile_column, data.columns, (data[column] for column in data.columns))
+        return dict(zip(data.columns, profiles))
+
+
+@dataclass
+class GroupIndex:
+    """A grouped view of a DataFrame, stored as a row permutation plus per-group offsets into it.
+
+    The rows of group ``i`` (in display order) are ``data.iloc[order[offsets[g]:offsets[g + 1]]]`` where
+    ``g = group_order[i]``, so a group's rows are only gathered when it is displayed. Rows whose group key
+    contains a missing value are left out, as with ``DataFrame.groupby``.
+    """
+
+    data: pd.DataFrame
+    group_by: List[str]
+    order: np.ndarray
+    offsets: np.ndarray
+    group_order: np.ndarray
+    keys: pd.DataFrame
+
+    @classmethod
+    def build(
+        cls,
+        data: Union[DatasetHandle, pd.DataFrame],
+        group_by: Sequence[str],
+        sort_by: Sequence[str] = (),
+        rows: Optional[np.ndarray] = None,
+    ) -> "GroupIndex":
+        """Group ``data`` by ``group_by``.
+
+        Args:
+            data (Union[DatasetHandle, pd.DataFrame]): The rows to group.
+            group_by (Sequence[str]): The columns whose values identify a group.
+            sort_by (Sequence[str]): Columns to sort by. Group key columns order the groups; any other columns
+                order the rows within each group.
+            rows (Optional[np.ndarray], optional): The positions of the rows to group, in order, such as a filtered
+                and sorted view's; only the columns grouped and sorted by are gathered. Defaults to every row.
+
+        Returns:
+            GroupIndex: The grouped view. Groups are in key order unless ``sort_by`` names a group key.
+        """
+        data = as_dataframe(data)
+        group_by = list(group_by)
+        row_sort = [column for column in sort_by if column not in group_by]
+        view = data[group_by + row_sort] if rows is None else data[group_by + row_sort].iloc[rows]
+        codes = view.groupby(group_by, observed=True, sort=True).ngroup().to_numpy()
+        num_groups = int(np.nanmax(codes)) + 1 if len(codes) and not np.isnan(codes).all() else 0
+        codes = np.nan_to_num(codes, nan=-1).astype(np.int64)
+
+        if row_sort:
+            positions = sort_permutation([sort_ranks(view[column]) for column in row_sort])
+        else:
+            positions = np.arange(len(view))
+        positions = positions[codes[positions] >= 0]
+        order = positions[np.argsort(codes[positions], kind="stable")]
+        offsets = np.zeros(num_groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes[order], minlength=num_groups), out=offsets[1:])
+
+        keys = view[group_by].iloc[order[offsets[:-1]]].reset_index(drop=True)
+        key_sort = [column for column in sort_by if column in group_by]
+        if key_sort:
+            group_order = keys.sort_values(key_sort, kind="stable").index.to_numpy()
+        else:
+            group_order = np.arange(num_groups)
+        if rows is not None:
+            order = rows[order]
+        return cls(data, group_by, order, offsets, group_order, keys)
+
+    def __len__(self) -> int:
+        return len(self.group_order)
+
+    def group_rows(self, idx: int) -> pd.DataFrame:
+        """Return the rows of the ``idx``-th group in display order."""
+        group = self.group_order[idx]
+        return self.data.iloc[self.order[self.offsets[group] : self.offsets[group + 1]]]
+
+    def group_record(self, idx: int) -> dict:
+        """Return the ``idx``-th group as one record: key columns as values and every other column as a list."""
+        rows = self.group_rows(idx)
+        record = self.keys.iloc[self.group_order[idx]].to_dict()
+        record.update({column: rows[column].tolist() for column in self.data.columns if column not in record})
+        return record
+
+    def records(self, start: int, stop: int) -> pd.DataFrame:
+        """Return groups ``start`` up to ``stop`` as a DataFrame with one row per group."""
+        return pd.DataFrame([self.group_record(idx) for idx in range(start, min(stop, len(self)))])
+
+    def head(self, num_groups: int) -> pd.DataFrame:
+        """Return the first ``num_groups`` groups as a DataFrame with one row per group."""
+        return self.records(0, num_groups)
+
+
+# shared by every RowWindows, so prefetching never holds more than a couple of threads
+_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="row-window-prefetch")
+
+
+class RowWindows:
+    """Serves fixed-size windows of a result's rows on demand, so only one window is sent to the browser at a time.
+
+    Recently viewed windows are kept, and the window after the one being viewed is fetched in the background so
+    paging forward doesn't wait for it.
+
+    Args:
+        fetch (Callable[[int, int], pd.DataFrame]): Returns the rows from ``start`` up to ``stop``. It's called from
+            a background thread, so it must not call Streamlit.
+        num_rows (int): The total number of rows.
+        window_size (int, optional): The number of rows per window. Defaults to 100.
+        max_windows (int, optional): The number of fetched windows to keep. Defaults to 8.
+    """
+
+    def __init__(
+        self, fetch: Callable[[int, int], pd.DataFrame], num_rows: int, window_size: int = 100, max_windows: int = 8
+    ):
+        self.fetch = fetch
+        self.num_rows = num_rows
+        self.window_size = window_size
+        self.max_windows = max_windows
+        self._windows: "OrderedDict[int, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def num_windows(self) -> int:
+        return -(-self.num_rows // self.window_size)
+
+    def bounds(self, idx: int) -> Tuple[int, int]:
+        start = idx * self.window_size
+        return start, min(start + self.window_size, self.num_rows)
+
+    def _request(self, idx: int) -> Future:
+        with self._lock:
+            future = self._windows.get(idx)
+            if future is None:
+                future = self._windows[idx] = _PREFETCH_EXECUTOR.submit(self.fetch, *self.bounds(idx))
+                while len(self._windows) > self.max_windows:
+                    self._windows.popitem(last=False)
+            self._windows.move_to_end(idx)
+            return future
+
+    def window(self, idx: int, prefetch: bool = True) -> pd.DataFrame:
+        """Return window ``idx``, starting a background fetch of the next window if ``prefetch`` is set."""
+        future = self._request(idx)
+        if prefetch and idx + 1 < self.num_windows:
+            self._request(idx + 1)
+        try:
+            return future.result()
+        except Exception:
+            # don't keep a failed fetch around, so the next request retries it
+            with self._lock:
+                self._windows.pop(idx, None)
+            raise
+
+    def chunks(self, chunk_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+        """Fetch every row, ``chunk_rows`` at a time, without keeping them in the window cache (e.g. for an export)."""
+        for start in range(0, self.num_rows, chunk_rows):
+            yield self.fetch(start, min(start + chunk_rows, self.num_rows))
+
+
+# file extension and MIME type for each format `write_export` supports
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "JSON Lines": ("jsonl", "application/jsonl"),
+}
+
+
+def _lists_as_json(chunk: pd.DataFrame) -> pd.DataFrame:
+    # grouped rows hold a list of values per column, which CSV has no way to represent
+    chunk = chunk.copy(deep=False)
+    for column in chunk.columns:
+        if chunk[column].dtype == object:
+            chunk[column] = chunk[column].map(
+                lambda value: json.dumps(value, default=str) if isinstance(value, list) else value
+            )
+    return chunk
+
+
+def _parquet_schema(chunk: pd.DataFrame) -> pa.Schema:
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    # a column that's entirely missing in the first chunk is most likely text, not the null type Arrow infers
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+def write_export(chunks: Iterable[pd.DataFrame], sink: BinaryIO, export_format: str):
+    """Encode rows into ``sink`` as CSV, Parquet or JSON Lines, one chunk at a time.
+
+    Only the chunk being encoded is held in memory, so the size of an export is limited by ``sink`` rather than by
+    building the whole output at once. Each chunk becomes one Parquet row group.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): The rows to export, e.g. from `RowWindows.chunks`.
+        sink (BinaryIO): Where to write the encoded rows.
+        export_format (str): One of `EXPORT_FORMATS`.
+    """
+    if export_format == "CSV":
+        for i, chunk in enumerate(chunks):
+            sink.write(_lists_as_json(chunk).to_csv(index=False, header=i == 0).encode())
+    elif export_format == "JSON Lines":
+        for chunk in chunks:
+            json_lines = chunk.to_json(
+                orient="records", lines=True, date_format="iso", double_precision=15, default_handler=str
+            )
+            sink.write(json_lines.encode())
+    elif export_format == "Parquet":
+        writer = None
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    writer = pq.ParquetWriter(sink, _parquet_schema(chunk))
+                writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise RuntimeError(f"Unknown export format {export_format!r}")
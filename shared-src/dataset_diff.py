@@ -0,0 +1,160 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+# FNV-1a's offset basis and prime; the seed must be non-zero since pandas hashes 0 to 0
+_HASH_SEED = np.uint64(0xCBF29CE484222325)
+_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def _column_codes(old: pd.Series, new: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Number the distinct values of two versions of a column together, so equal values get equal codes.
+
+    Missing values all get the same code. Columns loaded as different dtypes are compared as numbers if both are
+    numeric, and as text otherwise.
+    """
+    if old.dtype != new.dtype:
+        if is_numeric_dtype(old) and is_numeric_dtype(new):
+            old, new = old.astype("float64"), new.astype("float64")
+        else:
+            old, new = old.astype(str).where(old.notna()), new.astype(str).where(new.notna())
+    elif isinstance(old.dtype, pd.CategoricalDtype):
+        # categoricals are numbered already, once both use the same categories
+        categories = old.cat.categories.union(new.cat.categories)
+        return (
+            old.cat.set_categories(categories).cat.codes.to_numpy(np.int64),
+            new.cat.set_categories(categories).cat.codes.to_numpy(np.int64),
+        )
+    codes, _ = pd.factorize(pd.concat([old, new], ignore_index=True), use_na_sentinel=True)
+    return codes[: len(old)], codes[len(old) :]
+
+
+def _combine(hashes: Sequence[np.ndarray], num_rows: int) -> np.ndarray:
+    combined = np.full(num_rows, _HASH_SEED, dtype=np.uint64)
+    for column_hashes in hashes:
+        combined = combined * _HASH_MULTIPLIER ^ column_hashes
+    return combined
+
+
+def _row_keys(codes: Sequence[np.ndarray], num_rows: int) -> np.ndarray:
+    # hash the codes before combining them, as small consecutive integers combine poorly
+    return _combine([pd.util.hash_array(column_codes.astype(np.uint64)) for column_codes in codes], num_rows)
+
+
+def _with_occurrence(hashes: np.ndarray) -> np.ndarray:
+    # the nth row with a given hash only matches the nth row with that hash on the other side
+    repeated = pd.Series(hashes).duplicated().to_numpy()
+    if not repeated.any():
+        return hashes
+    occurrence = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+    hashes = hashes.copy()
+    hashes[repeated] = _combine([hashes[repeated], pd.util.hash_array(occurrence[repeated])], int(repeated.sum()))
+    return hashes
+
+
+@dataclass
+class DatasetDiff:
+    """The differences between two versions of a dataset, as row positions into each version.
+
+    Rows are matched on ``key_columns``, or on their full contents if there are none, in which case a row that
+    changed shows up as one removed and one added row.
+    """
+
+    key_columns: List[str]
+    compared_columns: List[str]
+    added_columns: List[str]
+    removed_columns: List[str]
+    added_rows: np.ndarray
+    removed_rows: np.ndarray
+    changed_old_rows: np.ndarray
+    changed_new_rows: np.ndarray
+    unchanged_rows: int
+    duplicate_keys: int
+    column_changes: Dict[str, int] = field(default_factory=dict)
+
+    def changed_values(self, old: pd.DataFrame, new: pd.DataFrame, limit: int = 1000) -> pd.DataFrame:
+        """Return one row per changed value in the first ``limit`` changed rows, with the old and new values."""
+        old_rows, new_rows = self.changed_old_rows[:limit], self.changed_new_rows[:limit]
+        keys = new.iloc[new_rows][self.key_columns].reset_index(drop=True)
+        parts = []
+        for column, count in self.column_changes.items():
+            if not count:
+                continue
+            old_values = old[column].iloc[old_rows].reset_index(drop=True)
+            new_values = new[column].iloc[new_rows].reset_index(drop=True)
+            old_codes, new_codes = _column_codes(old_values, new_values)
+            changed = old_codes != new_codes
+            part = keys[changed].assign(Column=column, Old=old_values[changed], New=new_values[changed])
+            parts.append(part.astype({"Old": object, "New": object}))
+        if not parts:
+            return pd.DataFrame(columns=[*self.key_columns, "Column", "Old", "New"])
+        # list the changes row by row, in the order of the new version
+        return pd.concat(parts).sort_index(kind="stable").reset_index(drop=True)
+
+
+def diff_datasets(old: pd.DataFrame, new: pd.DataFrame, key_columns: Sequence[str] = ()) -> DatasetDiff:
+    """Compare two versions of a dataset by hashing every column of each once.
+
+    The values of each column in both versions are numbered together in one vectorized pass, so comparing a value
+    is comparing two integers. Rows are matched on a 64-bit hash of their key (or whole row) codes, through a sort
+    of the old version's hashes; there's no Python loop over rows. Two different keys hashing alike could pair the
+    wrong rows, but with 64-bit hashes the chance is negligible.
+
+    Args:
+        old (pd.DataFrame): The earlier version.
+        new (pd.DataFrame): The later version.
+        key_columns (Sequence[str], optional): Columns identifying a row in both versions. If a key appears more
+            than once, its rows are matched in order. Defaults to matching whole rows.
+
+    Returns:
+        DatasetDiff: The added, removed and changed rows, and how many values changed in each column.
+    """
+    key_columns = list(key_columns)
+    compared_columns = [column for column in new.columns if column in old.columns and column not in key_columns]
+    codes = {column: _column_codes(old[column], new[column]) for column in [*key_columns, *compared_columns]}
+
+    if key_columns:
+        old_keys = _row_keys([codes[column][0] for column in key_columns], len(old))
+        new_keys = _row_keys([codes[column][1] for column in key_columns], len(new))
+        duplicate_keys = int(pd.Series(new_keys).duplicated().sum())
+    else:
+        old_keys = _row_keys([old_codes for old_codes, _ in codes.values()], len(old))
+        new_keys = _row_keys([new_codes for _, new_codes in codes.values()], len(new))
+        duplicate_keys = 0
+    old_keys, new_keys = _with_occurrence(old_keys), _with_occurrence(new_keys)
+
+    # match each new row to the old row with the same key, through the sorted old keys
+    old_order = np.argsort(old_keys, kind="stable")
+    sorted_old_keys = old_keys[old_order]
+    found = np.minimum(np.searchsorted(sorted_old_keys, new_keys), max(len(old_keys) - 1, 0))
+    matched = (sorted_old_keys[found] == new_keys) if len(old_keys) else np.zeros(len(new_keys), dtype=bool)
+    matched_new_rows = np.flatnonzero(matched)
+    matched_old_rows = old_order[found[matched]]
+    old_matched = np.zeros(len(old_keys), dtype=bool)
+    old_matched[matched_old_rows] = True
+
+    row_changed = np.zeros(len(matched_new_rows), dtype=bool)
+    column_changes = {}
+    if key_columns:
+        for column in compared_columns:
+            old_codes, new_codes = codes[column]
+            column_changed = old_codes[matched_old_rows] != new_codes[matched_new_rows]
+            column_changes[column] = int(column_changed.sum())
+            row_changed |= column_changed
+
+    return DatasetDiff(
+        key_columns=key_columns,
+        compared_columns=compared_columns,
+        added_columns=[column for column in new.columns if column not in old.columns],
+        removed_columns=[column for column in old.columns if column not in new.columns],
+        added_rows=np.flatnonzero(~matched),
+        removed_rows=np.flatnonzero(~old_matched),
+        changed_old_rows=matched_old_rows[row_changed],
+        changed_new_rows=matched_new_rows[row_changed],
+        unchanged_rows=int((~row_changed).sum()),
+        duplicate_keys=duplicate_keys,
+        column_changes=column_changes,
+    )
@@ -0,0 +1,57 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, num_points: int) -> np.ndarray:
+    """Pick ``num_points`` points of a series that keep its visual shape, by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points between are split into ``num_points - 2`` buckets, and
+    from each bucket the point forming the largest triangle with the point picked from the previous bucket and the
+    mean of the next bucket is picked, so peaks and troughs survive where averaging or striding would lose them.
+    The buckets' means are computed in one vectorized pass; only the choice within each bucket loops.
+
+    Args:
+        x (np.ndarray): The x values, in ascending order.
+        y (np.ndarray): The y values.
+        num_points (int): How many points to keep.
+
+    Returns:
+        np.ndarray: The positions of the points kept, in ascending order. Every position if the series already
+            has at most ``num_points`` points.
+    """
+    num_rows = len(x)
+    if num_points >= num_rows or num_points < 3:
+        return np.arange(num_rows)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, num_rows - 1, num_points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[: edges[-1]], edges[:-1]) / sizes
+    mean_y = np.nan_to_num(np.add.reduceat(y[: edges[-1]], edges[:-1]) / sizes)
+    # the last bucket looks ahead to the last point, as there's no bucket after it
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    picked = np.empty(num_points, dtype=np.int64)
+    picked[0], picked[-1] = 0, num_rows - 1
+    for bucket in range(num_points - 2):
+        a = picked[bucket]
+        lo, hi = edges[bucket], edges[bucket + 1]
+        # twice the triangle's area; the constant factor doesn't change which point is largest
+        area = np.abs((x[a] - mean_x[bucket]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[bucket] - y[a]))
+        picked[bucket + 1] = lo + np.argmax(np.nan_to_num(area, nan=-1.0))
+    return picked
+
+
+def downsample_series(x: np.ndarray, y: np.ndarray, num_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Downsample a series for plotting with `lttb_indices`, returning the kept x values and float32 y values.
+
+    Datetime x values are compared as nanosecond timestamps. The y values are narrowed to float32, which a chart
+    can't tell apart but which serializes to shorter numbers.
+    """
+    x = np.asarray(x)
+    x_values = x.view(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+    picked = lttb_indices(x_values, y, num_points)
+    return x[picked], np.asarray(y, dtype=np.float32)[picked]
@@ -0,0 +1,320 @@
+import warnings
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+
+from columnar_files import ColumnFilter, columnar_format, scan_columnar_upload
+from page_helpers import infer_column_dtype, load_data_from_file
+from sketches import DatasetSketch
+
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def _write_batches(path: Path, schema: pa.Schema, batches, sketch: Optional[DatasetSketch] = None):
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                if sketch is not None:
+                    sketch.update(batch)
+
+
+def _text_type(values: pa.Array) -> Optional[pa.DataType]:
+    """Return the type `infer_column_dtype` gives a batch of a text column, or None if every value is missing."""
+    if values.null_count == len(values):
+        return None
+    typed = infer_column_dtype(values.to_pandas(), categorical_threshold=0)
+    return pa.string() if typed.dtype == "string[pyarrow]" else pa.Array.from_pandas(typed).type
+
+
+def _common_type(a: Optional[pa.DataType], b: Optional[pa.DataType]) -> Optional[pa.DataType]:
+    """Return the type `infer_column_dtype` gives text it types as ``a`` in one batch and ``b`` in another.
+
+    None stands for a batch with no values, which fits any type.
+    """
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if pa.types.is_integer(a) and pa.types.is_integer(b):
+        return a if a.bit_width >= b.bit_width else b
+    if (pa.types.is_integer(a) or pa.types.is_floating(a)) and (pa.types.is_integer(b) or pa.types.is_floating(b)):
+        return pa.float64()
+    return pa.string()
+
+
+def _widened_type(column_type: Optional[pa.DataType], values: pa.Array) -> pa.DataType:
+    """Return a type for text that didn't fit ``column_type``, which also holds the batches written before it."""
+    widened = _common_type(column_type, _text_type(values))
+    # pandas may parse text Arrow can't, in which case the column stays text
+    return pa.string() if widened == column_type else widened
+
+
+def _cast_text(values: pa.Array, column_type: Optional[pa.DataType]) -> Optional[pa.Array]:
+    """Cast a batch of a text column to ``column_type`` as `infer_column_dtype` would type it.
+
+    Returns None if some value wouldn't keep its type in memory, e.g. a number too big for ``column_type``, a
+    leading zero, or text in a column of numbers.
+    """
+    if values.null_count == len(values):
+        return values if column_type is None else pc.cast(values, column_type)
+    if column_type is None:
+        return None
+    if pa.types.is_string(column_type):
+        return values
+    if pa.types.is_timestamp(column_type):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed = pa.Array.from_pandas(pd.to_datetime(values.to_pandas(), errors="coerce"))
+        return parsed if parsed.null_count == values.null_count and parsed.type == column_type else None
+
+    stripped = pc.utf8_trim_whitespace(values)
+    if pc.any(pc.match_substring_regex(stripped, r"^[+-]?0\d")).as_py():
+        return None
+    try:
+        numbers = pc.cast(stripped, column_type)
+    except pa.ArrowInvalid:
+        return None
+    if pa.types.is_integer(column_type):
+        # integers with missing values are held as Int64 in memory, and must read back as the text they came from
+        if values.null_count and column_type != pa.int64():
+            return None
+        if not pc.all(pc.equal(pc.cast(numbers, pa.string()), stripped)).as_py():
+            return None
+    return numbers
+
+
+def _write_typed_csv(reader, path: Path, types: Optional[List[Optional[pa.DataType]]]):
+    """Write the text batches from ``reader`` with their columns cast to ``types``, one batch at a time.
+
+    Without ``types``, each column takes the type `infer_column_dtype` gives its first batch.
+
+    Returns:
+        Optional[List[Optional[pa.DataType]]]: None once every batch is written, or the widened types if a batch
+        didn't fit them, in which case ``path`` is incomplete.
+    """
+    names = reader.schema.names
+    with pa.OSFile(str(path), "wb") as sink:
+        writer = None
+        for batch in reader:
+            if types is None:
+                types = [_text_type(column) for column in batch.columns]
+            arrays = [_cast_text(column, column_type) for column, column_type in zip(batch.columns, types)]
+            if any(array is None for array in arrays):
+                return [
+                    column_type if array is not None else _widened_type(column_type, column)
+                    for column, column_type, array in zip(batch.columns, types, arrays)
+                ]
+            if writer is None:
+                writer = pa.ipc.new_file(sink, pa.schema([(name, array.type) for name, array in zip(names, arrays)]))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, names=names))
+
+        if writer is None:
+            writer = pa.ipc.new_file(sink, reader.schema)
+        writer.close()
+    return None
+
+
+def _write_csv(file, path: Path, delimiter: str, all_strings: bool, sketch: Optional[DatasetSketch]):
+    # each reader gets its own view of the upload's bytes, as readers read ahead on other threads
+    content = pa.py_buffer(file.getbuffer())
+    read_options = pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+    parse_options = pa_csv.ParseOptions(delimiter=delimiter)
+    column_names = pa_csv.open_csv(
+        pa.BufferReader(content), read_options=read_options, parse_options=parse_options
+    ).schema.names
+    convert_options = pa_csv.ConvertOptions(
+        column_types={name: pa.string() for name in column_names}, strings_can_be_null=True
+    )
+
+    def open_text():
+        return pa_csv.open_csv(
+            pa.BufferReader(content),
+            read_options=read_options,
+            parse_options=parse_options,
+            convert_options=convert_options,
+        )
+
+    if all_strings:
+        reader = open_text()
+        _write_batches(path, reader.schema, reader, sketch)
+        return
+
+    # columns are typed by the rules uploads loaded into memory follow, rather than pyarrow's, which would e.g. turn
+    # zip codes into numbers and drop their leading zeros. A batch that doesn't fit the types chosen so far (say, a
+    # number too big for them, or text in a column of numbers) widens them, and the upload is written again
+    types = _write_typed_csv(open_text(), path, None)
+    while types is not None:
+        types = _write_typed_csv(open_text(), path, types)
+    if sketch is not None:
+        with pa.memory_map(str(path)) as source:
+            typed = pa.ipc.open_file(source)
+            for i in range(typed.num_record_batches):
+                sketch.update(typed.get_batch(i))
+
+
+def write_upload_as_arrow(
+    file,
+    path: Path,
+    all_strings: bool = False,
+    sketch: Optional[DatasetSketch] = None,
+    columns: Optional[Sequence[str]] = None,
+    filters: Sequence[ColumnFilter] = (),
+):
+    """Stream an upload into an Arrow IPC file at ``path``.
+
+    CSV, TSV, Parquet and Arrow/Feather uploads are converted a block at a time, so they never exist in memory as
+    a whole DataFrame. CSV/TSV columns are read as text, get the types `infer_column_dtype` gives their first batch,
+    and later batches are cast to them, so they get the same types as when loaded into memory. Other formats go
+    through `load_data_from_file`.
+
+    For Parquet and Arrow/Feather uploads only ``columns`` are read, and only rows matching all ``filters``; other
+    formats are always written whole.
+
+    If a ``sketch`` is passed, it is updated with each batch as it is written.
+    """
+    if file.type in ("text/csv", "text/tab-separated-values"):
+        delimiter = "\t" if file.type == "text/tab-separated-values" else ","
+        _write_csv(file, path, delimiter, all_strings, sketch)
+    elif columnar_format(file) is not None:
+        schema, batches = scan_columnar_upload(file, columns, filters)
+        _write_batches(path, schema, batches, sketch)
+    else:
+        table = pa.Table.from_pandas(load_data_from_file(file, all_strings=all_strings), preserve_index=False)
+        _write_batches(path, table.schema, table.to_batches(), sketch)
+
+
+class LazyDataset:
+    """Answers Data Explorer queries from an Arrow IPC file on disk instead of an in-memory DataFrame.
+
+    Filters are pushed down to the scanner, sorts and group-bys only read the columns they need, and rows are
+    only materialized for the page being viewed. Rows are addressed by their position in the file: the file is
+    uncompressed, so memory-mapping it gives random access to any row without reading the rows before it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.dataset = ds.dataset(str(path), format="arrow")
+        with pa.memory_map(str(path)) as source:
+            self.table = pa.ipc.open_file(source).read_all()
+
+    @property
+    def columns(self) -> List[str]:
+        return self.dataset.schema.names
+
+    @property
+    def schema(self) -> pa.Schema:
+        return self.dataset.schema
+
+    def count(self, filter: Optional[ds.Expression] = None) -> int:
+        return self.dataset.count_rows(filter=filter)
+
+    def filter_expression(self, filter_text: str, regex: bool = False) -> Optional[ds.Expression]:
+        """Build a case-insensitive expression matching rows where any cell contains ``filter_text``.
+
+        Raises:
+            pa.ArrowInvalid: If ``regex`` is set and ``filter_text`` isn't a valid regular expression. This is raised
+                here rather than when the expression is first evaluated.
+        """
+        if not filter_text:
+            return None
+        if regex:
+            pc.match_substring_regex(pa.array([""]), filter_text, ignore_case=True)
+        match = pc.match_substring_regex if regex else pc.match_substring
+        expression = None
+        for field in self.schema:
+            column = pc.field(field.name)
+            if not pa.types.is_string(field.type) and not pa.types.is_large_string(field.type):
+                column = column.cast(pa.string())
+            term = match(column, filter_text, ignore_case=True)
+            expression = term if expression is None else expression | term
+        return expression
+
+    def filtered_positions(self, filter: ds.Expression) -> np.ndarray:
+        """Return the positions of the rows matching ``filter``, reading only the columns it refers to."""
+        matches = self.dataset.to_table(columns={"match": filter})["match"]
+        return np.flatnonzero(matches.fill_null(False).to_numpy())
+
+    def sorted_positions(self, sort_by: Sequence[str], positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return the positions of every row, or of the rows at ``positions``, in ``sort_by`` order.
+
+        Only the sort columns are read.
+        """
+        table = self.table.select(list(sort_by))
+        if positions is not None:
+            table = table.take(pa.array(positions, type=pa.int64()))
+        order = pc.sort_indices(table, sort_keys=[(column, "ascending") for column in sort_by]).to_numpy()
+        return order if positions is None else positions[order]
+
+    def rows(self, positions: Sequence[int]) -> pd.DataFrame:
+        """Materialize the rows at ``positions``, such as those from `filtered_positions` or `sorted_positions`."""
+        return self.table.take(pa.array(positions, type=pa.int64())).to_pandas()
+
+    def sketch(self) -> DatasetSketch:
+        """Build approximate column statistics in one streaming pass over the file."""
+        return DatasetSketch.from_batches(self.dataset.to_batches())
+
+    def head(self, num_rows: int, filter: Optional[ds.Expression] = None) -> pd.DataFrame:
+        return self.dataset.scanner(filter=filter).head(num_rows).to_pandas()
+
+    def group_counts(
+        self, group_by: Sequence[str], filter: Optional[ds.Expression] = None, sort_by: Sequence[str] = ()
+    ) -> pd.DataFrame:
+        """Return one row per distinct combination of ``group_by`` values, with the number of rows in each."""
+        table = self.dataset.to_table(columns=list(group_by), filter=filter)
+        counts = table.group_by(list(group_by)).aggregate([(group_by[0], "count", pc.CountOptions(mode="all"))])
+        counts = counts.select([*group_by, f"{group_by[0]}_count"]).rename_columns([*group_by, "Rows"])
+        sort_keys = [(column, "ascending") for column in sort_by if column in group_by]
+        if sort_keys:
+            counts = counts.sort_by(sort_keys)
+        return counts.to_pandas()
+
+    def group_rows(
+        self, group_key: Dict[str, object], limit: int, filter: Optional[ds.Expression] = None
+    ) -> pd.DataFrame:
+        """Materialize up to ``limit`` rows of the group identified by ``group_key``."""
+        expression = filter
+        for column, value in group_key.items():
+            term = pc.field(column).is_null() if pd.isna(value) else pc.field(column) == value
+            expression = term if expression is None else expression & term
+        return self.head(limit, filter=expression)
+
+    def column_summary(self, column: str) -> Dict[str, int]:
+        values = self.dataset.to_table(columns=[column])[column]
+        return {
+            "Count": len(values),
+            "Missing Values": values.null_count,
+            "Unique Items": pc.count_distinct(values, mode="only_valid").as_py(),
+        }
+
+    def value_counts(self, column: str) -> pd.DataFrame:
+        values = self.dataset.to_table(columns=[column])[column]
+        counts = pc.value_counts(values).flatten()
+        unique_items_df = pd.DataFrame({"Unique Items": counts[0].to_pandas(), "Count": counts[1].to_pandas()})
+        return unique_items_df.sort_values("Count", ascending=False, ignore_index=True)
+
+    def describe(self) -> pd.DataFrame:
+        """Compute the pandas ``describe()`` statistics for numeric columns, reading one column at a time."""
+        stats = {}
+        for field in self.schema:
+            if not (pa.types.is_integer(field.type) or pa.types.is_floating(field.type)):
+                continue
+            values = self.dataset.to_table(columns=[field.name])[field.name]
+            min_max = pc.min_max(values)
+            stats[field.name] = {
+                "count": len(values) - values.null_count,
+                "mean": pc.mean(values).as_py(),
+                "std": pc.stddev(values, ddof=1).as_py(),
+                "min": min_max["min"].as_py(),
+                "25%": pc.quantile(values, q=0.25)[0].as_py(),
+                "50%": pc.quantile(values, q=0.5)[0].as_py(),
+                "75%": pc.quantile(values, q=0.75)[0].as_py(),
+                "max": min_max["max"].as_py(),
+            }
+        return pd.DataFrame(stats)
@@ -1,14 +1,39 @@
+import hashlib
+import io
 import json
+import multiprocessing
+import os
 import random
+import re
+import sys
+import threading
+import time
+import types
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 from string import ascii_lowercase
-from typing import Callable, List, Optional, Union
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 
+from columnar_files import (
+    ColumnFilter,
+    columnar_format,
+    read_columnar_info,
+    read_columnar_upload,
+    scan_columnar_upload,
+    table_to_pandas,
+)
+
 
 def item_paginator(
     title: str,
@@ -181,29 +206,470 @@ def check_or_x(value: bool) -> str:
     return "✅" if value else "❌"
 
 
-def load_data_from_file(file, replace_nan=True):
+@dataclass
+class DtypeReport:
+    """Summary of the dtype compaction applied to a loaded DataFrame."""
+
+    bytes_before: int
+    bytes_after: int
+    column_dtypes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+@dataclass
+class SampleReport:
+    """Exact counts over a whole upload that was loaded as a random sample of its rows."""
+
+    num_rows: int
+    sample_rows: int
+    null_counts: Dict[str, int] = field(default_factory=dict)
+
+
+EXCEL_TYPES = ("application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+
+def _read_file_as_strings(file) -> pd.DataFrame:
+    """Read an upload with every column as text, except Parquet and Arrow/Feather uploads, which keep their stored
+    types."""
     if file.type == "text/csv":
         data = pd.read_csv(file, dtype=str, low_memory=False)
     elif file.type == "text/tab-separated-values":
         data = pd.read_csv(file, dtype=str, low_memory=False, sep="\t")
-    elif (
-        file.type == "application/vnd.ms-excel"
-        or file.type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    ):
+    elif file.type in EXCEL_TYPES:
         data = pd.read_excel(file, dtype=str)
     elif file.type == "application/json":
         data = pd.read_json(file, dtype=str)
-    elif file.type == "application/octet-stream":  # Assuming this is a Parquet file
-        data = pd.read_parquet(file, dtype=str)
+    elif file.type == "application/octet-stream":  # Parquet or Arrow IPC/Feather
+        data = read_columnar_upload(file)
     else:
         raise RuntimeError(f"Unknown / unsupported file type {file.type}")
+    return data
+
+
+# integers past this can't all be told apart as float64, which columns with missing values are parsed through
+_MAX_EXACT_FLOAT_INTEGER = 2**53
+
+# a day and month, written with numbers ("2020-01-31", "1/31/20") or a month name; text without one, such as a time
+# of day, would be parsed as a time on today's date
+_DATE_PART = re.compile(r"(?<![:\d])\d{1,4}[-/.]\d{1,2}|(?i:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)")
+_INT64_RANGE = (np.iinfo(np.int64).min, np.iinfo(np.int64).max)
+
+
+def _exact_integers(numeric: pd.Series, non_null: pd.Series) -> Optional[pd.Series]:
+    """Convert integral parsed values to an integer dtype, or return None if that would change any value.
+
+    Values must be exactly representable (within +/-2**53 if some are missing, as they went through float64, and
+    within int64 otherwise), and must convert back to the text they were parsed from.
+    """
+    values = numeric.dropna()
+    has_missing = len(values) < len(numeric)
+    low, high = (-_MAX_EXACT_FLOAT_INTEGER, _MAX_EXACT_FLOAT_INTEGER) if has_missing else _INT64_RANGE
+    if ((values < low) | (values > high)).any():
+        return None
+    integers = numeric.astype("Int64") if has_missing else numeric.astype("int64")
+    if not (integers.dropna().astype(str).to_numpy() == non_null.str.strip().to_numpy()).all():
+        return None
+    return integers if has_missing else pd.to_numeric(integers, downcast="integer")
+
+
+def infer_column_dtype(column: pd.Series, categorical_threshold: float) -> pd.Series:
+    """Convert a column of text to the narrowest dtype that keeps every value as written, as `compact_dtypes` does."""
+    non_null = column.dropna().astype(str)
+    if non_null.empty:
+        return column.astype("string[pyarrow]")
+
+    # values such as zip codes or IDs with leading zeros must stay strings
+    if not non_null.str.match(r"^[+-]?0\d").any():
+        numeric = pd.to_numeric(non_null, errors="coerce")
+        if numeric.notna().all():
+            numeric = pd.to_numeric(column, errors="coerce")
+            values = numeric.dropna()
+            if not (values % 1 == 0).all():
+                return numeric
+            integers = _exact_integers(numeric, non_null)
+            if integers is not None:
+                return integers
+            if (values.abs() < _MAX_EXACT_FLOAT_INTEGER).all():
+                # integral values written as decimals, e.g. "2.0", which float64 holds exactly
+                return numeric.astype("float64")
+            # integers too large for any numeric dtype to hold exactly, such as long IDs, stay strings
+
+    sample = non_null.sample(min(len(non_null), 1000), random_state=0)
+    if sample.str.contains(r"\d", regex=True).all() and sample.str.contains(_DATE_PART).all():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if pd.to_datetime(sample, errors="coerce").notna().all():
+                parsed = pd.to_datetime(column, errors="coerce")
+                if parsed.notna().sum() == len(non_null):
+                    return parsed
+
+    if non_null.nunique() <= len(non_null) * categorical_threshold:
+        return column.astype("category")
+    return column.astype("string[pyarrow]")
+
+
+def compact_dtypes(data: pd.DataFrame, categorical_threshold: float = 0.5) -> Tuple[pd.DataFrame, DtypeReport]:
+    """Convert all-string columns to numeric, datetime, categorical or Arrow-backed string dtypes.
+
+    Columns are converted one at a time so each object column can be released as soon as its replacement exists.
+
+    Args:
+        data (pd.DataFrame): A DataFrame as read with ``dtype=str``.
+        categorical_threshold (float, optional): Columns whose distinct count is at most this fraction of their
+            non-null values are stored as categoricals. Defaults to 0.5.
+
+    Returns:
+        Tuple[pd.DataFrame, DtypeReport]: The converted DataFrame and a report of the memory used before and after.
+    """
+    bytes_before = int(data.memory_usage(deep=True).sum())
+    data = data.copy(deep=False)
+    for column in data.columns:
+        if data[column].dtype == object:
+            data[column] = infer_column_dtype(data[column], categorical_threshold)
+    report = DtypeReport(
+        bytes_before=bytes_before,
+        bytes_after=int(data.memory_usage(deep=True).sum()),
+        column_dtypes={str(column): str(dtype) for column, dtype in data.dtypes.items()},
+    )
+    return data, report
+
+
+CSV_DELIMITERS = {"text/csv": ",", "text/tab-separated-values": "\t"}
+
+
+def iter_csv_chunks(
+    file, chunk_rows: int = 200_000, first_chunk_rows: int = 10_000
+) -> Iterator[Tuple[pd.DataFrame, float]]:
+    """Read a CSV or TSV upload as text a chunk at a time.
+
+    The first chunk is kept small so something can be shown as soon as possible.
+
+    Args:
+        file: The uploaded file.
+        chunk_rows (int, optional): Rows per chunk after the first. Defaults to 200_000.
+        first_chunk_rows (int, optional): Rows in the first chunk. Defaults to 10_000.
+
+    Yields:
+        Tuple[pd.DataFrame, float]: Each chunk, with every column as text, and the fraction of the file read so far.
+    """
+    total_bytes = max(file.getbuffer().nbytes, 1)
+    with pd.read_csv(file, dtype=str, low_memory=False, sep=CSV_DELIMITERS[file.type], chunksize=chunk_rows) as reader:
+        num_rows = first_chunk_rows
+        while True:
+            try:
+                chunk = reader.get_chunk(num_rows)
+            except StopIteration:
+                return
+            yield chunk, min(file.tell() / total_bytes, 1.0)
+            num_rows = chunk_rows
+
+
+def iter_upload_chunks(
+    file, columns: Optional[List[str]] = None, filters: Sequence[ColumnFilter] = ()
+) -> Iterator[Tuple[pd.DataFrame, float]]:
+    """Read an upload a chunk at a time, yielding each chunk with the fraction of the upload read so far.
+
+    CSV and TSV uploads are read as text with `iter_csv_chunks`. Parquet and Arrow/Feather uploads are read a record
+    batch at a time with their stored types, restricted to ``columns`` and ``filters``. Other formats can't be read
+    incrementally, so they come back as a single chunk of text.
+    """
+    if file.type in CSV_DELIMITERS:
+        yield from iter_csv_chunks(file)
+    elif columnar_format(file) is not None:
+        total_rows = max(read_columnar_info(file).num_rows, 1)
+        num_rows = 0
+        _, batches = scan_columnar_upload(file, columns, filters)
+        for batch in batches:
+            num_rows += batch.num_rows
+            yield table_to_pandas(pa.Table.from_batches([batch])), min(num_rows / total_rows, 1.0)
+    else:
+        yield _read_file_as_strings(file), 1.0
+
+
+def convert_string_data(data: pd.DataFrame, replace_nan=True, all_strings=False) -> pd.DataFrame:
+    """Finish loading a DataFrame read with ``dtype=str``, as described in `load_data_from_file`.
+
+    Columns that already have a type, as read from Parquet or Arrow/Feather, keep it unless ``all_strings`` is set.
+    """
+    if not all_strings:
+        data, report = compact_dtypes(data)
+        data.attrs["dtype_report"] = report
+        return data
 
+    typed = [column for column, dtype in data.dtypes.items() if dtype != object]
+    if typed:
+        data = data.copy(deep=False)
+        data[typed] = data[typed].astype(str).where(data[typed].notna())
     if replace_nan:
         return data.replace({np.NAN: None})
     else:
         return data
 
 
+def load_data_from_file(file, replace_nan=True, all_strings=False):
+    """Load an uploaded file into a DataFrame.
+
+    By default column types are inferred with `compact_dtypes` and the resulting `DtypeReport` is stored in
+    ``data.attrs["dtype_report"]``. Pass ``all_strings=True`` to keep every column as Python strings, with
+    missing values replaced by None when ``replace_nan`` is set.
+    """
+    return convert_string_data(_read_file_as_strings(file), replace_nan, all_strings)
+
+
+class _UploadBytes(io.BytesIO):
+    """An upload's bytes with the ``name`` and ``type`` of the original, as sent to an ingestion worker process."""
+
+    def __init__(self, content: bytes, name: str, type: str):
+        super().__init__(content)
+        self.name = name
+        self.type = type
+
+
+@dataclass
+class IngestionTiming:
+    """How long one file, or one sheet of a workbook, took to parse."""
+
+    source: str
+    rows: int
+    seconds: float
+
+
+def _parse_upload_part(content: bytes, name: str, type: str, sheet_name: Optional[str] = None):
+    """Parse one file, or one sheet of a workbook, as `_read_file_as_strings` does; runs in a worker process."""
+    started = time.perf_counter()
+    file = _UploadBytes(content, name, type)
+    if sheet_name is None:
+        data = _read_file_as_strings(file)
+    else:
+        data = pd.read_excel(file, sheet_name=sheet_name, dtype=str)
+    return data, time.perf_counter() - started
+
+
+_worker_pool: Optional[ProcessPoolExecutor] = None
+_worker_pool_lock = threading.Lock()
+
+
+@contextmanager
+def _page_hidden_from_workers():
+    """Streamlit installs the running page as ``__main__``, which multiprocessing re-runs in each new worker;
+    swap in an empty module while workers start so they import only the module of the function they run."""
+    page = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = page
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    """Return the process pool shared by every page for CPU-bound work, starting it on first use.
+
+    The pool is kept for the life of the server, since starting worker processes costs more than most of the jobs
+    given to it. Workers are started by a "forkserver" ("spawn" where that's unavailable) rather than forked from
+    the server, which would copy its threads and locks. They import the function they run by name, so it must be
+    defined at the top level of a module in ``shared-src``, not in a page; submit work with `map_in_worker_pool`.
+    """
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            # load the heavy imports once in the fork server rather than in every worker
+            context.set_forkserver_preload([__name__])
+            num_workers = os.cpu_count() or 1
+            pool = ProcessPoolExecutor(num_workers, mp_context=context)
+            # the pool starts a worker for each job submitted while none is idle, so starting them all here, with
+            # the page hidden once, means session threads never start one, or swap ``__main__``, while submitting
+            with _page_hidden_from_workers():
+                wait([pool.submit(os.getpid) for _ in range(num_workers)])
+            _worker_pool = pool
+    return _worker_pool
+
+
+def map_in_worker_pool(function: Callable, argument_lists: Sequence[tuple]) -> list:
+    """Call ``function`` with each tuple of arguments in the shared `get_worker_pool`, returning results in order.
+
+    If a worker dies (e.g. out of memory) the pool is dropped, so the next call starts a fresh one, and
+    ``BrokenProcessPool`` is raised.
+    """
+    global _worker_pool
+    pool = get_worker_pool()
+    try:
+        futures = [pool.submit(function, *args) for args in argument_lists]
+        return [future.result() for future in futures]
+    except BrokenProcessPool:
+        with _worker_pool_lock:
+            if _worker_pool is pool:
+                _worker_pool = None
+        raise
+
+
+def unique_column_name(name: str, columns) -> str:
+    """Return ``name``, or ``name`` with the lowest numbered suffix that isn't already one of ``columns``."""
+    columns = set(columns)
+    candidate, number = name, 1
+    while candidate in columns:
+        number += 1
+        candidate = f"{name} {number}"
+    return candidate
+
+
+def load_data_from_files(files, replace_nan=True, all_strings=False, source_column="Source"):
+    """Load several uploads, and every sheet of any Excel workbooks among them, into one DataFrame.
+
+    Files and sheets are parsed in parallel in a process pool, so the load takes about as long as the slowest
+    file rather than the sum of all of them. The parts are concatenated with ``source_column`` naming the file
+    (and sheet) each row came from, then typed together as in `load_data_from_file`.
+
+    Args:
+        files (list): The uploaded files.
+        replace_nan (bool, optional): As for `load_data_from_file`. Defaults to True.
+        all_strings (bool, optional): As for `load_data_from_file`. Defaults to False.
+        source_column (str, optional): The name of the first column, recording where each row came from; given a
+            numbered suffix if an upload already has a column by that name. Defaults to "Source".
+
+    Returns:
+        pd.DataFrame: The combined data, with a list of `IngestionTiming` in ``data.attrs["ingestion_timings"]``,
+            the total parse time in ``data.attrs["ingestion_seconds"]`` and the source column's name in
+            ``data.attrs["source_column"]``.
+    """
+    started = time.perf_counter()
+    parts = []
+    for file in files:
+        content = file.getvalue()
+        if file.type in EXCEL_TYPES:
+            sheet_names = pd.ExcelFile(io.BytesIO(content)).sheet_names
+            for sheet_name in sheet_names:
+                source = f"{file.name}: {sheet_name}" if len(sheet_names) > 1 else file.name
+                parts.append((source, (content, file.name, file.type, sheet_name)))
+        else:
+            parts.append((file.name, (content, file.name, file.type)))
+
+    if len(parts) == 1:
+        results = [_parse_upload_part(*parts[0][1])]
+    else:
+        results = map_in_worker_pool(_parse_upload_part, [args for _, args in parts])
+
+    timings = [
+        IngestionTiming(source=source, rows=len(part), seconds=seconds)
+        for (source, _), (part, seconds) in zip(parts, results)
+    ]
+    # never overwrite a column of the uploads themselves
+    source_column = unique_column_name(source_column, {column for part, _ in results for column in part.columns})
+    for (source, _), (part, _) in zip(parts, results):
+        part.insert(0, source_column, source)
+    data = pd.concat([part for part, _ in results], ignore_index=True)
+
+    data = convert_string_data(data, replace_nan, all_strings)
+    data.attrs["source_column"] = source_column
+    data.attrs["ingestion_timings"] = timings
+    data.attrs["ingestion_seconds"] = time.perf_counter() - started
+    return data
+
+
+def fingerprint_dataframe(data: pd.DataFrame) -> str:
+    """Return a hex digest of a DataFrame's column names, dtypes, index and values."""
+    digest = hashlib.sha256(repr([(str(column), str(dtype)) for column, dtype in data.dtypes.items()]).encode())
+    try:
+        row_hashes = pd.util.hash_pandas_object(data, index=True)
+    except TypeError:
+        # unhashable cells such as lists
+        row_hashes = pd.util.hash_pandas_object(data.astype(str), index=True)
+    digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# content hashes of recent uploads, by the id Streamlit gives each file uploaded
+_upload_hashes: "OrderedDict[object, str]" = OrderedDict()
+_upload_hashes_lock = threading.Lock()
+MAX_UPLOAD_HASHES = 256
+
+
+def upload_content_hash(file) -> str:
+    """Return a hex digest of an uploaded file's bytes, without copying the upload buffer.
+
+    Streamlit uploads are only hashed the first time they're seen, as each file uploaded gets a new id (its
+    ``file_id``, or ``id`` in older versions) and rerunning a page hands back the same upload.
+    """
+    upload_id = getattr(file, "file_id", None) or getattr(file, "id", None)
+    if upload_id is not None:
+        with _upload_hashes_lock:
+            digest = _upload_hashes.get(upload_id)
+            if digest is not None:
+                _upload_hashes.move_to_end(upload_id)
+                return digest
+
+    with file.getbuffer() as buffer:
+        digest = hashlib.sha256(buffer).hexdigest()
+    if upload_id is not None:
+        with _upload_hashes_lock:
+            _upload_hashes[upload_id] = digest
+            while len(_upload_hashes) > MAX_UPLOAD_HASHES:
+                _upload_hashes.popitem(last=False)
+    return digest
+
+
+class DatasetHandle(str):
+    """A DataFrame paired with a precomputed fingerprint of its contents.
+
+    The handle is a ``str`` whose value is the fingerprint, so ``st.cache_data`` and ``st.cache_resource`` hash a
+    handle argument as a short string instead of hashing the whole DataFrame on every call. Cached functions take
+    the handle and read ``handle.data`` inside.
+    """
+
+    data: Optional[pd.DataFrame]
+
+    def __new__(cls, fingerprint: str, data: Optional[pd.DataFrame] = None):
+        handle = super().__new__(cls, fingerprint)
+        handle.data = data
+        return handle
+
+    @property
+    def fingerprint(self) -> str:
+        return str(self)
+
+    @classmethod
+    def from_dataframe(cls, data: pd.DataFrame) -> "DatasetHandle":
+        """Fingerprint ``data`` by hashing its contents once."""
+        return cls(fingerprint_dataframe(data), data)
+
+    @classmethod
+    def from_upload(cls, file, data: pd.DataFrame, **parse_options) -> "DatasetHandle":
+        """Fingerprint data parsed from an upload by the upload's bytes and the options used to parse it."""
+        return cls.from_uploads([file], data, **parse_options)
+
+    @classmethod
+    def from_uploads(cls, files, data: Optional[pd.DataFrame] = None, **parse_options) -> "DatasetHandle":
+        """Fingerprint data parsed from several uploads, by their bytes and names and the parse options."""
+        options = json.dumps(parse_options, sort_keys=True, default=str)
+        if len(files) == 1:
+            uploads = upload_content_hash(files[0])
+        else:
+            uploads = ",".join(f"{file.name}={upload_content_hash(file)}" for file in files)
+        return cls(hashlib.sha256(f"{uploads}:{options}".encode()).hexdigest(), data)
+
+    def derive(self, data: pd.DataFrame, *changes) -> "DatasetHandle":
+        """Return a handle for ``data``, computed from this dataset by ``changes`` (e.g. a filter's settings).
+
+        The new fingerprint is derived from this one and ``repr(changes)``, so ``data`` is never hashed.
+        """
+        return DatasetHandle(hashlib.sha256(f"{self}:{changes!r}".encode()).hexdigest(), data)
+
+
+def as_dataframe(data: Union[DatasetHandle, pd.DataFrame]) -> pd.DataFrame:
+    """Return the DataFrame behind a `DatasetHandle`, or ``data`` itself if it's already a DataFrame."""
+    return data.data if isinstance(data, DatasetHandle) else data
+
+
+def load_dataset(file, replace_nan=True, all_strings=False) -> DatasetHandle:
+    """Load an uploaded file with `load_data_from_file` and return it as a fingerprinted `DatasetHandle`."""
+    data = load_data_from_file(file, replace_nan=replace_nan, all_strings=all_strings)
+    return DatasetHandle.from_upload(file, data, replace_nan=replace_nan, all_strings=all_strings)
+
+
 def load_session(session_dir: Union[Path, str]):
     if isinstance(session_dir, str):
         session_dir = Path(session_dir)
@@ -0,0 +1,453 @@
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from diskcache import Cache
+from scipy.optimize import curve_fit
+from scipy.special import comb
+
+from page_helpers import map_in_worker_pool
+from water_data_helpers import WaterSeries
+
+# windows with fewer recorded days than this aren't fitted
+MIN_WINDOW_DAYS = 10
+# fewer power law windows than this to fit are fitted in-process, as starting the pool's workers costs more
+POOL_MIN_WINDOWS = 16
+
+
+def power_law(x, a, b):
+    """Power law function used in curve fitting."""
+    return a * np.power(x, b)
+
+
+def calculate_rmse(y_actual, y_pred):
+    """Calculate Root Mean Squared Error between actual and predicted values."""
+    return np.sqrt(np.mean((y_actual - y_pred) ** 2))
+
+
+class PowerLawModel:
+    def __init__(self, params):
+        self.params = params
+
+    def __call__(self, x):
+        return power_law(x, *self.params)
+
+
+@dataclass()
+class FitResult:
+    """A class used to represent the result of a model fitting."""
+
+    model: np.poly1d or callable
+    stage_fit: np.ndarray
+    discharge_fit: np.ndarray
+    label: str
+    rmse: float
+    min_discharge: float
+    max_discharge: float
+    training_start: datetime
+    training_end: datetime
+
+    def predict(self, stage, normalized=False):
+        """
+        Predict discharge based on the given stage.
+        If normalized is True, normalize the predicted discharge based on the min and max discharge of the fit.
+        """
+        discharge = self.model(stage)
+        if normalized:
+            discharge = (discharge - self.min_discharge) / (self.max_discharge - self.min_discharge)
+        return discharge
+
+    def __eq__(self, other):
+        if not other:
+            return False
+        return (
+            self.label == other.label
+            and self.training_start == other.training_start
+            and self.training_end == other.training_end
+        )
+
+
+def _fit_result(
+    model, label: str, stage: np.ndarray, discharge: np.ndarray, training_start, training_end, rmse=None
+) -> FitResult:
+    stage_fit = np.linspace(stage.min(), stage.max(), 100)
+    return FitResult(
+        model,
+        stage_fit,
+        model(stage_fit),
+        label,
+        calculate_rmse(discharge, model(stage)) if rmse is None else rmse,
+        discharge.min(),
+        discharge.max(),
+        training_start=training_start,
+        training_end=training_end,
+    )
+
+
+def power_law_result(
+    params: np.ndarray, stage: np.ndarray, discharge: np.ndarray, training_start, training_end
+) -> FitResult:
+    """Describe a power law fitted to ``stage`` and ``discharge`` as a `FitResult`."""
+    label = f"Fit: a={params[0]:.3f}, b={params[1]:.3f}"
+    return _fit_result(PowerLawModel(params), label, stage, discharge, training_start, training_end)
+
+
+def polynomial_result(
+    params: np.ndarray, stage: np.ndarray, discharge: np.ndarray, training_start, training_end, rmse=None
+) -> FitResult:
+    """Describe a polynomial, given by its coefficients from the highest power down, as a `FitResult`."""
+    model = np.poly1d(params)
+    return _fit_result(model, f"Fit: {model}", stage, discharge, training_start, training_end, rmse)
+
+
+def power_law_initial_guess(stage: np.ndarray, discharge: np.ndarray) -> np.ndarray:
+    """Estimate power law parameters by a linear regression of log discharge on log stage.
+
+    Returns:
+        np.ndarray: ``[a, b]``, or ``[1, 1]`` (`curve_fit`'s own default) without two positive pairs to regress.
+    """
+    positive = (stage > 0) & (discharge > 0)
+    if np.count_nonzero(positive) < 2:
+        return np.ones(2)
+    b, log_a = np.polyfit(np.log(stage[positive]), np.log(discharge[positive]), 1)
+    return np.array([np.exp(log_a), b])
+
+
+def fit_power_law_params(
+    stage: np.ndarray, discharge: np.ndarray, initial_guess: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Fit ``discharge = a * stage ** b`` by least squares, starting from ``initial_guess`` if one is given.
+
+    Without an initial guess, or if the search from it doesn't converge, the search starts from
+    `power_law_initial_guess`.
+    """
+    if initial_guess is not None:
+        try:
+            return curve_fit(power_law, stage, discharge, p0=initial_guess, maxfev=5000)[0]
+        except RuntimeError:
+            pass
+    return curve_fit(power_law, stage, discharge, p0=power_law_initial_guess(stage, discharge), maxfev=5000)[0]
+
+
+class FitCache:
+    """Rating curve fit parameters kept on disk, keyed by dataset, model and training range.
+
+    Fits survive server restarts, and a fit for a training range that hasn't been seen can start its search from
+    the parameters of the cached fit whose range is closest, which takes a fraction of the iterations of a cold
+    start when a training date is dragged a little.
+
+    Args:
+        cache (Cache): The disk cache to keep fits in.
+        max_neighbours (int, optional): How many recent training ranges per dataset and model to remember as
+            starting points. Defaults to 256.
+    """
+
+    def __init__(self, cache: Cache, max_neighbours: int = 256):
+        self.cache = cache
+        self.max_neighbours = max_neighbours
+
+    @staticmethod
+    def key(dataset: str, model: str, training_start: datetime, training_end: datetime) -> str:
+        start, end = pd.Timestamp(training_start).isoformat(), pd.Timestamp(training_end).isoformat()
+        return f"fit:{dataset}:{model}:{start}:{end}"
+
+    @staticmethod
+    def _neighbours_key(dataset: str, model: str) -> str:
+        return f"ranges:{dataset}:{model}"
+
+    def nearest(
+        self, dataset: str, model: str, training_start: datetime, training_end: datetime
+    ) -> Optional[np.ndarray]:
+        """Return the parameters of the cached fit whose training range is closest to the given one, if any."""
+        return self.nearest_many(dataset, model, [training_start], [training_end])[0]
+
+    def nearest_many(
+        self, dataset: str, model: str, training_starts: Sequence[datetime], training_ends: Sequence[datetime]
+    ) -> List[Optional[np.ndarray]]:
+        """As `nearest`, for each of several training ranges, reading the remembered ranges once."""
+        neighbours: Dict[Tuple[int, int], list] = self.cache.get(self._neighbours_key(dataset, model), {})
+        if not neighbours:
+            return [None] * len(training_starts)
+        bounds = np.array(list(neighbours), dtype=np.int64)
+        params = list(neighbours.values())
+        starts = pd.DatetimeIndex(training_starts).asi8[:, None]
+        ends = pd.DatetimeIndex(training_ends).asi8[:, None]
+        closest = (np.abs(bounds[:, 0] - starts) + np.abs(bounds[:, 1] - ends)).argmin(axis=1)
+        return [np.array(params[i]) for i in closest]
+
+    def get_many(
+        self, dataset: str, model: str, training_starts: Sequence[datetime], training_ends: Sequence[datetime]
+    ) -> List[Optional[np.ndarray]]:
+        """Return the cached parameters for each of several training ranges, or None where there are none."""
+        with self.cache.transact():
+            cached = [
+                self.cache.get(self.key(dataset, model, start, end))
+                for start, end in zip(training_starts, training_ends)
+            ]
+        return [None if params is None else np.array(params) for params in cached]
+
+    def put(self, dataset: str, model: str, training_start: datetime, training_end: datetime, params: np.ndarray):
+        """Cache a fit, and remember its training range as a starting point for fits of nearby ranges."""
+        neighbours_key = self._neighbours_key(dataset, model)
+        bounds = (pd.Timestamp(training_start).value, pd.Timestamp(training_end).value)
+        with self.cache.transact():
+            self.cache.set(self.key(dataset, model, training_start, training_end), params.tolist())
+            neighbours = self.cache.get(neighbours_key, {})
+            neighbours.pop(bounds, None)
+            neighbours[bounds] = params.tolist()
+            # dicts keep insertion order, so the first entries are the least recently fitted
+            while len(neighbours) > self.max_neighbours:
+                del neighbours[next(iter(neighbours))]
+            self.cache.set(neighbours_key, neighbours)
+
+    def put_many(
+        self,
+        dataset: str,
+        model: str,
+        training_starts: Sequence[datetime],
+        training_ends: Sequence[datetime],
+        params: np.ndarray,
+    ):
+        """Cache several fits in one transaction.
+
+        Their ranges aren't remembered as starting points: a batch such as every window of a rolling fit would
+        push out the ranges picked by hand, which are the ones worth starting a search from.
+        """
+        with self.cache.transact():
+            for start, end, window_params in zip(training_starts, training_ends, params):
+                self.cache.set(self.key(dataset, model, start, end), window_params.tolist())
+
+    def get_or_fit(
+        self,
+        dataset: str,
+        model: str,
+        training_start: datetime,
+        training_end: datetime,
+        fit: Callable[[Optional[np.ndarray]], np.ndarray],
+    ) -> np.ndarray:
+        """Return the cached parameters for a fit, or fit and cache them.
+
+        Args:
+            dataset (str): The fingerprint of the data being fitted.
+            model (str): The model and any settings that change its parameters, e.g. "polynomial-2".
+            training_start (datetime): The first day of the training range.
+            training_end (datetime): The last day of the training range.
+            fit (Callable[[Optional[np.ndarray]], np.ndarray]): Fits the model, given the parameters of the
+                nearest cached fit as a starting point, or None if there are none.
+
+        Returns:
+            np.ndarray: The fitted parameters.
+        """
+        params = self.cache.get(self.key(dataset, model, training_start, training_end))
+        if params is not None:
+            return np.array(params)
+        params = np.asarray(fit(self.nearest(dataset, model, training_start, training_end)))
+        self.put(dataset, model, training_start, training_end, params)
+        return params
+
+
+def polynomial_window_fits(
+    stage: np.ndarray,
+    discharge: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    degree: int,
+    block_values: int = 500_000,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fit a polynomial by least squares to each window ``stage[lo:hi]``, many windows per batched call.
+
+    Windows are padded with zero rows to a common length, which don't change a least squares solution, and solved
+    together by a batched SVD of each window's Vandermonde matrix, as ``np.polyfit`` solves one. Each window's stage
+    is centred and scaled by its own mean and standard deviation first, so the matrix stays well conditioned
+    however narrow the window's range of stages.
+
+    Args:
+        stage (np.ndarray): Stage of every day.
+        discharge (np.ndarray): Discharge of every day.
+        lo (np.ndarray): The position of each window's first day.
+        hi (np.ndarray): The position just past each window's last day.
+        degree (int): The polynomial's degree.
+        block_values (int, optional): About how many stage values to solve for at once, to bound memory use.
+            Defaults to 500_000.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Each window's coefficients from the highest power down, as for
+            ``np.poly1d``, and the RMSE of those coefficients' predictions over the window.
+    """
+    lengths = hi - lo
+    coefficients = np.empty((len(lo), degree + 1))
+    rmse = np.empty(len(lo))
+    if not len(lo):
+        return coefficients, rmse
+    max_length = int(lengths.max())
+    offsets = np.arange(max_length)
+    powers = np.arange(degree + 1)
+    # expanding ((stage - center) / scale) ** k turns coefficients of scaled stage into coefficients of stage
+    k, j = np.meshgrid(powers, powers, indexing="ij")
+    binomials = np.where(j <= k, comb(k, j), 0.0)
+
+    step = max(1, block_values // max_length)
+    for first in range(0, len(lo), step):
+        block = slice(first, first + step)
+        mask = offsets < lengths[block, None]
+        rows = np.where(mask, lo[block, None] + offsets, 0)
+        x, y = np.where(mask, stage[rows], 0.0), np.where(mask, discharge[rows], 0.0)
+        n = lengths[block]
+        center = x.sum(axis=1) / n
+        scale = np.sqrt((np.where(mask, x - center[:, None], 0.0) ** 2).sum(axis=1) / n)
+        scale[scale == 0] = 1.0
+
+        vandermonde = np.where(mask[..., None], ((x - center[:, None]) / scale[:, None])[..., None] ** powers, 0.0)
+        scaled = (np.linalg.pinv(vandermonde) @ y[..., None])[..., 0]
+        unscale = binomials * (-center[:, None, None]) ** np.maximum(k - j, 0) / scale[:, None, None] ** k
+        ascending = np.einsum("wk,wkj->wj", scaled, unscale)
+        coefficients[block] = ascending[:, ::-1]
+
+        predicted = np.zeros_like(x)
+        for power in range(degree, -1, -1):
+            predicted = predicted * x + ascending[:, power, None]
+        rmse[block] = np.sqrt((np.where(mask, predicted - y, 0.0) ** 2).sum(axis=1) / n)
+    return coefficients, rmse
+
+
+def _fit_power_law_windows(
+    stage: np.ndarray, discharge: np.ndarray, bounds: Sequence[Tuple[int, int]], initial_guess: Optional[np.ndarray]
+) -> np.ndarray:
+    # consecutive windows overlap, so each window's search starts from the previous window's parameters
+    params = np.full((len(bounds), 2), np.nan)
+    for i, (lo, hi) in enumerate(bounds):
+        try:
+            params[i] = initial_guess = fit_power_law_params(stage[lo:hi], discharge[lo:hi], initial_guess)
+        except RuntimeError:
+            initial_guess = None
+    return params
+
+
+def power_law_window_fits(
+    stage: np.ndarray,
+    discharge: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    initial_guesses: Sequence[Optional[np.ndarray]] = (),
+) -> np.ndarray:
+    """Fit a power law to each window ``stage[lo:hi]``, splitting runs of consecutive windows across the worker pool.
+
+    Args:
+        stage (np.ndarray): Stage of every day.
+        discharge (np.ndarray): Discharge of every day.
+        lo (np.ndarray): The position of each window's first day.
+        hi (np.ndarray): The position just past each window's last day.
+        initial_guesses (Sequence[Optional[np.ndarray]], optional): Where to start each window's search, if it's
+            the first of its run. Defaults to `power_law_initial_guess`.
+
+    Returns:
+        np.ndarray: Each window's ``[a, b]``, or NaNs where the fit didn't converge.
+    """
+    if len(lo) < POOL_MIN_WINDOWS:
+        guess = initial_guesses[0] if len(initial_guesses) else None
+        return _fit_power_law_windows(stage, discharge, list(zip(lo, hi)), guess).reshape(-1, 2)
+
+    run_length = math.ceil(len(lo) / (2 * (os.cpu_count() or 1)))
+    runs = []
+    for first in range(0, len(lo), run_length):
+        run_lo, run_hi = lo[first : first + run_length], hi[first : first + run_length]
+        # send each worker only the days its windows cover
+        offset = run_lo.min()
+        runs.append(
+            (
+                stage[offset : run_hi.max()],
+                discharge[offset : run_hi.max()],
+                list(zip(run_lo - offset, run_hi - offset)),
+                initial_guesses[first] if len(initial_guesses) else None,
+            )
+        )
+    return np.concatenate(map_in_worker_pool(_fit_power_law_windows, runs))
+
+
+@dataclass
+class RollingFits:
+    """One model fitted over sliding windows of the data, and how its parameters move from window to window."""
+
+    model: str
+    parameter_names: List[str]
+    fits: List[FitResult]
+    parameters: pd.DataFrame
+
+
+def rolling_fits(
+    series: WaterSeries,
+    model: str,
+    window_days: int,
+    stride_days: int,
+    degree: int = 2,
+    fit_cache: Optional[FitCache] = None,
+    dataset: str = "",
+) -> RollingFits:
+    """Fit a rating curve to every sliding window of the data, to show how the stage–discharge relationship shifts.
+
+    Polynomials are fitted to every window at once with `polynomial_window_fits`. Power laws are fitted with
+    `power_law_window_fits`, in the worker pool; with a ``fit_cache``, windows fitted before are read from it, the
+    rest start from the nearest cached fit, and their results are added to it in one batch.
+
+    Args:
+        series (WaterSeries): The data.
+        model (str): "power-law" or "polynomial".
+        window_days (int): The length of each window, in days.
+        stride_days (int): The days between the starts of consecutive windows.
+        degree (int, optional): The polynomial's degree. Defaults to 2.
+        fit_cache (Optional[FitCache], optional): Where to keep power law fits. Defaults to none.
+        dataset (str, optional): The data's fingerprint, which ``fit_cache`` entries are keyed by.
+
+    Returns:
+        RollingFits: A `FitResult` per window with at least `MIN_WINDOW_DAYS` days, and a table of each window's
+            dates, parameters and RMSE.
+    """
+    starts, lo, hi = series.windows(window_days, stride_days)
+    enough_days = hi - lo >= MIN_WINDOW_DAYS
+    starts, lo, hi = starts[enough_days], lo[enough_days], hi[enough_days]
+    ends = starts + pd.Timedelta(days=window_days - 1)
+    stage = series.data["stage_val"].to_numpy(dtype=np.float64)
+    discharge = series.data["discharge_rate"].to_numpy(dtype=np.float64)
+
+    if model == "polynomial":
+        params, rmse = polynomial_window_fits(stage, discharge, lo, hi, degree)
+        parameter_names = [f"c{power}" for power in range(degree, -1, -1)]
+        fits = [
+            polynomial_result(params[i], stage[lo[i] : hi[i]], discharge[lo[i] : hi[i]], starts[i], ends[i], rmse[i])
+            for i in range(len(lo))
+        ]
+    elif model == "power-law":
+        model_key = "power-law"
+        params = np.full((len(lo), 2), np.nan)
+        if fit_cache is not None:
+            for i, cached in enumerate(fit_cache.get_many(dataset, model_key, starts, ends)):
+                if cached is not None:
+                    params[i] = cached
+        missing = np.flatnonzero(np.isnan(params[:, 0]))
+        if len(missing):
+            guesses = []
+            if fit_cache is not None:
+                guesses = fit_cache.nearest_many(dataset, model_key, starts[missing], ends[missing])
+            params[missing] = power_law_window_fits(stage, discharge, lo[missing], hi[missing], guesses)
+            if fit_cache is not None:
+                fitted = missing[~np.isnan(params[missing, 0])]
+                fit_cache.put_many(dataset, model_key, starts[fitted], ends[fitted], params[fitted])
+        parameter_names = ["a", "b"]
+        fits = [
+            power_law_result(params[i], stage[lo[i] : hi[i]], discharge[lo[i] : hi[i]], starts[i], ends[i])
+            for i in range(len(lo))
+        ]
+        rmse = np.array([fit.rmse for fit in fits])
+    else:
+        raise RuntimeError(f"Unknown rating curve model {model!r}")
+
+    parameters = pd.DataFrame(params, columns=parameter_names)
+    parameters.insert(0, "Window Start", starts)
+    parameters.insert(1, "Window End", ends)
+    parameters.insert(2, "Days", hi - lo)
+    parameters["RMSE"] = rmse
+    return RollingFits(model, parameter_names, fits, parameters)
@@ -0,0 +1,176 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# column names that hold student IDs, compared ignoring case, spaces and underscores
+ID_COLUMN_NAMES = ("stateid", "ssid", "studentid")
+
+# everything from the first whitespace on, e.g. the last name in "123456 Smith"; exports often use no-break spaces
+_AFTER_ID_PATTERN = r"[\s\xa0].*$"
+_ID_LIKE_PATTERN = r"[A-Z]*\d[\dA-Z-]*"
+
+
+class StudentIdError(RuntimeError):
+    pass
+
+
+@dataclass
+class StudentIdReport:
+    """What normalizing a file's student IDs found."""
+
+    column: str
+    rows: int
+    blank: int = 0
+    trimmed: int = 0  # rows with text after the ID (e.g. a last name) that was dropped
+    duplicates: int = 0  # rows repeating an ID seen earlier in the file
+
+
+def normalize_ids(ids: pd.Series) -> pd.Series:
+    """Strip each ID, drop anything after its first space and upper-case it, using Arrow string kernels.
+
+    Blank IDs become missing values.
+    """
+    ids = ids.astype("string[pyarrow]").str.strip()
+    ids = ids.str.replace(_AFTER_ID_PATTERN, "", regex=True).str.upper()
+    return ids.mask(ids == "")
+
+
+def _column_key(name) -> str:
+    return re.sub(r"[\s_]+", "", str(name)).lower()
+
+
+def detect_id_column(data: pd.DataFrame, sample_rows: int = 1000) -> str:
+    """Find the column holding student IDs, by name or else by what a sample of its values look like.
+
+    Args:
+        data (pd.DataFrame): A roster, loaded as text.
+        sample_rows (int, optional): How many rows to look at when no column has a known name. Defaults to 1000.
+
+    Raises:
+        StudentIdError: If no column looks like it holds IDs.
+
+    Returns:
+        str: The name of the ID column.
+    """
+    columns_by_key = {_column_key(column): column for column in data.columns}
+    for key in ID_COLUMN_NAMES:
+        if key in columns_by_key:
+            return columns_by_key[key]
+
+    # the best ID column is mostly ID-shaped values that are mostly distinct
+    sample = data.sample(min(sample_rows, len(data)), random_state=0)
+    scores = {}
+    for column in sample.columns:
+        ids = normalize_ids(sample[column]).dropna()
+        if len(ids):
+            scores[column] = ids.str.fullmatch(_ID_LIKE_PATTERN).mean() * ids.nunique() / len(ids)
+    best: Optional[str] = max(scores, key=scores.get, default=None)
+    if best is None or scores[best] < 0.5:
+        raise StudentIdError(f"Couldn't find a student ID column among {', '.join(map(str, data.columns))}")
+    return best
+
+
+def student_ids(data: pd.DataFrame, column: Optional[str] = None) -> Tuple[pd.Index, StudentIdReport]:
+    """Normalize a roster's student IDs with `normalize_ids` and return the distinct ones.
+
+    Args:
+        data (pd.DataFrame): A roster, loaded as text.
+        column (Optional[str], optional): The ID column. Defaults to the one `detect_id_column` finds.
+
+    Returns:
+        Tuple[pd.Index, StudentIdReport]: The distinct, non-blank IDs, for hash-based membership tests, and a
+            report of the blank, trimmed and duplicate rows.
+    """
+    column = detect_id_column(data) if column is None else column
+    raw_ids = data[column].astype("string[pyarrow]").str.strip()
+    ids = normalize_ids(raw_ids)
+    present = ids.dropna()
+    report = StudentIdReport(
+        column=str(column),
+        rows=len(ids),
+        blank=int(ids.isna().sum()),
+        trimmed=int((present.str.len() < raw_ids[present.index].str.len()).sum()),
+        duplicates=int(present.duplicated().sum()),
+    )
+    return pd.Index(present.unique()), report
+
+
+def _intersect(a: pd.Index, b: pd.Index) -> pd.Index:
+    # a hash join: `isin` builds a hash table of the smaller side's values instead of scanning a list per ID
+    if len(b) < len(a):
+        a, b = b, a
+    return a[a.isin(b)]
+
+
+@dataclass
+class RetentionColumn:
+    """How one year's students relate to the students of every year up to and including it.
+
+    ``retained[i]`` is the number of year ``i`` students enrolled this year, and ``persisted[i]`` the number
+    enrolled in every year from year ``i`` through this one. The last entry of each is this year's own count.
+    """
+
+    students: int
+    retained: List[int] = field(default_factory=list)
+    persisted: List[int] = field(default_factory=list)
+
+
+def retention_column(id_sets: Sequence[pd.Index]) -> RetentionColumn:
+    """Compare the last year in ``id_sets`` with each earlier year, which are given in order.
+
+    Args:
+        id_sets (Sequence[pd.Index]): Each year's student IDs, as from `student_ids`, oldest first.
+
+    Returns:
+        RetentionColumn: The retention counts for the last year.
+    """
+    *earlier, current = id_sets
+    retained = [len(_intersect(ids, current)) for ids in earlier]
+    # walk back through the years, narrowing down to the students enrolled in every one of them
+    persisted = []
+    persisting = current
+    for ids in reversed(earlier):
+        persisting = _intersect(persisting, ids)
+        persisted.append(len(persisting))
+    return RetentionColumn(len(current), retained + [len(current)], persisted[::-1] + [len(current)])
+
+
+def retention_tables(
+    years: Sequence[str], columns: Sequence[RetentionColumn]
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Lay out the retention counts of consecutive years as tables.
+
+    Args:
+        years (Sequence[str]): The name of each year, oldest first.
+        columns (Sequence[RetentionColumn]): Each year's `retention_column`, in the same order.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: A year over year summary of students, returning, new and
+            left counts; the cohort retention matrix, with a row per starting year and a column per later year; and
+            the same matrix counting only students enrolled in every year in between.
+    """
+    summary = []
+    for j, column in enumerate(columns):
+        previous = columns[j - 1].students if j else None
+        returning = column.retained[j - 1] if j else None
+        summary.append(
+            {
+                "Year": years[j],
+                "Students": column.students,
+                "Returning": returning,
+                "New": column.students - returning if j else None,
+                "Left": previous - returning if j else None,
+                "Retention": returning / previous if j and previous else None,
+            }
+        )
+
+    def _matrix(counts: str) -> pd.DataFrame:
+        matrix = pd.DataFrame(index=pd.Index(years, name="Cohort"), columns=years, dtype="Int64")
+        for j, column in enumerate(columns):
+            matrix.iloc[: j + 1, j] = getattr(column, counts)
+        return matrix
+
+    summary = pd.DataFrame(summary).astype({"Returning": "Int64", "New": "Int64", "Left": "Int64"})
+    return summary, _matrix("retained"), _matrix("persisted")
@@ -0,0 +1,246 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized ``int.bit_length`` for uint64 values, exact because each 32-bit half converts to float exactly."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+@dataclass
+class HyperLogLog:
+    """A HyperLogLog distinct-count sketch over 64-bit hashes, with ``2 ** precision`` registers."""
+
+    precision: int = 14
+    registers: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        if self.registers is None:
+            self.registers = np.zeros(2**self.precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        """The standard error of `estimate`, relative to the true count."""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, hashes: np.ndarray):
+        remaining_bits = 64 - self.precision
+        idx = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << remaining_bits) - 1)
+        rank = (remaining_bits - _bit_length(rest) + 1).astype(np.uint8)
+        if not len(idx):
+            return
+        # sort (register, rank) pairs packed into one integer, then take the largest rank per register with one
+        # reduceat, which is several times faster than np.maximum.at; ranks are at most 65 so fit in 8 bits
+        packed_type = np.uint32 if self.precision <= 24 else np.uint64
+        packed = np.sort((idx.astype(packed_type) << packed_type(8)) | rank)
+        idx = (packed >> packed_type(8)).astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], idx[1:] != idx[:-1])))
+        registers = idx[starts]
+        ranks = np.maximum.reduceat((packed & packed_type(0xFF)).astype(np.uint8), starts)
+        self.registers[registers] = np.maximum(self.registers[registers], ranks)
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # small range correction (linear counting)
+            return m * np.log(m / zeros)
+        return raw
+
+
+@dataclass
+class SpaceSaving:
+    """A mergeable Space-Saving summary of the ``capacity`` most frequent items.
+
+    Each tracked item's true count lies between ``counts - errors`` and ``counts``.
+    """
+
+    capacity: int = 64
+    counts: pd.Series = field(default_factory=lambda: pd.Series(dtype=np.int64))
+    errors: pd.Series = field(default_factory=lambda: pd.Series(dtype=np.int64))
+
+    def update(self, batch_counts: pd.Series):
+        """Merge in the exact counts of a batch of values."""
+        # reduce the batch to its own summary first; values it drops were seen at most `batch_floor` times
+        batch_top = batch_counts.nlargest(self.capacity + 1, keep="first")
+        batch_floor = int(batch_top.iloc[-1]) if len(batch_top) > self.capacity else 0
+        batch_top = batch_top.head(self.capacity)
+        # likewise, values this summary doesn't track were seen at most its smallest count
+        floor = int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+        index = self.counts.index.union(batch_top.index)
+        counts = self.counts.reindex(index, fill_value=floor) + batch_top.reindex(index, fill_value=batch_floor)
+        errors = self.errors.reindex(index, fill_value=floor) + np.where(index.isin(batch_top.index), 0, batch_floor)
+        self.counts = counts.nlargest(self.capacity, keep="first")
+        self.errors = errors[self.counts.index]
+
+    def top(self, k: int = 10) -> pd.DataFrame:
+        top = self.counts.head(k)
+        return pd.DataFrame(
+            {"Item": top.index, "Count (max)": top.values, "Count (min)": (top - self.errors[top.index]).values}
+        )
+
+
+@dataclass
+class ColumnSketch:
+    name: str
+    dtype: str
+    count: int = 0
+    nulls: int = 0
+    distinct: HyperLogLog = field(default_factory=HyperLogLog)
+    heavy_hitters: SpaceSaving = field(default_factory=SpaceSaving)
+
+    def update(self, values: pd.Series):
+        self.count += len(values)
+        non_null = values.dropna()
+        self.nulls += len(values) - len(non_null)
+        try:
+            hashes = pd.util.hash_pandas_object(non_null, index=False).to_numpy()
+            batch_counts = non_null.value_counts(sort=False)
+        except TypeError:
+            non_null = non_null.astype(str)
+            hashes = pd.util.hash_pandas_object(non_null, index=False).to_numpy()
+            batch_counts = non_null.value_counts(sort=False)
+        batch_counts = batch_counts[batch_counts > 0]  # categoricals also report their unused categories
+        if isinstance(batch_counts.index, pd.CategoricalIndex):
+            batch_counts.index = pd.Index(np.asarray(batch_counts.index))
+        self.distinct.update(hashes)
+        self.heavy_hitters.update(batch_counts)
+
+    @property
+    def approx_distinct(self) -> int:
+        return int(round(self.distinct.estimate()))
+
+    @property
+    def approx_distinct_error(self) -> int:
+        """Two standard errors, so the true distinct count is within this of `approx_distinct` ~95% of the time."""
+        return int(np.ceil(2 * self.distinct.relative_error * self.approx_distinct))
+
+
+class DatasetSketch:
+    """Approximate per-column statistics built in one streaming pass over Arrow record batches.
+
+    Row and missing value counts are exact; distinct counts come from a HyperLogLog sketch and the most common
+    items from a Space-Saving summary, so memory stays fixed however many rows are seen.
+    """
+
+    def __init__(self):
+        self.num_rows = 0
+        self.columns: Dict[str, ColumnSketch] = {}
+
+    def update(self, batch: pa.RecordBatch):
+        self.num_rows += batch.num_rows
+        for name, column in zip(batch.schema.names, batch.columns):
+            self._update_column(name, column.to_pandas())
+
+    def update_frame(self, chunk: pd.DataFrame):
+        """Update the sketch with a chunk of rows already in pandas, such as one read while ingesting an upload."""
+        self.num_rows += len(chunk)
+        for name, values in chunk.items():
+            self._update_column(str(name), values)
+
+    def _update_column(self, name: str, values: pd.Series):
+        if name not in self.columns:
+            self.columns[name] = ColumnSketch(name, str(values.dtype))
+        self.columns[name].update(values)
+
+    @classmethod
+    def from_batches(cls, batches: Iterable[pa.RecordBatch]) -> "DatasetSketch":
+        sketch = cls()
+        for batch in batches:
+            sketch.update(batch)
+        return sketch
+
+    @classmethod
+    def from_dataframe(cls, data: pd.DataFrame, batch_rows: int = 100_000) -> "DatasetSketch":
+        """Sketch a DataFrame ``batch_rows`` rows at a time, without converting it to Arrow."""
+        sketch = cls()
+        for start in range(0, len(data), batch_rows):
+            sketch.update_frame(data.iloc[start : start + batch_rows])
+        return sketch
+
+    def details(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Return one row of approximate statistics per column, with error bounds."""
+        rows = []
+        for name in columns or self.columns:
+            column = self.columns[name]
+            top = column.heavy_hitters.top(1)
+            rows.append(
+                {
+                    "Column Name": name,
+                    "Data Type": column.dtype,
+                    "Unique Items (approx.)": column.approx_distinct,
+                    "Unique Items ±": column.approx_distinct_error,
+                    "Missing Values": column.nulls,
+                    "Most Common Item": str(top["Item"].iloc[0]) if len(top) else None,
+                    "Most Common Count": (
+                        f"{top['Count (min)'].iloc[0]} - {top['Count (max)'].iloc[0]}" if len(top) else None
+                    ),
+                }
+            )
+        return pd.DataFrame(rows)
+
+
+class ReservoirSample:
+    """A uniform random sample of up to ``capacity`` rows, kept in one streaming pass over DataFrame chunks.
+
+    This is reservoir sampling (Algorithm R), vectorized over each chunk. The number of rows seen and the missing
+    values per column are counted exactly.
+    """
+
+    def __init__(self, capacity: int, seed: Optional[int] = 0):
+        self.capacity = capacity
+        self.rng = np.random.default_rng(seed)
+        self.num_rows = 0
+        self.null_counts: Dict[str, int] = {}
+        self._rows: Optional[pd.DataFrame] = None
+        self._positions = np.empty(0, dtype=np.int64)
+
+    def update(self, chunk: pd.DataFrame):
+        chunk = chunk.reset_index(drop=True)
+        for column, nulls in chunk.isna().sum().items():
+            self.null_counts[str(column)] = self.null_counts.get(str(column), 0) + int(nulls)
+        positions = np.arange(self.num_rows, self.num_rows + len(chunk), dtype=np.int64)
+        self.num_rows += len(chunk)
+
+        # fill the reservoir with the first `capacity` rows
+        num_fill = min(self.capacity - len(self._positions), len(chunk))
+        if num_fill > 0:
+            fill = chunk.iloc[:num_fill]
+            self._rows = fill if self._rows is None else pd.concat([self._rows, fill], ignore_index=True)
+            self._positions = np.concatenate([self._positions, positions[:num_fill]])
+
+        # after that, row i replaces a uniformly chosen slot with probability capacity / (i + 1)
+        rest = positions[num_fill:]
+        slots = (self.rng.random(len(rest)) * (rest + 1)).astype(np.int64)
+        rows = np.flatnonzero(slots < self.capacity) + num_fill
+        slots = slots[slots < self.capacity]
+        if not len(slots):
+            return
+        # a slot picked more than once in this chunk ends up holding the last row that picked it
+        _, last_from_end = np.unique(slots[::-1], return_index=True)
+        keep = len(slots) - 1 - last_from_end
+        slots, rows = slots[keep], rows[keep]
+
+        kept = np.ones(len(self._positions), dtype=bool)
+        kept[slots] = False
+        self._rows = pd.concat([self._rows[kept], chunk.iloc[rows]], ignore_index=True)
+        self._positions = np.concatenate([self._positions[kept], positions[rows]])
+
+    def sample(self) -> pd.DataFrame:
+        """Return the sampled rows in the order they appeared in the stream."""
+        if self._rows is None:
+            return pd.DataFrame()
+        return self._rows.iloc[np.argsort(self._positions, kind="stable")].reset_index(drop=True)
@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from logzero import logger
+
+from columnar_files import table_to_pandas
+
+# USGS parameter codes for discharge (cubic feet per second) and gage height (feet), and the daily mean statistic
+DISCHARGE_PARAMETER = "00060"
+STAGE_PARAMETER = "00065"
+DAILY_MEAN_STATISTIC = "00003"
+
+WATER_VALUE_COLUMNS = ("stage_val", "discharge_rate")
+STORE_SUFFIX = ".arrow"
+
+# the second header line of an RDB file gives each column's width and type, e.g. "5s", "15s", "20d", "14n"
+_RDB_FORMAT_PATTERN = re.compile(r"^\d+[sdn]$")
+
+
+def read_usgs_rdb(path: Path) -> pd.DataFrame:
+    """Parse a USGS daily values RDB file (or a tab separated export of one) into typed columns.
+
+    Comment lines and the RDB column format line are skipped. Values that aren't numbers, such as the "Ice" or
+    "Eqp" USGS reports for days without a measurement, become missing and those days are dropped.
+
+    Args:
+        path (Path): The RDB or TSV file.
+
+    Returns:
+        pd.DataFrame: The ``date``, ``stage_val`` and ``discharge_rate`` of each day, sorted by date, with
+            ``stage_val_norm`` and ``discharge_rate_norm`` scaled to between 0 and 1.
+    """
+    raw = pd.read_csv(path, sep="\t", dtype=str, comment="#", low_memory=False)
+    if len(raw) and raw.iloc[0].str.match(_RDB_FORMAT_PATTERN).all():
+        raw = raw.iloc[1:]
+
+    def _parameter_column(parameter: str) -> str:
+        suffix = f"_{parameter}_{DAILY_MEAN_STATISTIC}"
+        for column in raw.columns:
+            if column.endswith(suffix):
+                return column
+        raise RuntimeError(f"{path.name} has no daily mean column for USGS parameter {parameter}")
+
+    data = pd.DataFrame(
+        {
+            "date": pd.to_datetime(raw["datetime"]),
+            "stage_val": pd.to_numeric(raw[_parameter_column(STAGE_PARAMETER)], errors="coerce"),
+            "discharge_rate": pd.to_numeric(raw[_parameter_column(DISCHARGE_PARAMETER)], errors="coerce"),
+        }
+    )
+    data = data.dropna(subset=list(WATER_VALUE_COLUMNS)).sort_values(by=["date"], ignore_index=True)
+    for column in WATER_VALUE_COLUMNS:
+        low, high = data[column].min(), data[column].max()
+        data[f"{column}_norm"] = (data[column] - low) / (high - low)
+    return data
+
+
+def value_ranges(data: pd.DataFrame) -> Dict[str, Tuple[float, float]]:
+    return {column: (float(data[column].min()), float(data[column].max())) for column in WATER_VALUE_COLUMNS}
+
+
+def store_path(source: Path) -> Path:
+    return source.with_suffix(STORE_SUFFIX)
+
+
+def build_water_store(source: Path, store: Optional[Path] = None) -> Path:
+    """Parse a USGS RDB/TSV file once and write it as an uncompressed Arrow IPC file for `load_water_data`.
+
+    The file holds the typed and normalized columns, with each value column's minimum and maximum in its metadata.
+
+    Args:
+        source (Path): The RDB or TSV file.
+        store (Optional[Path], optional): Where to write the store. Defaults to ``source`` with an ``.arrow``
+            suffix.
+
+    Returns:
+        Path: The store written.
+    """
+    store = store_path(source) if store is None else store
+    data = read_usgs_rdb(source)
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), b"water_ranges": json.dumps(value_ranges(data)).encode()}
+    table = table.replace_schema_metadata(metadata)
+
+    # write to a temporary name first so a running server never maps a partial file
+    tmp_path = store.with_name(f"{store.name}.{uuid4().hex}.tmp")
+    try:
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, store)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    logger.info(f"Wrote {len(data)} days from {source.name} to {store}")
+    return store
+
+
+def read_water_store(store: Path) -> pd.DataFrame:
+    """Memory-map a store written by `build_water_store`, without copying or parsing its columns.
+
+    The value columns' ranges are in the DataFrame's ``attrs["water_ranges"]``, as ``(min, max)`` pairs.
+    """
+    with pa.memory_map(str(store)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    data = table_to_pandas(table)
+    ranges = json.loads(table.schema.metadata[b"water_ranges"])
+    data.attrs["water_ranges"] = {column: tuple(bounds) for column, bounds in ranges.items()}
+    return data
+
+
+def load_water_data(source: Path) -> pd.DataFrame:
+    """Load a USGS RDB/TSV file through its Arrow store, building the store first if it's missing or stale.
+
+    Args:
+        source (Path): The RDB or TSV file.
+
+    Returns:
+        pd.DataFrame: The data `read_usgs_rdb` parses, with the value columns' ranges in ``attrs["water_ranges"]``.
+    """
+    store = store_path(source)
+    if not store.exists() or store.stat().st_mtime < source.stat().st_mtime:
+        try:
+            build_water_store(source, store)
+        except OSError as e:
+            # e.g. a read-only deployment without a prebuilt store; parse the source directly instead
+            logger.warning(f"Couldn't write {store}, parsing {source.name} instead: {e}")
+            data = read_usgs_rdb(source)
+            data.attrs["water_ranges"] = value_ranges(data)
+            return data
+    return read_water_store(store)
+
+
+class WaterSeries:
+    """Daily water data sorted by date, sliced by date range through a binary search of the dates.
+
+    A range query costs two ``searchsorted`` lookups rather than comparing every date, and returns a positional
+    slice of the data, which shares its column buffers instead of copying them.
+
+    Args:
+        data (pd.DataFrame): Data as from `load_water_data`, with a ``date`` column in ascending order.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+        self.dates: np.ndarray = data["date"].to_numpy(dtype="datetime64[ns]")
+
+    def bounds(self, start, end) -> Tuple[int, int]:
+        """Return the positions of the first day on or after ``start`` and just past the last day up to ``end``."""
+        return (
+            int(self.dates.searchsorted(pd.Timestamp(start).to_datetime64(), side="left")),
+            int(self.dates.searchsorted(pd.Timestamp(end).to_datetime64(), side="right")),
+        )
+
+    def between(self, start, end) -> pd.DataFrame:
+        """Return the days from ``start`` through ``end``, inclusive."""
+        lo, hi = self.bounds(start, end)
+        return self.data.iloc[lo:hi]
+
+    def windows(self, window_days: int, stride_days: int) -> Tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+        """Split the data into sliding windows of ``window_days`` days, starting every ``stride_days`` days.
+
+        Returns:
+            Tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]: Each window's first day, and the positions of its
+                first row and just past its last row, found for every window in one ``searchsorted`` call each.
+        """
+        if not len(self.dates):
+            return pd.DatetimeIndex([]), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        window = pd.Timedelta(days=window_days - 1)
+        starts = pd.date_range(self.dates[0], self.dates[-1] - window, freq=pd.Timedelta(days=stride_days))
+        lo = self.dates.searchsorted(starts.to_numpy(), side="left")
+        hi = self.dates.searchsorted((starts + window).to_numpy(), side="right")
+        return starts, lo, hi
+
+
+def build_water_stores(directory: Path):
+    """Build the store for every USGS ``.tsv`` and ``.rdb`` file in ``directory``."""
+    for source in sorted([*directory.glob("*.tsv"), *directory.glob("*.rdb")]):
+        build_water_store(source)
+
+
+if __name__ == "__main__":
+    build_water_stores(Path(sys.argv[1]))
@@ -1,65 +1,96 @@
-import streamlit as st
-
-from page_helpers import load_data_from_file
-
-
-def find_state_id_key(dataframe) -> str:
-    try:
-        _ = dataframe["State ID"]
-    except KeyError:
-        return "StateID"
-    else:
-        return "State ID"
-
-
-def _load_data(file_upload):
-    df = load_data_from_file(file_upload)
-    return df
-
-
-cols = iter(st.columns(2))
-
-
-first_year_ids = None
-
-with next(cols):
-    file1 = st.file_uploader("Start Year")
-    if file1:
-        df1 = _load_data(file1)
-        id_key1 = find_state_id_key(df1)
-        first_id = df1[id_key1][0]
-        if " " in first_id:
-            df1[[id_key1, "Last Name"]] = df1[id_key1].str.split(" ", n=1, expand=True)
-
-        first_year_ids = [x for x in df1[id_key1].tolist() if x.strip()]
-
-        st.metric("Number of students", len(first_year_ids))
-
-        with st.expander("Student IDs"):
-            st.write(df1[id_key1])
+from pathlib import Path
+from typing import Tuple
 
+import pandas as pd
+import streamlit as st
 
-with next(cols):
-    file2 = st.file_uploader("Next Year")
-    if file2:
-        df2 = _load_data(file2)
-        id_key2 = find_state_id_key(df2)
-        first_id = df2[id_key2][0]
-        if " " in first_id:
-            df2[[id_key2, "Last Name"]] = df2[id_key2].str.split(" ", n=1, expand=True)
+from page_helpers import DatasetHandle, load_dataset
+from retention_helpers import (
+    RetentionColumn,
+    StudentIdError,
+    StudentIdReport,
+    retention_column,
+    retention_tables,
+    student_ids,
+)
 
-        second_year_ids = [x for x in df2[id_key2].tolist() if x.strip()]
-        st.metric("Number of students", len(second_year_ids))
 
-        if first_year_ids:
-            repeat_ids = [x for x in second_year_ids if x in first_year_ids]
-            st.metric("Number returning", len(repeat_ids))
+def _load_data(file_upload) -> DatasetHandle:
+    return load_dataset(file_upload, all_strings=True)
 
 
+@st.cache_resource(max_entries=32)
+def _student_ids(upload_key: str, _file) -> Tuple[pd.Index, StudentIdReport]:
+    """Load a year's file and normalize its student IDs, once per uploaded file."""
+    return student_ids(_load_data(_file).data)
 
 
+@st.cache_resource(max_entries=64)
+def _retention_column(upload_keys: Tuple[str, ...], _id_sets) -> RetentionColumn:
+    """Compare a year with the years before it, once per sequence of files, so adding a year only adds a column."""
+    return retention_column(_id_sets)
 
 
-        with st.expander("Student IDs"):
-            st.write(df2[id_key2])
+files = st.file_uploader(
+    "Yearly files",
+    accept_multiple_files=True,
+    help="One file per school year, oldest first when sorted by file name (e.g. 2022-23.csv, 2023-24.csv)",
+)
 
+if files:
+    files = sorted(files, key=lambda file: file.name)
+    years = [Path(file.name).stem for file in files]
+    upload_keys = [DatasetHandle.from_upload(file, None, all_strings=True) for file in files]
+    try:
+        id_sets, id_reports = zip(*(_student_ids(upload_key, file) for upload_key, file in zip(upload_keys, files)))
+    except StudentIdError as e:
+        st.error(str(e))
+        st.stop()
+    columns = [_retention_column(tuple(upload_keys[: j + 1]), id_sets[: j + 1]) for j in range(len(files))]
+    summary, retained, persisted = retention_tables(years, columns)
+
+    metrics = iter(st.columns(2))
+    with next(metrics):
+        st.metric("Number of students", columns[-1].students)
+    if len(files) > 1:
+        with next(metrics):
+            st.metric("Number returning", summary["Returning"].iloc[-1])
+
+    st.subheader("Year over year")
+    st.dataframe(summary.style.format({"Retention": "{:.1%}"}, na_rep=""), hide_index=True)
+
+    if len(files) > 1:
+        as_percent = st.checkbox("Show cohorts as a percentage of their starting size")
+
+        def _show_matrix(matrix: pd.DataFrame):
+            if as_percent:
+                matrix = matrix.astype("float64").div([column.students for column in columns], axis=0)
+                st.dataframe(matrix.style.format("{:.1%}", na_rep=""))
+            else:
+                st.dataframe(matrix)
+
+        st.subheader("Cohort retention")
+        st.caption("Students of each starting year who are enrolled in each later year")
+        _show_matrix(retained)
+        st.subheader("Cohort persistence")
+        st.caption("Students of each starting year who are enrolled in every year up to each later year")
+        _show_matrix(persisted)
+
+    with st.expander("ID normalization"):
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "Year": years,
+                    "ID Column": [report.column for report in id_reports],
+                    "Rows": [report.rows for report in id_reports],
+                    "Blank": [report.blank for report in id_reports],
+                    "Name Removed": [report.trimmed for report in id_reports],
+                    "Duplicates": [report.duplicates for report in id_reports],
+                }
+            ),
+            hide_index=True,
+        )
+
+    for year, ids in zip(years, id_sets):
+        with st.expander(f"Student IDs: {year}"):
+            st.write(pd.Series(ids, name="State ID"))
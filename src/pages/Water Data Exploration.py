@@ -1,4 +1,3 @@
-from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -7,11 +6,34 @@ import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
-from scipy.optimize import curve_fit
+from diskcache import Cache
+from plotly.colors import sample_colorscale
+from plotly.subplots import make_subplots
+
+from common_settings import AppSettings
+from downsampling import downsample_series
+from page_helpers import DatasetHandle
+from rating_curve_helpers import (
+    MIN_WINDOW_DAYS,
+    FitCache,
+    FitResult,
+    RollingFits,
+    calculate_rmse,
+    fit_power_law_params,
+    polynomial_result,
+    power_law_result,
+    rolling_fits,
+)
+from water_data_helpers import WaterSeries, load_water_data
 
 # Set the page configuration
 st.set_page_config("Water Data Exploration", layout="wide", initial_sidebar_state="collapsed")
 
+# about the daily chart's width in pixels in the wide layout; more points per trace than that can't be told apart
+MAX_CHART_POINTS = 1200
+# line traces with more points than this are drawn with WebGL
+WEBGL_MIN_POINTS = 1000
+
 
 def main():
     """Main function to run the Streamlit app."""
@@ -19,7 +41,9 @@ def main():
     model_fit: Optional[FitResult] = None
 
     st.title("Water Data Exploration")
-    raw_water_data = load_water_data()
+    water_data = get_water_dataset()
+    raw_water_data = water_data.data
+    water_series = WaterSeries(raw_water_data)
     options = [raw_water_data.iloc[0]["date"].to_pydatetime(), raw_water_data.iloc[-1]["date"].to_pydatetime()]
 
     with st.expander("Data"):
@@ -47,16 +71,11 @@ def main():
             # del slider_to
             fit_type = st.selectbox("Model Type", ("None", "Power Law", "Polynomial Model"))
 
-            df = raw_water_data
-            discharge_by_stage_water_data = df[(df["date"] >= train_from) & (df["date"] <= train_to)]
-            train_stage = discharge_by_stage_water_data["stage_val"].values
-            train_discharge = discharge_by_stage_water_data["discharge_rate"].values
-
             if fit_type == "Power Law":
-                model_fit = fit_power_law(train_stage, train_discharge, train_from, train_to)
+                model_fit = fit_power_law(water_data, train_from, train_to)
             elif fit_type == "Polynomial Model":
                 degree = st.number_input("fit-degree", min_value=2, max_value=5, value=2)
-                model_fit = fit_polynomial(train_stage, train_discharge, degree, train_from, train_to)
+                model_fit = fit_polynomial(water_data, degree, train_from, train_to)
 
             if model_fit:
                 metrics = [
@@ -69,9 +88,10 @@ def main():
                 if not model_fit:
                     st.info("Fit a model first")
                 else:
-                    min_stage = float(raw_water_data["stage_val"].min() // 5 * 5)  # nearest lower 5
-                    min_val = round(raw_water_data["stage_val"].min(), 1)
-                    max_stage = float(raw_water_data["stage_val"].max() // 5 * 5 + 5)  # nearest upper 5
+                    stage_min, stage_max = raw_water_data.attrs["water_ranges"]["stage_val"]
+                    min_stage = float(stage_min // 5 * 5)  # nearest lower 5
+                    min_val = round(stage_min, 1)
+                    max_stage = float(stage_max // 5 * 5 + 5)  # nearest upper 5
                     columns = iter(st.columns(2))
                     with next(columns):
                         start = st.number_input(
@@ -102,7 +122,7 @@ def main():
             del slider_to
 
             df = raw_water_data
-            daily_water_data = df[(df["date"] >= filter_from) & (df["date"] <= filter_to)]
+            daily_water_data = water_series.between(filter_from, filter_to)
 
             view_type = st.selectbox("View Option", ("Adjusted", "Raw", "Normalized"), label_visibility="collapsed")
             normalize_data = view_type == "Normalized"
@@ -112,7 +132,8 @@ def main():
             discharge_key = "discharge_rate"
             stage_range = None
             if view_type == "Adjusted":
-                stage_range = [int(df["stage_val"].min()) - 3, int(df["stage_val"].max()) + 3]
+                stage_min, stage_max = df.attrs["water_ranges"]["stage_val"]
+                stage_range = [int(stage_min) - 3, int(stage_max) + 3]
             elif view_type == "Raw":
                 pass
             elif view_type == "Normalized":
@@ -122,14 +143,24 @@ def main():
             else:
                 raise ValueError("Invalid view type")
 
-            daily_fig.add_trace(
-                go.Bar(x=daily_water_data["date"], y=daily_water_data[stage_key], name="Stage", marker_color="blue")
+            # send at most MAX_CHART_POINTS points per trace to the browser, however long the date range
+            dates = daily_water_data["date"].to_numpy()
+            line_trace = go.Scattergl if min(len(dates), MAX_CHART_POINTS) > WEBGL_MIN_POINTS else go.Scatter
+            if len(dates) > MAX_CHART_POINTS:
+                st.caption(f"Showing {MAX_CHART_POINTS:,} of {len(dates):,} days, picked to keep the chart's shape")
+
+            stage_dates, stage_values = downsample_series(
+                dates, daily_water_data[stage_key].to_numpy(), MAX_CHART_POINTS
             )
+            daily_fig.add_trace(go.Bar(x=stage_dates, y=stage_values, name="Stage", marker_color="blue"))
 
+            discharge_dates, discharge_values = downsample_series(
+                dates, daily_water_data[discharge_key].to_numpy(), MAX_CHART_POINTS
+            )
             daily_fig.add_trace(
-                go.Scatter(
-                    x=daily_water_data["date"],
-                    y=daily_water_data[discharge_key],
+                line_trace(
+                    x=discharge_dates,
+                    y=discharge_values,
                     name="Discharge",
                     line=dict(color="red"),
                     yaxis="y2",
@@ -164,11 +195,13 @@ def main():
                     display_discharge = predicted_discharge
 
                 # Add predicted discharge to the daily discharge plot
-
+                predicted_dates, predicted_values = downsample_series(
+                    dates, np.asarray(display_discharge), MAX_CHART_POINTS
+                )
                 daily_fig.add_trace(
-                    go.Scatter(
-                        x=daily_water_data["date"],
-                        y=display_discharge,
+                    line_trace(
+                        x=predicted_dates,
+                        y=predicted_values,
                         name="Predicted Discharge",
                         line=dict(color="cyan"),
                         yaxis="y2",
@@ -186,8 +219,7 @@ def main():
             del slider_from
             del slider_to
 
-            df = raw_water_data
-            discharge_by_stage_water_data = df[(df["date"] >= filter_from) & (df["date"] <= filter_to)]
+            discharge_by_stage_water_data = water_series.between(filter_from, filter_to)
             discharge_by_stage_stage = discharge_by_stage_water_data["stage_val"].values
             discharge_by_stage_discharge = discharge_by_stage_water_data["discharge_rate"].values
             discharge_fig.add_trace(
@@ -217,127 +249,135 @@ def main():
 
             st.plotly_chart(discharge_fig, use_container_width=True)
 
+        with st.expander("Rolling Fit"):
+            if st.checkbox("Fit over sliding windows", help="See how the rating curve shifts over time"):
+                columns = iter(st.columns(3))
+                with next(columns):
+                    rolling_type = st.selectbox("Rolling Model Type", ("Power Law", "Polynomial Model"))
+                with next(columns):
+                    window_days = st.number_input("Window (days)", min_value=MIN_WINDOW_DAYS, value=90)
+                with next(columns):
+                    stride_days = st.number_input("Stride (days)", min_value=1, value=7)
+                rolling_degree = 2
+                if rolling_type == "Polynomial Model":
+                    rolling_degree = st.number_input("rolling-fit-degree", min_value=2, max_value=5, value=2)
+                rolling_model = "power-law" if rolling_type == "Power Law" else "polynomial"
+                rolling = rolling_fit(
+                    water_data, rolling_model, int(window_days), int(stride_days), int(rolling_degree)
+                )
+                if not rolling.fits:
+                    st.info(f"No {window_days}-day window has the {MIN_WINDOW_DAYS} days of data needed to fit it")
+                else:
+                    show_rolling_fits(rolling)
 
 
-def calculate_rmse(y_actual, y_pred):
-    """Calculate Root Mean Squared Error between actual and predicted values."""
-    return np.sqrt(np.mean((y_actual - y_pred) ** 2))
-
-
-def power_law(x, a, b):
-    """Power law function used in curve fitting."""
-    return a * np.power(x, b)
-
-
-class PowerLawModel:
-    def __init__(self, params):
-        self.params = params
-
-    def __call__(self, x):
-        return power_law(x, *self.params)
-
-
-@dataclass()
-class FitResult:
-    """A class used to represent the result of a model fitting."""
-
-    model: np.poly1d or callable
-    stage_fit: np.ndarray
-    discharge_fit: np.ndarray
-    label: str
-    rmse: float
-    min_discharge: float
-    max_discharge: float
-    training_start: datetime
-    training_end: datetime
-
-    def predict(self, stage, normalized=False):
-        """
-        Predict discharge based on the given stage.
-        If normalized is True, normalize the predicted discharge based on the min and max discharge of the fit.
-        """
-        discharge = self.model(stage)
-        if normalized:
-            discharge = (discharge - self.min_discharge) / (self.max_discharge - self.min_discharge)
-        return discharge
 
-    def __eq__(self, other):
-        if not other:
-            return False
-        return (
-            self.label == other.label
-            and self.training_start == other.training_start
-            and self.training_end == other.training_end
-        )
+def training_data(water_data: DatasetHandle, training_start: datetime, training_end: datetime):
+    """Return the stage and discharge values recorded between the training dates."""
+    training_df = WaterSeries(water_data.data).between(training_start, training_end)
+    return training_df["stage_val"].values, training_df["discharge_rate"].values
 
 
-def _apply_power_law(val, *args):
-    return power_law(val, *args)
+@st.cache_resource
+def get_fit_cache() -> FitCache:
+    return FitCache(Cache(str(AppSettings().fit_cache_dir)))
 
 
 @st.cache_data
-def fit_power_law(stage, discharge, training_start: datetime, training_end: datetime):
-    """Fit a power law model to the given stage and discharge data."""
-    params = curve_fit(power_law, stage, discharge, maxfev=5000)[0]
-    model = PowerLawModel(params)
-    stage_fit = np.linspace(stage.min(), stage.max(), 100)
-    discharge_fit = model(stage_fit)
-    label = f"Fit: a={params[0]:.3f}, b={params[1]:.3f}"
-    rmse = calculate_rmse(discharge, model(stage))
-    return FitResult(
-        model,
-        stage_fit,
-        discharge_fit,
-        label,
-        rmse,
-        discharge.min(),
-        discharge.max(),
-        training_start=training_start,
-        training_end=training_end,
+def fit_power_law(water_data: DatasetHandle, training_start: datetime, training_end: datetime):
+    """Fit a power law model to the stage and discharge data in the training range.
+
+    The search starts from the parameters fitted for the nearest training range, so moving a training date a little
+    refits in a few iterations.
+    """
+    stage, discharge = training_data(water_data, training_start, training_end)
+    params = get_fit_cache().get_or_fit(
+        water_data.fingerprint,
+        "power-law",
+        training_start,
+        training_end,
+        lambda initial_guess: fit_power_law_params(stage, discharge, initial_guess),
     )
+    return power_law_result(params, stage, discharge, training_start, training_end)
 
 
 @st.cache_data
-def fit_polynomial(stage, discharge, fit_degree: int, training_start: datetime, training_end: datetime):
-    """Fit a polynomial model of given degree to the stage and discharge data."""
-    params = np.polyfit(stage, discharge, fit_degree)
-    model = np.poly1d(params)
-    stage_fit = np.linspace(stage.min(), stage.max(), 100)
-    discharge_fit = model(stage_fit)
-    label = f"Fit: {model}"
-    rmse = calculate_rmse(discharge, model(stage))
-    return FitResult(
-        model,
-        stage_fit,
-        discharge_fit,
-        label,
-        rmse,
-        discharge.min(),
-        discharge.max(),
-        training_start=training_start,
-        training_end=training_end,
+def fit_polynomial(water_data: DatasetHandle, fit_degree: int, training_start: datetime, training_end: datetime):
+    """Fit a polynomial model of given degree to the stage and discharge data in the training range."""
+    stage, discharge = training_data(water_data, training_start, training_end)
+    params = get_fit_cache().get_or_fit(
+        water_data.fingerprint,
+        f"polynomial-{fit_degree}",
+        training_start,
+        training_end,
+        lambda _: np.polyfit(stage, discharge, fit_degree),
     )
+    return polynomial_result(params, stage, discharge, training_start, training_end)
 
 
 DATA_PATH = Path(__file__).parent.parent / "static_data" / "waterdata2008.tsv"
 
 
 @st.cache_data
-def load_water_data():
-    """Load water data from CSV file and return as DataFrame with necessary processing and normalization."""
-
-    df = pd.read_csv(DATA_PATH, sep="\t", dtype=str, low_memory=False)
-    df["date"] = pd.to_datetime(df["datetime"])
-    df["discharge_rate"] = df["148640_00060_00003"].astype(float)
-    df["stage_val"] = df["148641_00065_00003"].astype(float)
-    # Normalize the stage and discharge values
-    df["stage_val_norm"] = (df["stage_val"] - df["stage_val"].min()) / (df["stage_val"].max() - df["stage_val"].min())
-    df["discharge_rate_norm"] = (df["discharge_rate"] - df["discharge_rate"].min()) / (
-        df["discharge_rate"].max() - df["discharge_rate"].min()
+def rolling_fit(water_data: DatasetHandle, model: str, window_days: int, stride_days: int, degree: int) -> RollingFits:
+    """Fit a model over sliding windows of the data, keeping power law windows in the fit cache."""
+    return rolling_fits(
+        WaterSeries(water_data.data),
+        model,
+        window_days,
+        stride_days,
+        degree=degree,
+        fit_cache=get_fit_cache(),
+        dataset=water_data.fingerprint,
     )
-    df = df.sort_values(by=["date"])
 
-    return df
+
+# the most window curves drawn on the rating curve chart; windows are skipped evenly past this
+MAX_ROLLING_CURVES = 50
+
+
+def show_rolling_fits(rolling: RollingFits):
+    """Plot each parameter and the RMSE over time, and the windows' rating curves colored from oldest to newest."""
+    parameters = rolling.parameters
+    midpoints = parameters["Window Start"] + (parameters["Window End"] - parameters["Window Start"]) / 2
+    rows = [*rolling.parameter_names, "RMSE"]
+    parameter_fig = make_subplots(rows=len(rows), cols=1, shared_xaxes=True, subplot_titles=rows)
+    for row, name in enumerate(rows, start=1):
+        parameter_fig.add_trace(go.Scatter(x=midpoints, y=parameters[name], mode="lines", name=name), row=row, col=1)
+    if rolling.model == "power-law":
+        # a varies over orders of magnitude as it trades off against b
+        parameter_fig.update_yaxes(type="log", row=1, col=1)
+    parameter_fig.update_layout(height=200 * len(rows), showlegend=False, title="Parameters by window midpoint")
+    st.plotly_chart(parameter_fig, use_container_width=True)
+
+    curves_fig = go.Figure()
+    step = -(-len(rolling.fits) // MAX_ROLLING_CURVES)
+    fits = rolling.fits[::step]
+    colors = sample_colorscale("Viridis", np.linspace(0, 1, len(fits)))
+    for fit, color in zip(fits, colors):
+        curves_fig.add_trace(
+            go.Scatter(
+                x=fit.stage_fit,
+                y=fit.discharge_fit,
+                mode="lines",
+                line=dict(color=color),
+                name=f"{fit.training_start:%Y-%m-%d} to {fit.training_end:%Y-%m-%d}",
+            )
+        )
+    curves_fig.update_layout(
+        xaxis_title="Stage (f)",
+        yaxis_title="Discharge (f^3/s)",
+        title="Rating curve by window, oldest to newest",
+        showlegend=False,
+    )
+    st.plotly_chart(curves_fig, use_container_width=True)
+    st.dataframe(parameters, hide_index=True)
+
+
+@st.cache_resource
+def get_water_dataset() -> DatasetHandle:
+    """Fingerprint the water data once, so cached fits key on the handle instead of hashing the data."""
+    return DatasetHandle.from_dataframe(load_water_data(DATA_PATH))
 
 
 # @st.cache_data
@@ -1,64 +1,251 @@
 import json
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 from auth_helpers import set_page_config
-from page_helpers import item_paginator, reset_paginator
+from column_expressions import ExpressionError, compile_expression
+from columnar_files import (
+    ColumnFilter,
+    ColumnFilterError,
+    columnar_format,
+    matching_row_groups,
+    parse_column_filters,
+    read_columnar_info,
+    read_columnar_upload,
+)
+from common_settings import AppSettings
+from data_explorer_helpers import (
+    EXPORT_FORMATS,
+    ColumnProfile,
+    GroupIndex,
+    IncrementalRowFilter,
+    ParsedUploadCache,
+    RowSearchIndex,
+    RowWindows,
+    profile_column,
+    profile_columns,
+    restrict_permutation,
+    sort_permutation,
+    sort_ranks,
+    write_export,
+)
+from dataset_diff import DatasetDiff, diff_datasets
+from humanize import naturalsize
+from lazy_dataset import LazyDataset, write_upload_as_arrow
+from page_helpers import (
+    CSV_DELIMITERS,
+    DatasetHandle,
+    SampleReport,
+    convert_string_data,
+    item_paginator,
+    iter_csv_chunks,
+    iter_upload_chunks,
+    load_data_from_file,
+    load_data_from_files,
+    reset_paginator,
+)
+from sketches import DatasetSketch, ReservoirSample
 
 set_page_config("Data Explorer", requires_auth=True)
 
+UPLOAD_TYPES = ["csv", "tsv", "xls", "xlsx", "json", "parquet", "arrow", "feather"]
+SOURCE_COLUMN = "Source"
+PREVIEW_ROWS = 100
+EXPORT_CHUNK_ROWS = 100_000
+DIFF_PREVIEW_ROWS = 1_000
+
+
+@st.cache_resource
+def get_upload_cache():
+    settings = AppSettings()
+    return ParsedUploadCache(settings.upload_cache_dir, max_bytes=settings.upload_cache_max_mb * 1024 * 1024)
+
+
+@st.cache_resource(max_entries=4)
+def get_search_index(dataset: DatasetHandle) -> RowSearchIndex:
+    return RowSearchIndex(dataset)
+
+
+@st.cache_resource(max_entries=8)
+def get_column_profiles(
+    view: DatasetHandle, _dataset: Optional[DatasetHandle] = None, _rows: Optional[np.ndarray] = None
+) -> Dict[str, ColumnProfile]:
+    """Profile every column once per dataset, or per filtered view of one, gathering the view's rows only then."""
+    return profile_columns(view if _rows is None else _dataset.data.iloc[_rows])
+
+
+@st.cache_resource(max_entries=4)
+def get_dataset_sketch(dataset: DatasetHandle, _ingestion_sketch: Optional[DatasetSketch] = None) -> DatasetSketch:
+    """Prefer the sketch built while the upload was read; otherwise, or after a restart, sketch the loaded data."""
+    if _ingestion_sketch is not None and _ingestion_sketch.num_rows:
+        return _ingestion_sketch
+    return DatasetSketch.from_dataframe(dataset.data)
+
+
+@st.cache_resource(max_entries=16)
+def get_derived_column(dataset: DatasetHandle, expression: str) -> pd.Series:
+    """Evaluate a compiled column expression once per dataset and expression text."""
+    return compile_expression(expression)(dataset.data)
+
+
+def get_row_filter(dataset: DatasetHandle) -> IncrementalRowFilter:
+    """Return this session's row filter for the dataset, which remembers the previous filter's result."""
+    search_index = get_search_index(dataset)
+    row_filter = st.session_state.get("DataExplorer#row_filter")
+    if row_filter is None or row_filter.index is not search_index:
+        row_filter = st.session_state["DataExplorer#row_filter"] = IncrementalRowFilter(search_index)
+    return row_filter
+
+
+@st.cache_resource(max_entries=32)
+def get_sort_ranks(dataset: DatasetHandle, column: str) -> np.ndarray:
+    return sort_ranks(dataset.data[column])
 
-# Function to load data
-def load_data(file):
-    # Load the data
-    if file.type == "text/csv":
-        data = pd.read_csv(file, dtype=str, low_memory=False)
-    elif file.type == "text/tab-separated-values":
-        data = pd.read_csv(file, dtype=str, low_memory=False, sep="\t")
-    elif (
-        file.type == "application/vnd.ms-excel"
-        or file.type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    ):
-        data = pd.read_excel(file, dtype=str)
-    elif file.type == "application/json":
-        data = pd.read_json(file, dtype=str)
-    elif file.type == "application/octet-stream":  # Assuming this is a Parquet file
-        data = pd.read_parquet(file, dtype=str)
-    else:
-        raise RuntimeError(f"Unknown / unsupported file type {file.type}")
 
-    return data.replace({np.NAN: None})
+@st.cache_resource(max_entries=16)
+def get_sort_permutation(dataset: DatasetHandle, sort_by_columns: tuple) -> np.ndarray:
+    """Sort the whole dataset once per column tuple; filtered views reuse the permutation."""
+    return sort_permutation([get_sort_ranks(dataset, column) for column in sort_by_columns])
 
 
-@st.cache_data
-def filter_and_group_and_sort(data, filter_text, group_by_columns, sort_by_columns):
-    filtered_df = (
-        data[data.astype(str).apply(lambda x: x.str.contains(filter_text, case=False)).any(axis=1)]
-        if filter_text
-        else data
+@st.cache_data(max_entries=16)
+def filtered_and_sorted_rows(
+    dataset: DatasetHandle, filter_text, sort_by_columns, filter_regex=False, _row_filter=None, _permutation=None
+) -> Optional[np.ndarray]:
+    """Return the positions of the rows matching the filter in sorted order, or None for every row unsorted."""
+    rows = _row_filter.search(filter_text, regex=filter_regex) if filter_text else None
+
+    if sort_by_columns:
+        order = restrict_permutation(_permutation, rows)
+        rows = order if rows is None else rows[order]
+
+    return rows
+
+
+def filter_and_sort(
+    dataset: DatasetHandle, filter_text, sort_by_columns, filter_regex=False
+) -> Tuple[DatasetHandle, Optional[np.ndarray]]:
+    """Return a handle fingerprinting the filtered, sorted view, and the positions of its rows in ``dataset``.
+
+    The view's rows aren't gathered: callers take the ones they show by position. Without a filter or sort, the
+    handle is ``dataset`` itself and the positions are None.
+    """
+    row_filter = get_row_filter(dataset) if filter_text else None
+    permutation = get_sort_permutation(dataset, tuple(sort_by_columns)) if sort_by_columns else None
+    try:
+        rows = filtered_and_sorted_rows(
+            dataset, filter_text, sort_by_columns, filter_regex, _row_filter=row_filter, _permutation=permutation
+        )
+    except pa.ArrowInvalid as e:
+        # an invalid regular expression; show every row until it's fixed
+        st.error(str(e))
+        return filter_and_sort(dataset, "", sort_by_columns)
+    if rows is None:
+        return dataset, None
+    return dataset.derive(None, filter_text, filter_regex, tuple(sort_by_columns)), rows
+
+
+def view_rows(dataset: DatasetHandle, rows: Optional[np.ndarray], start: int, stop: int) -> pd.DataFrame:
+    """Gather rows ``start`` up to ``stop`` of a view from `filter_and_sort`."""
+    return dataset.data.iloc[start:stop] if rows is None else dataset.data.iloc[rows[start:stop]]
+
+
+@st.cache_resource(max_entries=8)
+def get_group_index(
+    view: DatasetHandle, group_by_columns: tuple, sort_by_columns: tuple, _dataset: DatasetHandle, _rows
+) -> GroupIndex:
+    """Group the rows of a filtered, sorted view once per view, grouping and sort."""
+    # rows arrive already sorted, so only sorts on the group keys are left to reorder the groups
+    return GroupIndex.build(
+        _dataset, group_by_columns, [column for column in sort_by_columns if column in group_by_columns], _rows
     )
 
+
+@st.cache_resource(max_entries=8)
+def get_row_windows(
+    view: DatasetHandle, group_by_columns: tuple, sort_by_columns: tuple, window_size: int, _dataset, _rows
+) -> RowWindows:
     if group_by_columns:
-        filtered_df = group_by_data(filtered_df, group_by_columns).aggregate(list)
+        groups = get_group_index(view, group_by_columns, sort_by_columns, _dataset, _rows)
+        return RowWindows(groups.records, len(groups), window_size)
+    num_rows = len(_dataset.data) if _rows is None else len(_rows)
+    return RowWindows(lambda start, stop: view_rows(_dataset, _rows, start, stop), num_rows, window_size)
+
+
+def show_row_windows(windows: RowWindows):
+    """Page through a result one window of rows at a time."""
+
+    def _display_window(idx: int):
+        start, stop = windows.bounds(idx)
+        st.caption(f"Rows {start + 1:,} to {stop:,} of {windows.num_rows:,}")
+        st.dataframe(windows.window(idx))
+
+    item_paginator("Dataframe", windows.num_windows, _display_window)
+
+
+def show_export(windows: RowWindows):
+    """Offer the rows behind ``windows`` as a download, encoded a chunk at a time when the user asks for it."""
+    export_format = st.selectbox("Export format", list(EXPORT_FORMATS))
+    extension, mime_type = EXPORT_FORMATS[export_format]
+    if windows.num_rows == 0:
+        st.caption("No rows to export")
+    elif st.button(f"Prepare {windows.num_rows:,} rows as {export_format}"):
+        # Streamlit needs the whole payload for a download, so the chunks are encoded into a temporary file first
+        with st.spinner("Encoding rows"), tempfile.TemporaryFile() as sink:
+            write_export(windows.chunks(EXPORT_CHUNK_ROWS), sink, export_format)
+            sink.seek(0)
+            data = sink.read()
+        st.download_button(
+            f"Download {extension} ({naturalsize(len(data))})",
+            data,
+            file_name=f"data_explorer_export.{extension}",
+            mime=mime_type,
+        )
+
+
+def window_size_input() -> int:
+    return st.number_input("Rows per window", min_value=10, max_value=10_000, value=100, step=10)
 
-    if sort_by_columns:
-        filtered_df = filtered_df.sort_values(sort_by_columns)
 
-    return filtered_df
+@st.cache_data(max_entries=8)
+def describe_dataset(dataset: DatasetHandle) -> pd.DataFrame:
+    return dataset.data.describe()
 
 
 # Function to display data
-def display_data(df):
+def display_data(dataset: DatasetHandle):
+    df = dataset.data
     if st.checkbox("Create Column"):
         column_name = st.text_input("col_name")
-        eval_this = st.text_input("EVAL input")
-        if column_name and eval_this:
-            df[column_name] = eval(eval_this)
+        expression = st.text_input(
+            "Expression",
+            help="Arithmetic, comparisons, `and`/`or`/`not`, `a if condition else b` and functions such as "
+            "`upper(name)` or `year(date)`. Quote column names containing spaces in backticks.",
+        )
+        if column_name and expression:
+            try:
+                derived_column = get_derived_column(dataset, expression)
+                df = df.copy(deep=False)  # the loaded data may be shared by other sessions
+                df[column_name] = derived_column
+            except ExpressionError as e:
+                st.error(f"Could not create column: {e}")
+            else:
+                # the derived column is part of the dataset from here on, so later caches must key on it too
+                dataset = dataset.derive(df, column_name, expression)
+
+    view, rows = dataset, None
 
     if st.checkbox("Row Explorer", on_change=reset_paginator, args=("Row Explorer",)):
+        show_sampled_label(dataset)
         # reset the paginator when filtering changes
         filter_text = st.text_input("Filter rows", on_change=reset_paginator, args=("Row Explorer",))
+        filter_regex = st.checkbox("Filter is a regular expression", on_change=reset_paginator, args=("Row Explorer",))
         group_by_columns = st.multiselect(
             "Select columns to group by", df.columns, on_change=reset_paginator, args=("Row Explorer",)
         )
@@ -70,21 +257,30 @@ def display_data(df):
             "Select columns to sort by", df.columns, on_change=reset_paginator, args=("Row Explorer",)
         )
 
-        filtered_df = filter_and_group_and_sort(df, filter_text, group_by_columns, sort_by_columns)
+        view, rows = filter_and_sort(dataset, filter_text, sort_by_columns, filter_regex)
+        if group_by_columns:
+            groups = get_group_index(view, tuple(group_by_columns), tuple(sort_by_columns), dataset, rows)
+        else:
+            groups = None
 
         if st.checkbox("Show dataframe"):
-            number = st.number_input("Number of rows to view", min_value=1, value=50)
-            st.dataframe(filtered_df.head(number))
+            window_size = window_size_input()
+            show_row_windows(
+                get_row_windows(view, tuple(group_by_columns), tuple(sort_by_columns), window_size, dataset, rows)
+            )
 
-        df = filtered_df
+        if st.checkbox("Export rows"):
+            show_export(get_row_windows(view, tuple(group_by_columns), tuple(sort_by_columns), 100, dataset, rows))
 
         def _display_row(idx: int):
             st.subheader(f"Row {idx + 1}")
-            row_data = filtered_df.iloc[idx]
+            if groups is None:
+                row_data = view_rows(dataset, rows, idx, idx + 1).iloc[0].to_dict()
+            else:
+                row_data = groups.group_record(idx)
 
             display_data = {}
-            for column in df.columns:
-                data = row_data[column]
+            for column, data in row_data.items():
                 if autogroup_single_value_lists:
                     if isinstance(data, list) and len(set(data)) == 1:
                         data = data[0]
@@ -92,28 +288,33 @@ def display_data(df):
 
             st.code(json.dumps(display_data, indent=2, default=str))
 
-        item_paginator("Row Explorer", filtered_df.shape[0], _display_row, enable_keypress_nav=True)
+        num_rows = len(df) if rows is None else len(rows)
+        item_count = num_rows if groups is None else len(groups)
+        item_paginator("Row Explorer", item_count, _display_row, enable_keypress_nav=True)
         st.divider()
 
     if st.checkbox("Column Explorer", on_change=reset_paginator, args=("Column Explorer",)):
+        show_sampled_label(dataset)
         # Function to display an individual column item
+        profiles = get_column_profiles(view, dataset, rows)
+
         def _display_column(idx: int):
             column_name = df.columns.tolist()[idx]
-            column_data = df[column_name]
-            column_count = len(column_data)
-            unique_items = column_data.nunique()
+            profile = profiles[column_name]
             st.subheader(f"Column {column_name}")
-            st.write("Count:", column_count)
-            st.write("Unique Items:", unique_items)
+            st.write("Count:", profile.count)
+            st.write("Unique Items:", profile.distinct)
+            st.write("Missing Values:", profile.nulls)
+            st.write("Min:", str(profile.min), "Max:", str(profile.max))
 
             if st.checkbox("Show unique items"):
-                column_data = column_data.astype(str)
-                unique_items, item_counts = np.unique(column_data, return_counts=True)
-                unique_items_df = pd.DataFrame({"Unique Items": unique_items, "Count": item_counts})
+                unique_items_df = pd.DataFrame(
+                    {"Unique Items": profile.value_counts.index.astype(str), "Count": profile.value_counts.values}
+                )
                 st.dataframe(unique_items_df)
 
             if st.checkbox("Show all values"):
-                st.write(column_data)
+                st.write(df[column_name] if rows is None else df[column_name].iloc[rows])
 
         item_paginator(
             "Column Explorer", df.columns.tolist(), _display_column, enable_keypress_nav=True, display_item_names=True
@@ -122,61 +323,520 @@ def display_data(df):
 
 
 # Function to show column details
-def show_details(df):
+def _profile_details(profile: ColumnProfile) -> dict:
+    return {
+        "Column Name": profile.name,
+        "Data Type": profile.dtype,
+        "Inferred Type": profile.inferred_type,
+        "Unique Items": profile.distinct,
+        "Missing Values": profile.nulls,
+        "Every Value Unique": profile.is_unique,
+        "Most Common Item": None if profile.most_common is None else str(profile.most_common),
+    }
+
+
+def show_exact_column_details(columns: List[str], exact_details_fn: Callable[[str], dict]):
+    """Let the user compute exact statistics for a single column while approximate stats are shown."""
+    column = st.selectbox("Exact stats for column", columns)
+    if st.button("Compute exact stats") and column is not None:
+        st.dataframe(pd.DataFrame([exact_details_fn(column)]))
+
+
+def show_details(dataset: DatasetHandle, approximate: bool = False, ingestion_sketch: Optional[DatasetSketch] = None):
+    df = dataset.data
+    if approximate:
+        sketch = get_dataset_sketch(dataset, ingestion_sketch)
+        missing_values = sum(column.nulls for column in sketch.columns.values())
+    else:
+        profiles = get_column_profiles(dataset)
+        missing_values = sum(profile.nulls for profile in profiles.values())
+    num_rows = df.shape[0]
+    sample_report: Optional[SampleReport] = df.attrs.get("sample_report")
+    if sample_report is not None:
+        # rows and missing values are counted over the whole upload; everything else describes the sample
+        num_rows, missing_values = sample_report.num_rows, sum(sample_report.null_counts.values())
     st.subheader("Data Details")
-    st.write("Rows: ", df.shape[0], "Columns: ", df.shape[1], "Missing values: ", df.isnull().sum().sum())
+    st.write("Rows: ", num_rows, "Columns: ", df.shape[1], "Missing values: ", missing_values)
+    show_sampled_label(dataset)
 
     if st.checkbox("Show column details"):
-        column_names = df.columns.tolist()
-        column_types = [df[column].dtype for column in column_names]
-        unique_counts = [df[column].nunique() for column in column_names]
-        is_unique = [count == df.shape[0] for count in unique_counts]
-        most_common = []
-        for column in column_names:
-            if df[column].nunique() > 0:
-                most_common.append(df[column].value_counts().idxmax())
-            else:
-                most_common.append(None)
-        details_df = pd.DataFrame(
-            {
-                "Column Name": column_names,
-                "Data Type": column_types,
-                "Unique Items": unique_counts,
-                "Every Value Unique": is_unique,
-                "Most Common Item": most_common,
-            }
-        )
-        st.dataframe(details_df)
+        if approximate:
+            details = sketch.details()
+        else:
+            details = pd.DataFrame([_profile_details(profile) for profile in profiles.values()])
+        if sample_report is not None:
+            details["Missing Values"] = details["Column Name"].map(sample_report.null_counts)
+        st.dataframe(details)
+        if approximate:
+            show_exact_column_details(
+                df.columns.tolist(), lambda column: _profile_details(profile_column(column, df[column]))
+            )
         st.divider()
 
 
 # Function to show basic statistics
-def basic_stats(df):
+def basic_stats(dataset: DatasetHandle):
     if st.checkbox("Show basic stats"):
-        st.table(df.describe())
+        show_sampled_label(dataset)
+        st.table(describe_dataset(dataset))
         st.divider()
 
 
-def group_by_data(data, group_by_columns):
-    grouped_data = data.groupby(group_by_columns, as_index=False)
-    return grouped_data
+@st.cache_resource(max_entries=4)
+def get_lazy_dataset(dataset_key: str, path: Path) -> LazyDataset:
+    dataset = LazyDataset(path)
+    get_upload_cache().hold(dataset_key, dataset)
+    return dataset
+
+
+@st.cache_data(max_entries=16)
+def lazy_filtered_count(dataset_key: str, filter_text: str, filter_regex: bool, _dataset: LazyDataset) -> int:
+    return _dataset.count(_dataset.filter_expression(filter_text, filter_regex))
+
+
+@st.cache_data(max_entries=8)
+def lazy_filtered_positions(dataset_key: str, filter_text: str, filter_regex: bool, _dataset: LazyDataset):
+    """Return the positions of the rows matching the filter, or None without a filter, for every row."""
+    if not filter_text:
+        return None
+    return _dataset.filtered_positions(_dataset.filter_expression(filter_text, filter_regex))
+
+
+@st.cache_data(max_entries=8)
+def lazy_sorted_positions(dataset_key, filter_text, filter_regex, sort_by_columns, _dataset: LazyDataset):
+    return _dataset.sorted_positions(
+        sort_by_columns, lazy_filtered_positions(dataset_key, filter_text, filter_regex, _dataset)
+    )
+
+
+def lazy_row_positions(dataset_key, filter_text, filter_regex, sort_by_columns, dataset: LazyDataset):
+    """Return the positions of the rows to show, in order, or None to show every row in file order."""
+    if sort_by_columns:
+        return lazy_sorted_positions(dataset_key, filter_text, filter_regex, sort_by_columns, dataset)
+    return lazy_filtered_positions(dataset_key, filter_text, filter_regex, dataset)
+
+
+@st.cache_data(max_entries=8)
+def lazy_group_counts(dataset_key, filter_text, filter_regex, group_by_columns, sort_by_columns, _dataset):
+    return _dataset.group_counts(
+        group_by_columns, _dataset.filter_expression(filter_text, filter_regex), sort_by=sort_by_columns
+    )
+
+
+@st.cache_resource(max_entries=8)
+def get_lazy_row_windows(
+    dataset_key, filter_text, filter_regex, group_by_columns, sort_by_columns, window_size, _dataset: LazyDataset
+) -> RowWindows:
+    if group_by_columns:
+        groups_df = lazy_group_counts(
+            dataset_key, filter_text, filter_regex, group_by_columns, sort_by_columns, _dataset
+        )
+        return RowWindows(lambda start, stop: groups_df.iloc[start:stop], len(groups_df), window_size)
+
+    positions = lazy_row_positions(dataset_key, filter_text, filter_regex, sort_by_columns, _dataset)
+    if positions is not None:
+        return RowWindows(lambda start, stop: _dataset.rows(positions[start:stop]), len(positions), window_size)
+    return RowWindows(
+        lambda start, stop: _dataset.rows(np.arange(start, stop)),
+        lazy_filtered_count(dataset_key, "", False, _dataset),
+        window_size,
+    )
+
+
+@st.cache_data(max_entries=4)
+def lazy_describe(dataset_key: str, _dataset: LazyDataset) -> pd.DataFrame:
+    return _dataset.describe()
+
+
+@st.cache_resource(max_entries=4)
+def get_lazy_dataset_sketch(dataset_key: str, _dataset: LazyDataset, _ingestion_sketch: DatasetSketch):
+    """Prefer the sketch built while the upload was spilled; after a restart, rebuild it from the file."""
+    if _ingestion_sketch.num_rows:
+        return _ingestion_sketch
+    return _dataset.sketch()
+
+
+@st.cache_data(max_entries=64)
+def lazy_column_summary(dataset_key: str, column: str, _dataset: LazyDataset) -> dict:
+    return _dataset.column_summary(column)
+
+
+@st.cache_data(max_entries=16)
+def lazy_value_counts(dataset_key: str, column: str, _dataset: LazyDataset) -> pd.DataFrame:
+    return _dataset.value_counts(column)
+
+
+def show_lazy_details(dataset: LazyDataset, dataset_key: str, sketch: Optional[DatasetSketch] = None):
+    st.subheader("Data Details")
+    st.write("Rows: ", lazy_filtered_count(dataset_key, "", False, dataset), "Columns: ", len(dataset.columns))
+
+    def _exact_details(column: str) -> dict:
+        return {"Column Name": column, "Data Type": str(dataset.schema.field(column).type)} | lazy_column_summary(
+            dataset_key, column, dataset
+        )
+
+    if st.checkbox("Show column details"):
+        if sketch is not None:
+            st.dataframe(sketch.details())
+            show_exact_column_details(dataset.columns, _exact_details)
+        else:
+            st.dataframe(pd.DataFrame([_exact_details(column) for column in dataset.columns]))
+        st.divider()
+
+
+def display_lazy_data(dataset: LazyDataset, dataset_key: str):
+    if st.checkbox("Row Explorer", on_change=reset_paginator, args=("Row Explorer",)):
+        filter_text = st.text_input("Filter rows", on_change=reset_paginator, args=("Row Explorer",))
+        filter_regex = st.checkbox("Filter is a regular expression", on_change=reset_paginator, args=("Row Explorer",))
+        group_by_columns = st.multiselect(
+            "Select columns to group by", dataset.columns, on_change=reset_paginator, args=("Row Explorer",)
+        )
+        sort_by_columns = st.multiselect(
+            "Select columns to sort by", dataset.columns, on_change=reset_paginator, args=("Row Explorer",)
+        )
+        try:
+            filter_expression = dataset.filter_expression(filter_text, filter_regex)
+        except pa.ArrowInvalid as e:
+            # an invalid regular expression; show every row until it's fixed
+            st.error(str(e))
+            filter_text, filter_expression = "", None
+
+        if st.checkbox("Show dataframe"):
+            windows = get_lazy_row_windows(
+                dataset_key,
+                filter_text,
+                filter_regex,
+                tuple(group_by_columns),
+                tuple(sort_by_columns),
+                window_size_input(),
+                dataset,
+            )
+            show_row_windows(windows)
+
+        if st.checkbox("Export rows"):
+            show_export(
+                get_lazy_row_windows(
+                    dataset_key,
+                    filter_text,
+                    filter_regex,
+                    tuple(group_by_columns),
+                    tuple(sort_by_columns),
+                    100,
+                    dataset,
+                )
+            )
+
+        if group_by_columns:
+            groups_df = lazy_group_counts(
+                dataset_key, filter_text, filter_regex, group_by_columns, sort_by_columns, dataset
+            )
+
+            def _display_group(idx: int):
+                group_key = groups_df.iloc[idx][group_by_columns].to_dict()
+                st.subheader(f"Group {idx + 1}")
+                st.code(json.dumps(group_key, indent=2, default=str))
+                st.write("Rows:", groups_df.iloc[idx]["Rows"])
+                st.dataframe(dataset.group_rows(group_key, limit=100, filter=filter_expression))
+
+            item_paginator("Row Explorer", groups_df.shape[0], _display_group, enable_keypress_nav=True)
+        else:
+            positions = lazy_row_positions(dataset_key, filter_text, filter_regex, sort_by_columns, dataset)
+            row_count = lazy_filtered_count(dataset_key, "", False, dataset) if positions is None else len(positions)
+
+            def _display_row(idx: int):
+                st.subheader(f"Row {idx + 1}")
+                position = idx if positions is None else positions[idx]
+                row_data = dataset.rows([position]).iloc[0]
+                st.code(json.dumps(row_data.to_dict(), indent=2, default=str))
+
+            item_paginator("Row Explorer", row_count, _display_row, enable_keypress_nav=True)
+        st.divider()
+
+    if st.checkbox("Column Explorer", on_change=reset_paginator, args=("Column Explorer",)):
+
+        def _display_column(idx: int):
+            column_name = dataset.columns[idx]
+            summary = lazy_column_summary(dataset_key, column_name, dataset)
+            st.subheader(f"Column {column_name}")
+            st.write("Count:", summary["Count"])
+            st.write("Unique Items:", summary["Unique Items"])
+
+            if st.checkbox("Show unique items"):
+                st.dataframe(lazy_value_counts(dataset_key, column_name, dataset))
+
+        item_paginator(
+            "Column Explorer", dataset.columns, _display_column, enable_keypress_nav=True, display_item_names=True
+        )
+        st.divider()
+
+
+@st.cache_resource(max_entries=2)
+def load_combined_uploads(upload_key: str, all_strings: bool, _files) -> DatasetHandle:
+    """Parse several uploads into one dataset, once per set of files and parse options."""
+    data = load_data_from_files(_files, all_strings=all_strings, source_column=SOURCE_COLUMN)
+    return DatasetHandle(upload_key, data)
+
+
+def show_ingestion_timings(data: pd.DataFrame):
+    timings = data.attrs.get("ingestion_timings", [])
+    st.caption(f"Parsed {len(timings)} files and sheets in {data.attrs.get('ingestion_seconds', 0):.2f}s")
+    with st.expander("Parse timings"):
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "Source": [timing.source for timing in timings],
+                    "Rows": [timing.rows for timing in timings],
+                    "Seconds": [timing.seconds for timing in timings],
+                }
+            )
+        )
+
+
+def stream_csv_upload(file, all_strings: bool, sketch: Optional[DatasetSketch] = None) -> pd.DataFrame:
+    """Parse a CSV or TSV upload a chunk at a time, showing a preview, row count and profile while it loads.
+
+    The profile is approximate (see `sketches.DatasetSketch`) and updated after every chunk; all of the progress
+    display is cleared once the whole file has been read. Pass a ``sketch`` to keep it for the approximate stats.
+    """
+    progress = st.progress(0.0, text=f"Reading {file.name}")
+    preview = st.empty()
+    profile = st.empty()
+    sketch = DatasetSketch() if sketch is None else sketch
+    chunks = []
+    for chunk, fraction in iter_csv_chunks(file):
+        if not chunks:
+            with preview.container():
+                st.caption(f"First {min(len(chunk), PREVIEW_ROWS)} rows, while the rest loads")
+                st.dataframe(chunk.head(PREVIEW_ROWS))
+        chunks.append(chunk)
+        sketch.update_frame(chunk)
+        progress.progress(fraction, text=f"Read {sketch.num_rows:,} rows of {file.name} ({fraction:.0%})")
+        profile.dataframe(sketch.details(), hide_index=True)
+
+    progress.progress(1.0, text=f"Read {sketch.num_rows:,} rows; inferring column types")
+    data = convert_string_data(pd.concat(chunks, ignore_index=True), all_strings=all_strings)
+    # the chunks were sketched as text; report the types they were converted to
+    for name, dtype in data.dtypes.items():
+        sketch.columns[str(name)].dtype = str(dtype)
+    for placeholder in (progress, preview, profile):
+        placeholder.empty()
+    return data
+
+
+def sample_upload(
+    file,
+    sample_rows: int,
+    all_strings: bool,
+    columns: Optional[List[str]] = None,
+    filters: Tuple[ColumnFilter, ...] = (),
+) -> pd.DataFrame:
+    """Keep a uniform random sample of ``sample_rows`` rows of an upload, reading it once a chunk at a time.
+
+    The exact row count and missing values per column of the whole upload are stored as a `SampleReport` in
+    ``data.attrs["sample_report"]``.
+    """
+    progress = st.progress(0.0, text=f"Sampling {file.name}")
+    reservoir = ReservoirSample(sample_rows)
+    for chunk, fraction in iter_upload_chunks(file, columns, filters):
+        reservoir.update(chunk)
+        progress.progress(fraction, text=f"Read {reservoir.num_rows:,} rows of {file.name} ({fraction:.0%})")
+    progress.empty()
+
+    data = reservoir.sample()
+    if columnar_format(file) is None:
+        data = convert_string_data(data, all_strings=all_strings)
+    data.attrs["sample_report"] = SampleReport(reservoir.num_rows, len(data), reservoir.null_counts)
+    return data
+
+
+def show_sampled_label(dataset: DatasetHandle):
+    if report := dataset.data.attrs.get("sample_report"):
+        st.caption(f"Sampled: showing {report.sample_rows:,} randomly chosen rows of {report.num_rows:,}")
+
+
+def columnar_read_options(file) -> Tuple[Optional[List[str]], List[ColumnFilter]]:
+    """Let the user pick which columns and rows of a Parquet or Arrow/Feather upload to read.
+
+    Returns:
+        Tuple[Optional[List[str]], List[ColumnFilter]]: The columns to read (None for all of them) and row filters.
+    """
+    info = read_columnar_info(file)
+    with st.expander(f"{info.format.title()} file: {info.num_rows:,} rows in {info.num_row_groups} row groups"):
+        st.dataframe(
+            pd.DataFrame({"Column": info.schema.names, "Type": [str(field.type) for field in info.schema]}),
+            hide_index=True,
+        )
+        columns = st.multiselect("Columns to load", info.schema.names, default=info.schema.names)
+        filter_text = st.text_area(
+            "Row filters",
+            help="One `column <op> value` per line, e.g. `year >= 2020`; only rows matching every line are loaded. "
+            "Quote column names in backticks if they contain spaces or operators.",
+        )
+    if not columns:
+        st.warning("Select at least one column to load")
+        st.stop()
+
+    try:
+        filters = parse_column_filters(filter_text)
+        for column_filter in filters:
+            column_filter.expression(info.schema)  # check the column exists and the value fits its type
+        if info.format == "parquet" and filters:
+            st.caption(
+                f"Reading {matching_row_groups(file, filters)} of {info.num_row_groups} row groups "
+                "(the others can't match the filters)"
+            )
+    except ColumnFilterError as e:
+        st.error(str(e))
+        st.stop()
+
+    return (None if len(columns) == len(info.schema.names) else columns), filters
+
+
+@st.cache_resource(max_entries=4)
+def get_dataset_diff(old: DatasetHandle, new: DatasetHandle, key_columns: tuple) -> DatasetDiff:
+    return diff_datasets(old.data, new.data, key_columns)
+
+
+def compare_uploads():
+    """Show which rows were added, removed or changed between two versions of a file."""
+    old_file = st.file_uploader("Upload the old version", type=UPLOAD_TYPES)
+    new_file = st.file_uploader("Upload the new version", type=UPLOAD_TYPES)
+    if old_file is None or new_file is None:
+        return
+
+    # compare values as they appear in the files, so type inference can't differ between the two versions
+    old, new = (
+        DatasetHandle(*get_upload_cache().load(file, load_data_from_file, all_strings=True))
+        for file in (old_file, new_file)
+    )
+    key_columns = st.multiselect(
+        "Key columns",
+        [column for column in new.data.columns if column in old.data.columns],
+        help="Columns that identify a row in both versions. Without them whole rows are matched, so a changed row "
+        "shows up as removed and added.",
+    )
+    diff = get_dataset_diff(old, new, tuple(key_columns))
+
+    added, removed, changed, unchanged = st.columns(4)
+    added.metric("Added rows", f"{len(diff.added_rows):,}")
+    removed.metric("Removed rows", f"{len(diff.removed_rows):,}")
+    changed.metric("Changed rows", f"{len(diff.changed_new_rows):,}")
+    unchanged.metric("Unchanged rows", f"{diff.unchanged_rows:,}")
+    if diff.added_columns:
+        st.write("Added columns:", ", ".join(map(str, diff.added_columns)))
+    if diff.removed_columns:
+        st.write("Removed columns:", ", ".join(map(str, diff.removed_columns)))
+    if diff.duplicate_keys:
+        st.warning(f"{diff.duplicate_keys:,} rows of the new version repeat a key; those are matched in order")
+
+    if key_columns:
+        st.dataframe(
+            pd.DataFrame({"Column": list(diff.column_changes), "Changed Values": list(diff.column_changes.values())}),
+            hide_index=True,
+        )
+        with st.expander(f"Changed values (first {DIFF_PREVIEW_ROWS:,} changed rows)"):
+            st.dataframe(diff.changed_values(old.data, new.data, limit=DIFF_PREVIEW_ROWS), hide_index=True)
+    with st.expander(f"Added rows (first {DIFF_PREVIEW_ROWS:,})"):
+        st.dataframe(new.data.iloc[diff.added_rows[:DIFF_PREVIEW_ROWS]])
+    with st.expander(f"Removed rows (first {DIFF_PREVIEW_ROWS:,})"):
+        st.dataframe(old.data.iloc[diff.removed_rows[:DIFF_PREVIEW_ROWS]])
 
 
 # Main function to control the application
 def main():
     st.title("Data Explorer")
 
+    if st.checkbox("Compare two files", help="Upload two versions of a file to see which rows changed"):
+        compare_uploads()
+        return
+
     # Upload the dataset
-    file = st.file_uploader(
-        "Upload a CSV, Excel, JSON, or Parquet file", type=["csv", "tsv", "xls", "xlsx", "json", "parquet"]
+    combine_files = st.checkbox(
+        "Combine multiple files",
+        help="Upload several files, or workbooks with several sheets, and explore them as one dataset "
+        f"with a {SOURCE_COLUMN!r} column",
+    )
+    if combine_files:
+        files = st.file_uploader(
+            "Upload CSV, Excel, JSON, or Parquet files", type=UPLOAD_TYPES, accept_multiple_files=True
+        )
+        file = None
+    else:
+        files = []
+        file = st.file_uploader("Upload a CSV, Excel, JSON, or Parquet file", type=UPLOAD_TYPES)
+
+    infer_types = st.checkbox("Infer column types", value=True, help="Uncheck to load every column as text")
+    out_of_core = st.checkbox(
+        "Out-of-core mode", help="Query the upload from disk instead of loading it into memory, for very large files"
+    )
+    approximate = st.checkbox(
+        "Approximate stats",
+        help="Estimate distinct counts and most common items with fixed-size sketches; faster for very large files",
+    )
+    streaming = st.checkbox(
+        "Streaming mode",
+        help="Read CSV and TSV uploads in chunks, showing a preview, row count and column profile while they load",
     )
+    sampling = st.checkbox(
+        "Sampling mode",
+        help="Explore a uniform random sample of the rows, taken in one pass over the upload, for a quick look at "
+        "files too large to load. Row and missing value counts are still exact.",
+    )
+    if sampling:
+        sample_rows = st.number_input("Sample rows", min_value=1_000, max_value=1_000_000, value=100_000, step=10_000)
+
+    # Parquet and Arrow files keep their stored types, and can be read a subset of columns and rows at a time
+    columnar = file is not None and columnar_format(file) is not None
+    read_options = {}
+    if columnar:
+        columns, filters = columnar_read_options(file)
+        read_options = {"columns": columns, "filters": filters}
+
+    # when approximate stats are wanted, build the sketch while the upload is read, where it's read in chunks
+    ingestion_sketch = DatasetSketch()
+    if file is not None and out_of_core:
+        writer = partial(write_upload_as_arrow, sketch=ingestion_sketch) if approximate else write_upload_as_arrow
+        dataset_key, path = get_upload_cache().spill(file, writer, all_strings=not infer_types, **read_options)
+        dataset = get_lazy_dataset(dataset_key, path)
+        st.caption("Out-of-core mode: rows are read from disk as they are needed")
+        sketch = get_lazy_dataset_sketch(dataset_key, dataset, ingestion_sketch) if approximate else None
+        show_lazy_details(dataset, dataset_key, sketch)
+        display_lazy_data(dataset, dataset_key)
+        if st.checkbox("Show basic stats"):
+            st.table(lazy_describe(dataset_key, dataset))
+            st.divider()
 
     # Load and display the data
-    if file is not None:
-        data = load_data(file)
-        show_details(data)
-        display_data(data)
-        basic_stats(data)
+    elif file is not None or files:
+        if files:
+            if out_of_core:
+                st.caption("Combined uploads are loaded into memory")
+            upload_key = DatasetHandle.from_uploads(files, all_strings=not infer_types, source_column=SOURCE_COLUMN)
+            dataset = load_combined_uploads(upload_key, not infer_types, files)
+            data = dataset.data
+            show_ingestion_timings(data)
+        else:
+            if sampling:
+                dataset_key, data = get_upload_cache().load(
+                    file, sample_upload, sample_rows=sample_rows, all_strings=not infer_types, **read_options
+                )
+            elif columnar:
+                dataset_key, data = get_upload_cache().load(file, read_columnar_upload, **read_options)
+            elif streaming and file.type in CSV_DELIMITERS:
+                # the sketch shown while the upload streams in also serves the approximate stats
+                loader = partial(stream_csv_upload, sketch=ingestion_sketch)
+                dataset_key, data = get_upload_cache().load(file, loader, all_strings=not infer_types)
+            else:
+                dataset_key, data = get_upload_cache().load(file, load_data_from_file, all_strings=not infer_types)
+            dataset = DatasetHandle(dataset_key, data)
+        if report := data.attrs.get("dtype_report"):
+            st.caption(
+                f"Memory used: {naturalsize(report.bytes_after)} "
+                f"(saved {naturalsize(report.bytes_saved)} over loading every column as text)"
+            )
+        show_details(dataset, approximate, ingestion_sketch)
+        display_data(dataset)
+        basic_stats(dataset)
 
 
 if __name__ == "__main__":
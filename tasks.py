@@ -33,6 +33,12 @@ def run_streamlit(c):
         )
 
 
+@task
+def build_water_store(c):
+    with Paths.cd(c, Paths.repo_root):
+        c.run("PYTHONPATH=shared-src python -m water_data_helpers src/static_data")
+
+
 @task
 def dc_up(c):
     with Paths.cd(c, Paths.repo_root):
@@ -0,0 +1,19 @@
+import io
+
+import pytest
+
+
+class Upload(io.BytesIO):
+    """Stands in for a Streamlit ``UploadedFile``."""
+
+    def __init__(self, content: bytes, name: str, type: str = "text/csv", file_id=None):
+        super().__init__(content)
+        self.name = name
+        self.type = type
+        self.file_id = file_id
+
+
+@pytest.fixture
+def make_upload():
+    """Returns a factory for fake uploads: ``make_upload(content, name, type="text/csv", file_id=None)``."""
+    return Upload
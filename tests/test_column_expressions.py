@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from column_expressions import MAX_REPEAT, MAX_REPEATED_LENGTH, ExpressionError, compile_expression
+
+
+@pytest.fixture
+def data() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "price": [1.5, 2.0, np.nan, 10.0],
+            "qty": [3, 0, 2, 7],
+            "First Name": ["Ann", " bob ", None, "Cy"],
+            "joined": ["2020-01-31", "2021-06-01", "bad", None],
+            "active": [True, False, True, False],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "text, reference",
+    [
+        ("price * qty + 1", lambda df: df["price"] * df["qty"] + 1),
+        ("qty // 2 - qty % 2", lambda df: df["qty"] // 2 - df["qty"] % 2),
+        ("-price ** 2", lambda df: -(df["price"] ** 2)),
+        ("round(price / 3, 2)", lambda df: (df["price"] / 3).round(2)),
+        ("sqrt(abs(qty - 5))", lambda df: np.sqrt((df["qty"] - 5).abs())),
+        ("upper(strip(`First Name`))", lambda df: df["First Name"].str.strip().str.upper()),
+        ("length(`First Name`)", lambda df: df["First Name"].str.len()),
+        ("contains(lower(`First Name`), 'b')", lambda df: df["First Name"].str.lower().str.contains("b")),
+        ("year(joined)", lambda df: pd.to_datetime(df["joined"], errors="coerce").dt.year),
+        ("fillna(price, 0)", lambda df: df["price"].fillna(0)),
+        ("0 < qty <= 3", lambda df: (df["qty"] > 0) & (df["qty"] <= 3)),
+        ("qty if active else -qty", lambda df: df["qty"].where(df["active"], -df["qty"])),
+        ("isnull(price) | (qty > 5)", lambda df: df["price"].isna() | (df["qty"] > 5)),
+        ("2 ** 10", lambda df: pd.Series(1024, index=df.index)),
+    ],
+)
+def test_expression_matches_pandas(data, text, reference):
+    result = compile_expression(text)(data)
+    expected = reference(data)
+    assert result.index.equals(data.index)
+    pd.testing.assert_series_equal(result, expected, check_names=False, check_dtype=False)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("qty and price", [True, False, False, True]),
+        ("qty or `First Name`", [True, True, True, True]),
+        ("not qty", [False, True, False, False]),
+        ("not active and qty > 1", [False, False, False, True]),
+        ("active or price > 5", [True, False, True, True]),
+    ],
+)
+def test_logical_operators_test_truth(data, text, expected):
+    assert compile_expression(text)(data).tolist() == expected
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("import os", "Invalid expression"),
+        ("__import__('os')", "Unknown function"),
+        ("price.__class__", "Unsupported syntax"),
+        ("[x for x in qty]", "Unsupported syntax"),
+        ("round(price, digits=1)", "Unsupported syntax"),
+        ("missing + 1", "Unknown column 'missing'"),
+        ("1 // 0", "division"),
+        ("9 ** 9 ** 9", "too large"),
+        (f"'a' * {MAX_REPEAT + 1}", "repeated"),
+        (f"`First Name` * {MAX_REPEAT + 1}", "repeated"),
+        (f"'a' * {MAX_REPEAT} * {MAX_REPEAT}", "characters long"),
+        (f"{MAX_REPEAT} * (`First Name` * {MAX_REPEAT})", "characters long"),
+        (f"'{'x' * (MAX_REPEATED_LENGTH // MAX_REPEAT + 1)}' * {MAX_REPEAT}", "characters long"),
+        (f"`First Name` * (qty + {MAX_REPEAT})", "repeated"),
+        ("upper('abc')", "needs a column"),
+    ],
+)
+def test_bad_expressions_raise_expression_errors(data, text, message):
+    with pytest.raises(ExpressionError, match=message):
+        compile_expression(text)(data)
+
+
+def test_bounded_operations_still_work(data):
+    assert compile_expression(f"'ab' * {MAX_REPEAT}")(data).iloc[0] == "ab" * MAX_REPEAT
+    assert compile_expression("2 ** 4000")(data).iloc[0] == 2**4000
+    assert compile_expression(f"qty * {MAX_REPEAT + 1}")(data).tolist() == (data["qty"] * (MAX_REPEAT + 1)).tolist()
+    repeated = compile_expression("`First Name` * qty * 2")(data)
+    assert repeated.tolist()[:2] == ["AnnAnnAnnAnnAnnAnn", ""]
+
+
+def test_compiled_expressions_are_cached():
+    assert compile_expression("qty + 1") is compile_expression("qty + 1")
+    assert compile_expression("`First Name`").columns == {"__column_0": "First Name"}
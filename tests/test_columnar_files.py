@@ -0,0 +1,126 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import pytest
+
+from columnar_files import (
+    ColumnFilter,
+    ColumnFilterError,
+    columnar_format,
+    matching_row_groups,
+    parse_column_filters,
+    read_columnar_info,
+    read_columnar_upload,
+    table_to_pandas,
+)
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    num_rows = 1000
+    return pd.DataFrame(
+        {
+            "year": np.repeat(np.arange(2015, 2025), num_rows // 10),
+            "State Code": np.tile(["WA", "OR", "CA", "NV"], num_rows // 4),
+            "value": np.arange(num_rows) / 4,
+            "day": pd.date_range("2020-01-01", periods=num_rows, freq="D").date,
+            "at": pd.date_range("2020-01-01", periods=num_rows, freq="H", tz="UTC"),
+            "local": pd.date_range("2020-01-01", periods=num_rows, freq="H"),
+        }
+    )
+
+
+def _parquet(make_upload, frame: pd.DataFrame, row_group_size: int = 100):
+    sink = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), sink, row_group_size=row_group_size)
+    return make_upload(sink.getvalue(), "x.parquet", "application/octet-stream")
+
+
+def _arrow(make_upload, frame: pd.DataFrame):
+    sink = io.BytesIO()
+    feather.write_feather(frame, sink, compression="uncompressed")
+    return make_upload(sink.getvalue(), "x.feather", "application/octet-stream")
+
+
+def test_parse_column_filters():
+    filters = parse_column_filters("year >= 2020\n\n`State Code` == 'WA'\nname = \"a <= b\"\n  x!=1  ")
+    assert filters == [
+        ColumnFilter("year", ">=", "2020"),
+        ColumnFilter("State Code", "==", "WA"),
+        ColumnFilter("name", "=", "a <= b"),
+        ColumnFilter("x", "!=", "1"),
+    ]
+
+
+@pytest.mark.parametrize("text", ["year", "year >=", "year 2020"])
+def test_parse_column_filters_rejects_incomplete_filters(text):
+    with pytest.raises(ColumnFilterError):
+        parse_column_filters(text)
+
+
+@pytest.mark.parametrize("write", [_parquet, _arrow])
+def test_format_and_info_from_footer(frame, make_upload, write):
+    upload = write(make_upload, frame)
+    info = read_columnar_info(upload)
+    assert info.format == columnar_format(upload)
+    assert info.num_rows == len(frame)
+    assert info.schema.names == frame.columns.tolist()
+    assert columnar_format(make_upload(b"a,b\n1,2\n", "x.csv")) is None
+
+
+@pytest.mark.parametrize("write", [_parquet, _arrow])
+@pytest.mark.parametrize(
+    "filter_text, reference",
+    [
+        ("year >= 2020\n`State Code` == WA", lambda df: (df["year"] >= 2020) & (df["State Code"] == "WA")),
+        ("value < 10.5", lambda df: df["value"] < 10.5),
+        ("day > 2021-06-30", lambda df: df["day"] > pd.Timestamp("2021-06-30").date()),
+        ("at <= 2020-01-02 05:00", lambda df: df["at"] <= pd.Timestamp("2020-01-02 05:00", tz="UTC")),
+        ("at < '2020-01-02T00:00-05:00'", lambda df: df["at"] < pd.Timestamp("2020-01-02 05:00", tz="UTC")),
+        ("local >= 2020-02-01T00:00+01:00", lambda df: df["local"] >= pd.Timestamp("2020-01-31 23:00")),
+    ],
+)
+def test_read_columnar_upload_matches_pandas(frame, make_upload, write, filter_text, reference):
+    data = read_columnar_upload(write(make_upload, frame), filters=parse_column_filters(filter_text))
+    expected = frame[reference(frame)].reset_index(drop=True)
+    assert len(expected) not in (0, len(frame))
+    assert data["value"].tolist() == expected["value"].tolist()
+    assert data["State Code"].tolist() == expected["State Code"].tolist()
+
+
+def test_read_columnar_upload_projects_columns_and_keeps_types(frame, make_upload):
+    data = read_columnar_upload(_parquet(make_upload, frame), columns=["State Code", "at"])
+    assert data.columns.tolist() == ["State Code", "at"]
+    assert data["State Code"].equals(frame["State Code"])
+    assert data["at"].dtype == "datetime64[ns, UTC]"
+    assert data["at"].equals(frame["at"])
+
+
+def test_row_groups_are_pruned_by_statistics(frame, make_upload):
+    upload = _parquet(make_upload, frame, row_group_size=100)
+    assert matching_row_groups(upload, []) == 10
+    assert matching_row_groups(upload, parse_column_filters("year == 2020")) == 1
+    assert matching_row_groups(upload, parse_column_filters("year > 2030")) == 0
+
+
+@pytest.mark.parametrize("filter_text", ["missing == 1", "year == soon", "day > someday"])
+def test_bad_filters_raise_column_filter_errors(frame, make_upload, filter_text):
+    with pytest.raises(ColumnFilterError):
+        read_columnar_upload(_parquet(make_upload, frame), filters=parse_column_filters(filter_text))
+
+
+def test_table_to_pandas_keeps_text_columns_as_they_were_stored():
+    text = pd.DataFrame({"a": pd.Series(["x", None], dtype=object), "n": [1, 2]})
+    data = table_to_pandas(pa.Table.from_pandas(text, preserve_index=False))
+    assert data["a"].dtype == object
+    assert data.equals(text)
+
+    arrow_text = pa.table({"b": pa.array(["y", None], type=pa.large_string()), "n": [1, 2]})
+    data = table_to_pandas(arrow_text)
+    assert data.columns.tolist() == ["b", "n"]
+    assert data["b"].dtype == "string[pyarrow]"
+    assert data["b"].tolist() == ["y", pd.NA]
@@ -0,0 +1,241 @@
+import io
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from data_explorer_helpers import (
+    ROW_TEXT_SEPARATOR,
+    GroupIndex,
+    IncrementalRowFilter,
+    ParsedUploadCache,
+    RowSearchIndex,
+    RowWindows,
+    lowercase_query,
+    profile_column,
+    restrict_permutation,
+    sort_permutation,
+    sort_ranks,
+    write_export,
+)
+
+
+@pytest.fixture
+def people() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    names = ["Smith", "Smithers", "Jones", "Ängström", "de la Cruz", None]
+    return pd.DataFrame(
+        {
+            "name": rng.choice(np.array(names, dtype=object), 500),
+            "team": rng.choice(np.array(["red", "blue", None], dtype=object), 500),
+            "score": rng.integers(0, 50, 500).astype(float),
+            "age": rng.integers(18, 70, 500),
+        }
+    ).assign(score=lambda data: data["score"].where(data["score"] % 7 != 0))
+
+
+def _row_text(data: pd.DataFrame) -> pd.Series:
+    cells = [data[column].astype("string").fillna("").map(lowercase_query) for column in data.columns]
+    return pd.Series([ROW_TEXT_SEPARATOR.join(row) for row in zip(*cells)])
+
+
+@pytest.mark.parametrize("query", ["smith", "SMITH", "ith", "ngstr", "de la", "red", "blue\x1f", "zz", "xyzzy", ""])
+def test_row_search_matches_substring_scan(people, query):
+    expected = np.flatnonzero(_row_text(people).str.contains(query.lower(), regex=False))
+    assert RowSearchIndex(people, chunk_rows=64).search(query).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("query", [r"^smith\x1f", r"\d{2}\.0", "jones|cruz"])
+def test_row_search_regex_matches_scan(people, query):
+    pattern = re.compile(query, flags=re.IGNORECASE)
+    expected = [i for i, text in enumerate(_row_text(people)) if pattern.search(text)]
+    assert RowSearchIndex(people).search(query, regex=True).tolist() == expected
+
+
+def test_row_search_within_rows(people):
+    index = RowSearchIndex(people)
+    rows = np.arange(0, len(people), 3)
+    assert index.search("smith", rows=rows).tolist() == np.intersect1d(index.search("smith"), rows).tolist()
+
+
+@pytest.mark.parametrize("query", ["İstanbul", "istanbul", "ΣΑΣ", "ΟΔΟΣ ΣΑΣ"])
+def test_row_search_lowercases_queries_like_the_row_text(query):
+    data = pd.DataFrame({"city": ["İstanbul", "Izmir", "ΣΑΣ", "ΟΔΟΣ ΣΑΣ", None]})
+    expected = np.flatnonzero(_row_text(data).str.contains(lowercase_query(query), regex=False))
+    assert len(expected)
+    assert RowSearchIndex(data).search(query).tolist() == expected.tolist()
+    assert IncrementalRowFilter(RowSearchIndex(data)).search(query).tolist() == expected.tolist()
+
+
+def test_row_search_rejects_a_bad_regex(people):
+    with pytest.raises(pa.ArrowInvalid):
+        RowSearchIndex(people).search("(", regex=True)
+
+
+def test_incremental_filter_narrows_and_widens(people):
+    index = RowSearchIndex(people)
+    row_filter = IncrementalRowFilter(index)
+    for query in ["sm", "smi", "smith", "smithers", "jones", "smith"]:
+        assert row_filter.search(query).tolist() == index.search(query).tolist()
+
+
+def test_sort_permutation_matches_sort_values(people):
+    by = ["team", "score", "name"]
+    ranks = [sort_ranks(people[column]) for column in by]
+    expected = people.sort_values(by, kind="stable", na_position="last").index.to_numpy()
+    assert sort_permutation(ranks).tolist() == expected.tolist()
+    expected = people.sort_values("score", kind="stable", na_position="last").index.to_numpy()
+    assert sort_permutation(ranks[1:2]).tolist() == expected.tolist()
+
+
+def test_sort_ranks_of_mixed_types():
+    ranks = sort_ranks(pd.Series([10, "b", 2, None, "a"], dtype=object))
+    assert ranks.tolist() == [1, 3, 0, 4, 2]
+    # values that can't be compared at all sort by their text
+    ranks = sort_ranks(pd.Series([pd.Timestamp("2020-01-01"), "b", 2.5, None], dtype=object))
+    assert ranks.tolist() == [1, 2, 0, 3]
+
+
+def test_restrict_permutation_keeps_sorted_order(people):
+    permutation = people.sort_values("age", kind="stable").index.to_numpy()
+    rows = np.flatnonzero(people["team"].eq("red").to_numpy())
+    expected = people.iloc[rows].sort_values("age", kind="stable").index.to_numpy()
+    assert rows[restrict_permutation(permutation, rows)].tolist() == expected.tolist()
+    assert restrict_permutation(permutation) is permutation
+
+
+def test_group_index_matches_groupby(people):
+    groups = GroupIndex.build(people, ["team", "name"], sort_by=["age"])
+    expected = people.sort_values("age", kind="stable").groupby(["team", "name"], sort=True)
+    assert len(groups) == expected.ngroups
+    for idx, (key, rows) in enumerate(expected):
+        assert tuple(groups.keys.iloc[groups.group_order[idx]]) == key
+        assert groups.group_rows(idx).index.tolist() == rows.index.tolist()
+
+
+def test_group_index_sorts_groups_by_key_columns(people):
+    groups = GroupIndex.build(people, ["team"], sort_by=["team"])
+    assert groups.head(5)["team"].tolist() == ["blue", "red"]
+    record = groups.group_record(1)
+    assert record["age"] == people.loc[people["team"] == "red", "age"].tolist()
+
+
+def test_group_index_of_rows_matches_groupby_of_view(people):
+    rows = np.flatnonzero(people["score"].gt(20).to_numpy())[::-1]
+    groups = GroupIndex.build(people, ["team"], rows=rows)
+    expected = people.iloc[rows].groupby("team", sort=True)
+    assert len(groups) == expected.ngroups
+    for idx, (_, view) in enumerate(expected):
+        assert groups.group_rows(idx).index.tolist() == view.index.tolist()
+
+
+def test_profile_column_matches_value_counts(people):
+    profile = profile_column("team", people["team"].astype("category"))
+    counts = people["team"].value_counts()
+    assert profile.count == len(people)
+    assert profile.nulls == people["team"].isna().sum()
+    assert profile.distinct == len(counts)
+    assert profile.most_common == counts.index[0]
+    assert (profile.min, profile.max) == ("blue", "red")
+    assert profile.value_counts.to_dict() == counts.to_dict()
+
+
+def test_row_windows_bounds_and_chunks():
+    data = pd.DataFrame({"x": np.arange(250)})
+    windows = RowWindows(lambda start, stop: data.iloc[start:stop], len(data), window_size=100, max_windows=2)
+    assert windows.num_windows == 3
+    assert windows.bounds(2) == (200, 250)
+    for idx in [0, 2, 1, 0]:
+        assert windows.window(idx)["x"].tolist() == list(range(*windows.bounds(idx)))
+    assert len(windows._windows) <= 2
+    assert pd.concat(windows.chunks(chunk_rows=64))["x"].tolist() == data["x"].tolist()
+
+
+def test_row_windows_retries_a_failed_fetch():
+    calls = []
+
+    def fetch(start, stop):
+        calls.append(start)
+        if len(calls) == 1:
+            raise OSError("transient")
+        return pd.DataFrame({"x": range(start, stop)})
+
+    windows = RowWindows(fetch, 10, window_size=5)
+    with pytest.raises(OSError):
+        windows.window(0, prefetch=False)
+    assert windows.window(0, prefetch=False)["x"].tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("export_format", ["CSV", "Parquet", "JSON Lines"])
+def test_write_export_round_trips(export_format):
+    data = pd.DataFrame({"x": np.arange(10), "s": [None] * 5 + list("abcde")})
+    sink = io.BytesIO()
+    write_export([data.iloc[:5], data.iloc[5:]], sink, export_format)
+    sink.seek(0)
+    if export_format == "CSV":
+        exported = pd.read_csv(sink)
+    elif export_format == "Parquet":
+        assert pq.ParquetFile(sink).num_row_groups == 2
+        exported = pd.read_parquet(sink)
+    else:
+        exported = pd.read_json(sink, lines=True)
+    assert exported["x"].tolist() == data["x"].tolist()
+    assert exported["s"].iloc[5:].tolist() == list("abcde")
+    assert exported["s"].iloc[:5].isna().all()
+
+
+def test_write_export_csv_encodes_grouped_lists_as_json():
+    sink = io.BytesIO()
+    write_export([pd.DataFrame({"k": ["a"], "v": [[1, 2]]})], sink, "CSV")
+    sink.seek(0)
+    assert json.loads(pd.read_csv(sink)["v"].iloc[0]) == [1, 2]
+
+
+def test_write_export_rejects_unknown_format():
+    with pytest.raises(RuntimeError):
+        write_export([], io.BytesIO(), "XLSX")
+
+
+def test_parsed_upload_cache_parses_each_upload_once(tmp_path, make_upload):
+    cache = ParsedUploadCache(tmp_path, max_bytes=10**9)
+    parses = []
+
+    def loader(file, **options):
+        parses.append(options)
+        return pd.read_csv(file)
+
+    key, data = cache.load(make_upload(b"a,b\n1,x\n2,y\n", "x.csv"), loader, all_strings=False)
+    assert cache.path_for(key).exists()
+    again_key, again = cache.load(make_upload(b"a,b\n1,x\n2,y\n", "x.csv"), loader, all_strings=False)
+    assert (again_key, again is data) == (key, True)
+    assert len(parses) == 1
+
+    # another process, or a restart, maps the file back in
+    mapped = ParsedUploadCache(tmp_path, max_bytes=10**9).get(key)
+    assert mapped.equals(data)
+    assert cache.load(make_upload(b"a,b\n1,x\n2,y\n", "x.csv"), loader, all_strings=True)[0] != key
+
+
+def test_parsed_upload_cache_evicts_least_recent_unless_held(tmp_path, make_upload):
+    cache = ParsedUploadCache(tmp_path, max_bytes=10**9)
+    keys = []
+    for i in range(3):
+        key, _ = cache.load(make_upload(f"a\n{i}\n".encode(), "x.csv"), lambda file: pd.read_csv(file))
+        os.utime(cache.path_for(key), (i, i))
+        keys.append(key)
+
+    user = pd.DataFrame()  # e.g. a frame mapping the file
+    cache.hold(keys[0], user)
+    cache.max_bytes = cache.path_for(keys[2]).stat().st_size * 2
+    cache.evict()
+    assert [cache.path_for(key).exists() for key in keys] == [True, False, True]
+
+    del user  # releases the hold
+    cache.max_bytes = 0
+    cache.evict()
+    assert not any(cache.path_for(key).exists() for key in keys)
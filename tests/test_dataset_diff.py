@@ -0,0 +1,131 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_diff import diff_datasets
+
+
+def _same(a, b) -> bool:
+    return (pd.isna(a) and pd.isna(b)) or (not pd.isna(a) and not pd.isna(b) and a == b)
+
+
+def _reference_keyed_diff(old: pd.DataFrame, new: pd.DataFrame, key_columns):
+    """Match the nth row of each key in ``new`` to the nth row of that key in ``old``, one row at a time."""
+
+    def _key(row):
+        return tuple("<NA>" if pd.isna(value) else value for value in row)
+
+    old_rows = defaultdict(list)
+    for position, row in enumerate(old[key_columns].itertuples(index=False)):
+        old_rows[_key(row)].append(position)
+    seen = Counter()
+    added, changed, matched_old = [], [], set()
+    column_changes = Counter()
+    compared = [column for column in new.columns if column in old.columns and column not in key_columns]
+    for position, row in enumerate(new[key_columns].itertuples(index=False)):
+        key = _key(row)
+        candidates = old_rows.get(key, [])
+        if seen[key] >= len(candidates):
+            added.append(position)
+            continue
+        old_position = candidates[seen[key]]
+        seen[key] += 1
+        matched_old.add(old_position)
+        differing = [
+            column for column in compared if not _same(old[column].iat[old_position], new[column].iat[position])
+        ]
+        column_changes.update(differing)
+        if differing:
+            changed.append((old_position, position))
+    removed = [position for position in range(len(old)) if position not in matched_old]
+    return added, removed, changed, column_changes
+
+
+@pytest.fixture
+def versions():
+    rng = np.random.default_rng(0)
+    num_rows = 2000
+    old = pd.DataFrame(
+        {
+            "id": rng.permutation(num_rows),
+            "region": rng.choice(["north", "south", None], num_rows),
+            "amount": np.where(rng.random(num_rows) < 0.05, np.nan, rng.integers(0, 100, num_rows).astype(float)),
+            "label": pd.Categorical(rng.choice(["a", "b"], num_rows)),
+        }
+    )
+    new = old.sample(frac=0.9, random_state=1).reset_index(drop=True)
+    changed = rng.random(len(new)) < 0.1
+    new.loc[changed, "amount"] = new.loc[changed, "amount"] + 1
+    new.loc[rng.random(len(new)) < 0.05, "region"] = "east"
+    new["label"] = new["label"].cat.add_categories("c")
+    new.loc[rng.random(len(new)) < 0.05, "label"] = "c"
+    added = pd.DataFrame({"id": np.arange(num_rows, num_rows + 50), "region": "west", "amount": 1.0, "label": "a"})
+    new = pd.concat([new, added.astype({"label": new["label"].dtype})], ignore_index=True)
+    return old, new
+
+
+def test_keyed_diff_matches_reference(versions):
+    old, new = versions
+    diff = diff_datasets(old, new, key_columns=["id"])
+    added, removed, changed, column_changes = _reference_keyed_diff(old, new, ["id"])
+    assert diff.added_rows.tolist() == added
+    assert diff.removed_rows.tolist() == removed
+    assert list(zip(diff.changed_old_rows.tolist(), diff.changed_new_rows.tolist())) == changed
+    assert diff.column_changes == {column: column_changes[column] for column in diff.compared_columns}
+    assert diff.unchanged_rows == len(new) - len(added) - len(changed)
+    assert diff.duplicate_keys == 0
+
+
+def test_duplicate_keys_are_matched_in_order(versions):
+    old, new = versions
+    old, new = old.assign(id=old["id"] % 300), new.assign(id=new["id"] % 300)
+    diff = diff_datasets(old, new, key_columns=["id", "region"])
+    added, removed, changed, _ = _reference_keyed_diff(old, new, ["id", "region"])
+    assert diff.added_rows.tolist() == added
+    assert diff.removed_rows.tolist() == removed
+    assert list(zip(diff.changed_old_rows.tolist(), diff.changed_new_rows.tolist())) == changed
+    assert diff.duplicate_keys == new.duplicated(["id", "region"]).sum()
+
+
+def test_whole_row_diff_matches_multiset_difference(versions):
+    old, new = versions
+    diff = diff_datasets(old, new)
+    old_rows = Counter(map(tuple, old.astype(str).to_numpy()))
+    new_rows = Counter(map(tuple, new.astype(str).to_numpy()))
+    assert len(diff.added_rows) == sum((new_rows - old_rows).values())
+    assert len(diff.removed_rows) == sum((old_rows - new_rows).values())
+    assert len(diff.changed_new_rows) == 0
+    assert diff.unchanged_rows == len(new) - len(diff.added_rows)
+
+
+def test_changed_values_lists_each_change():
+    old = pd.DataFrame({"id": [1, 2, 3], "x": [1.0, 2.0, np.nan], "y": ["a", "b", "c"], "gone": 0})
+    new = pd.DataFrame({"id": [3, 2, 4], "x": [np.nan, 5.0, 1.0], "y": ["C", "b", "d"], "extra": 1})
+    diff = diff_datasets(old, new, key_columns=["id"])
+    assert (diff.added_columns, diff.removed_columns) == (["extra"], ["gone"])
+    assert diff.added_rows.tolist() == [2] and diff.removed_rows.tolist() == [0]
+    changes = diff.changed_values(old, new)
+    assert changes.to_dict("records") == [
+        {"id": 3, "Column": "y", "Old": "c", "New": "C"},
+        {"id": 2, "Column": "x", "Old": 2.0, "New": 5.0},
+    ]
+    assert diff_datasets(old, old.copy(), key_columns=["id"]).changed_values(old, old.copy()).empty
+
+
+def test_columns_loaded_as_different_types():
+    old = pd.DataFrame(
+        {"id": [1, 2, 3], "n": np.array([1, 2, 3], dtype=np.int8), "s": pd.Series(["1", "2", None], dtype="string")}
+    )
+    new = pd.DataFrame({"id": [1, 2, 3], "n": [1.0, 2.5, 3.0], "s": pd.Series([1, 2, None], dtype="Int64")})
+    diff = diff_datasets(old, new, key_columns=["id"])
+    assert diff.column_changes == {"n": 1, "s": 0}
+    assert diff.changed_new_rows.tolist() == [1]
+
+
+def test_empty_versions():
+    empty = pd.DataFrame({"id": pd.Series([], dtype=int)})
+    rows = pd.DataFrame({"id": [1, 2]})
+    assert diff_datasets(empty, rows, ["id"]).added_rows.tolist() == [0, 1]
+    assert diff_datasets(rows, empty, ["id"]).removed_rows.tolist() == [0, 1]
@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsampling import downsample_series, lttb_indices
+
+
+def _reference_lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets as in Steinarsson's thesis, one point at a time."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    picked = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = math.floor((i + 1) * every) + 1
+        avg_end = min(math.floor((i + 2) * every) + 1, n)
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+
+        best, max_area = None, -1.0
+        for j in range(math.floor(i * every) + 1, math.floor((i + 1) * every) + 1):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > max_area:
+                best, max_area = j, area
+        picked.append(best)
+        a = best
+    picked.append(n - 1)
+    return picked
+
+
+@pytest.mark.parametrize("num_rows, num_points", [(1000, 100), (1000, 3), (997, 101), (50, 49), (10_000, 640)])
+def test_lttb_matches_reference(num_rows, num_points):
+    rng = np.random.default_rng(num_rows + num_points)
+    x = np.cumsum(rng.random(num_rows))
+    y = np.cumsum(rng.normal(size=num_rows))
+    picked = lttb_indices(x, y, num_points)
+    assert picked.tolist() == _reference_lttb(x.tolist(), y.tolist(), num_points)
+    assert len(picked) == num_points
+    assert np.all(np.diff(picked) > 0)
+
+
+@pytest.mark.parametrize("num_points", [0, 2, 10, 11])
+def test_lttb_keeps_short_series_whole(num_points):
+    assert lttb_indices(np.arange(10), np.zeros(10), num_points).tolist() == list(range(10))
+
+
+def test_lttb_keeps_spikes():
+    y = np.zeros(10_000)
+    y[[1234, 5678]] = [100, -100]
+    picked = lttb_indices(np.arange(10_000), y, 50)
+    assert {1234, 5678} <= set(picked.tolist())
+
+
+def test_lttb_skips_missing_values():
+    y = np.sin(np.arange(1000) / 50)
+    y[100:300] = np.nan
+    picked = lttb_indices(np.arange(1000), y, 100)
+    assert len(picked) == 100
+    assert not np.isnan(y[picked[(picked < 100) | (picked >= 300)]]).any()
+
+
+def test_downsample_series_of_dates():
+    dates = pd.date_range("2000-01-01", periods=5000).to_numpy()
+    y = np.random.default_rng(0).normal(size=5000)
+    x_kept, y_kept = downsample_series(dates, y, 200)
+    picked = lttb_indices(dates.view(np.int64), y, 200)
+    assert x_kept.dtype == dates.dtype and y_kept.dtype == np.float32
+    assert np.array_equal(x_kept, dates[picked])
+    assert np.allclose(y_kept, y[picked], rtol=1e-6)
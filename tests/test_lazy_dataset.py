@@ -0,0 +1,142 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import lazy_dataset
+from columnar_files import ColumnFilter
+from lazy_dataset import LazyDataset, write_upload_as_arrow
+from page_helpers import infer_column_dtype
+from sketches import DatasetSketch
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    num_rows = 300
+    return pd.DataFrame(
+        {
+            "id": np.arange(num_rows),
+            "zip": [f"{zip_code:05d}" for zip_code in rng.integers(0, 3000, num_rows)],
+            "city": rng.choice(["Boston", "Austin", "Denver"], num_rows),
+            "amount": np.where(rng.random(num_rows) < 0.1, np.nan, rng.normal(100, 20, num_rows).round(2)),
+            "day": pd.date_range("2020-01-01", periods=num_rows).strftime("%Y-%m-%d"),
+        }
+    )
+
+
+@pytest.fixture
+def csv_dataset(tmp_path, frame, make_upload) -> LazyDataset:
+    path = tmp_path / "upload.arrow"
+    write_upload_as_arrow(make_upload(frame.to_csv(index=False).encode(), "x.csv"), path)
+    return LazyDataset(path)
+
+
+def test_csv_columns_are_typed_like_in_memory_uploads(csv_dataset, frame):
+    for column in frame.columns:
+        expected = infer_column_dtype(frame[column].astype(str).where(frame[column].notna()), categorical_threshold=0)
+        assert csv_dataset.schema.field(column).type == pa.Array.from_pandas(expected).type, column
+    data = csv_dataset.rows(np.arange(len(frame)))
+    assert data["zip"].tolist() == frame["zip"].tolist()
+    assert np.allclose(data["amount"], frame["amount"], equal_nan=True)
+
+
+def test_csv_batches_are_typed_like_the_whole_column(tmp_path, make_upload, monkeypatch):
+    monkeypatch.setattr(lazy_dataset, "CSV_BLOCK_SIZE", 1024)
+    num_rows = 2000
+    late = np.arange(num_rows) >= num_rows - 5
+    frame = pd.DataFrame(
+        {
+            "widens": np.where(late, 10**6, 7),
+            "becomes_float": np.where(late, "2.5", "3"),
+            "becomes_text": np.where(late, "unknown", "12"),
+            "gets_leading_zero": np.where(late, "0012", "12"),
+            "starts_empty": np.where(np.arange(num_rows) < 1000, None, "41"),
+            "empty": None,
+            "day": pd.date_range("2020-01-01", periods=num_rows).strftime("%Y-%m-%d"),
+        }
+    )
+    path = tmp_path / "upload.arrow"
+    sketch = DatasetSketch()
+    write_upload_as_arrow(make_upload(frame.to_csv(index=False).encode(), "x.csv"), path, sketch=sketch)
+    dataset = LazyDataset(path)
+    assert dataset.table.column(0).num_chunks > 1
+    data = dataset.rows(np.arange(num_rows))
+    for column in frame.columns:
+        expected = infer_column_dtype(frame[column].astype(str).where(frame[column].notna()), categorical_threshold=0)
+        assert dataset.schema.field(column).type == pa.Array.from_pandas(expected).type, column
+        assert data[column].isna().equals(expected.isna()), column
+        assert (data[column].dropna() == expected.dropna()).all(), column
+    assert sketch.num_rows == num_rows
+
+
+def test_csv_as_strings_and_sketch(tmp_path, frame, make_upload):
+    path = tmp_path / "upload.arrow"
+    sketch = DatasetSketch()
+    write_upload_as_arrow(make_upload(frame.to_csv(index=False).encode(), "x.csv"), path, True, sketch)
+    dataset = LazyDataset(path)
+    assert all(pa.types.is_string(field.type) for field in dataset.schema)
+    assert sketch.num_rows == len(frame)
+    assert dataset.count() == len(frame)
+
+
+def test_parquet_columns_and_filters_are_pushed_down(tmp_path, frame, make_upload):
+    sink = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), sink)
+    path = tmp_path / "upload.arrow"
+    upload = make_upload(sink.getvalue(), "x.parquet", "application/octet-stream")
+    write_upload_as_arrow(upload, path, columns=["id", "city"], filters=[ColumnFilter("city", "==", "Austin")])
+    data = LazyDataset(path).rows(np.arange(LazyDataset(path).count()))
+    expected = frame.loc[frame["city"] == "Austin", ["id", "city"]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(data, expected)
+
+
+def test_filtered_and_sorted_positions_match_pandas(csv_dataset, frame):
+    filter = csv_dataset.filter_expression("BOST")
+    positions = csv_dataset.filtered_positions(filter)
+    expected = np.flatnonzero(frame["city"].str.contains("bost", case=False))
+    assert positions.tolist() == expected.tolist()
+    assert csv_dataset.count(filter) == len(expected)
+
+    sorted_positions = csv_dataset.sorted_positions(["city", "id"], positions)
+    assert sorted_positions.tolist() == frame.iloc[positions].sort_values(["city", "id"]).index.tolist()
+    order = frame.sort_values(["amount", "id"], na_position="last", kind="stable").index
+    assert csv_dataset.sorted_positions(["amount", "id"]).tolist() == order.tolist()
+    assert csv_dataset.rows(sorted_positions[:5])["id"].tolist() == sorted_positions[:5].tolist()
+
+
+def test_regex_filter_matches_every_column(csv_dataset, frame):
+    positions = csv_dataset.filtered_positions(csv_dataset.filter_expression(r"^2020-01-0\d", regex=True))
+    assert positions.tolist() == list(range(9))
+    assert csv_dataset.filter_expression("") is None
+    with pytest.raises(pa.ArrowInvalid):
+        csv_dataset.filter_expression("(", regex=True)
+
+
+def test_group_counts_and_value_counts_match_pandas(csv_dataset, frame):
+    counts = csv_dataset.group_counts(["city"], sort_by=["city"])
+    expected = frame.groupby("city").size()
+    assert counts["city"].tolist() == expected.index.tolist()
+    assert counts["Rows"].tolist() == expected.tolist()
+
+    value_counts = csv_dataset.value_counts("city")
+    assert dict(zip(value_counts["Unique Items"], value_counts["Count"])) == frame["city"].value_counts().to_dict()
+    assert value_counts["Count"].is_monotonic_decreasing
+
+    group = csv_dataset.group_rows({"city": "Denver"}, limit=1000)
+    assert group["id"].tolist() == frame.loc[frame["city"] == "Denver", "id"].tolist()
+
+
+def test_column_summary_and_describe_match_pandas(csv_dataset, frame):
+    assert csv_dataset.column_summary("amount") == {
+        "Count": len(frame),
+        "Missing Values": frame["amount"].isna().sum(),
+        "Unique Items": frame["amount"].nunique(),
+    }
+    described = csv_dataset.describe()
+    expected = frame[["id", "amount"]].describe()
+    assert described.columns.tolist() == ["id", "amount"]
+    assert np.allclose(described.loc[expected.index].astype(float), expected)
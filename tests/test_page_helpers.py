@@ -0,0 +1,163 @@
+import hashlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.runtime.caching.cache_type import CacheType
+from streamlit.runtime.caching.hashing import update_hash
+
+from page_helpers import (
+    DatasetHandle,
+    compact_dtypes,
+    convert_string_data,
+    infer_column_dtype,
+    iter_csv_chunks,
+    iter_upload_chunks,
+    load_data_from_file,
+    load_data_from_files,
+    load_dataset,
+    unique_column_name,
+    upload_content_hash,
+)
+
+
+def _text(values) -> pd.Series:
+    return pd.Series(values, dtype=object)
+
+
+@pytest.mark.parametrize(
+    "values, dtype",
+    [
+        (["1", "2", "3"], "int8"),
+        (["1", None, "300"], "Int64"),
+        (["1.5", "2", None], "float64"),
+        (["2.0", "3.0"], "float64"),
+        (["1e3", "2"], "float64"),
+        (["9007199254740993", "1"], "int64"),
+    ],
+)
+def test_infer_column_dtype_numbers(values, dtype):
+    column = _text(values)
+    inferred = infer_column_dtype(column, categorical_threshold=0)
+    assert str(inferred.dtype) == dtype
+    expected = pd.to_numeric(column)
+    assert np.allclose(inferred.astype("float64"), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        ["01234", "98765"],  # leading zeros
+        ["12345678901234567890", "12345678901234567891"],  # past int64
+        ["9007199254740993", None],  # past float64's exact integers, with a missing value
+    ],
+)
+def test_infer_column_dtype_keeps_text_that_numbers_would_change(values):
+    inferred = infer_column_dtype(_text(values), categorical_threshold=0)
+    assert inferred.dtype == "string[pyarrow]"
+    assert inferred.tolist() == [value if value is not None else pd.NA for value in values]
+
+
+def test_infer_column_dtype_dates_and_categories():
+    dates = infer_column_dtype(_text(["2020-01-01", "2021-06-30", None]), categorical_threshold=0)
+    assert dates.dtype == "datetime64[ns]"
+    assert dates.iloc[1] == pd.Timestamp("2021-06-30")
+
+    named = infer_column_dtype(_text(["Jan 5, 2020", "Mar 5, 2021"]), categorical_threshold=0)
+    assert named.tolist() == [pd.Timestamp("2020-01-05"), pd.Timestamp("2021-03-05")]
+
+    categories = infer_column_dtype(_text(["a", "b", "a", "a"]), categorical_threshold=0.5)
+    assert categories.dtype == "category"
+    assert categories.tolist() == ["a", "b", "a", "a"]
+
+
+@pytest.mark.parametrize("values", [["08:15", "17:30:00", None], ["8:15 AM", "11:59 PM"], ["12:00:00.5"]])
+def test_infer_column_dtype_keeps_times_of_day_as_text(values):
+    inferred = infer_column_dtype(_text(values), categorical_threshold=0)
+    assert inferred.dtype == "string[pyarrow]"
+    assert inferred.dropna().tolist() == [value for value in values if value is not None]
+
+
+def test_compact_dtypes_reports_memory():
+    data = pd.DataFrame({"n": _text([str(i) for i in range(1000)]), "s": _text(["x"] * 1000)})
+    compacted, report = compact_dtypes(data)
+    assert report.bytes_after < report.bytes_before
+    assert report.column_dtypes == {"n": "int16", "s": "category"}
+    assert compacted["n"].tolist() == list(range(1000))
+
+
+def test_convert_string_data_keeps_stored_types_unless_all_strings():
+    data = pd.DataFrame({"n": [1.5, np.nan], "s": _text(["a", None])})
+    assert convert_string_data(data.copy())["n"].dtype == "float64"
+    as_text = convert_string_data(data.copy(), all_strings=True)
+    assert as_text["n"].tolist() == ["1.5", None]
+    assert as_text["s"].tolist() == ["a", None]
+
+
+def test_load_data_from_file_matches_pandas(make_upload):
+    content = b"id,zip,amount\n1,01234,1.5\n2,98765,\n"
+    data = load_data_from_file(make_upload(content, "x.csv"))
+    assert data["id"].tolist() == [1, 2]
+    assert data["zip"].tolist() == ["01234", "98765"]
+    assert data["amount"].iloc[0] == 1.5 and pd.isna(data["amount"].iloc[1])
+
+
+def test_unique_column_name():
+    assert unique_column_name("Source", ["a", "b"]) == "Source"
+    assert unique_column_name("Source", ["Source", "Source 2"]) == "Source 3"
+
+
+def test_load_data_from_files_adds_a_non_colliding_source_column(make_upload):
+    files = [make_upload(b"Source,x\nq,1\n", "a.csv"), make_upload(b"x\n2\n3\n", "b.csv")]
+    data = load_data_from_files(files)
+    assert data.attrs["source_column"] == "Source 2"
+    assert data.columns.tolist() == ["Source 2", "Source", "x"]
+    assert data["Source 2"].astype(str).tolist() == ["a.csv", "b.csv", "b.csv"]
+    assert data["x"].tolist() == [1, 2, 3]
+    assert [timing.rows for timing in data.attrs["ingestion_timings"]] == [1, 2]
+
+
+def test_upload_content_hash_is_remembered_per_upload(make_upload):
+    upload = make_upload(b"a,b\n1,2\n", "x.csv", file_id="test-upload")
+    digest = upload_content_hash(upload)
+    # a rerun hands back the same upload, so its bytes aren't hashed again
+    upload.getbuffer()[0:1] = b"z"
+    assert upload_content_hash(upload) == digest
+    assert upload_content_hash(make_upload(b"z,b\n1,2\n", "x.csv")) != digest
+
+
+def _cache_key(value) -> str:
+    """Hash ``value`` the way ``st.cache_data`` hashes a cached function's argument."""
+    hasher = hashlib.new("md5")
+    update_hash(value, hasher, CacheType.DATA)
+    return hasher.hexdigest()
+
+
+def test_dataset_handles_hash_by_upload_and_options(make_upload):
+    handle = load_dataset(make_upload(b"a,b\n1,2\n", "x.csv"))
+    assert _cache_key(load_dataset(make_upload(b"a,b\n1,2\n", "x.csv"))) == _cache_key(handle)
+    assert _cache_key(load_dataset(make_upload(b"a,b\n1,3\n", "x.csv"))) != _cache_key(handle)
+    assert _cache_key(load_dataset(make_upload(b"a,b\n1,2\n", "x.csv"), all_strings=True)) != _cache_key(handle)
+    # only the fingerprint is hashed, never the data it carries
+    assert _cache_key(DatasetHandle(handle.fingerprint, handle.data.assign(b=0))) == _cache_key(handle)
+
+
+def test_iter_upload_chunks_reads_the_whole_upload(make_upload):
+    content = "a,b\n" + "".join(f"{i},x{i}\n" for i in range(25_000))
+    chunks = list(iter_upload_chunks(make_upload(content.encode(), "x.csv")))
+    assert [len(chunk) for chunk, _ in chunks] == [10_000, 15_000]
+    assert chunks[-1][1] == 1.0
+    data = pd.concat([chunk for chunk, _ in chunks])
+    assert data.equals(pd.read_csv(io.StringIO(content), dtype=str))
+
+
+def test_csv_chunks_match_a_whole_read(make_upload):
+    rows = [f'{i},"row {i}, said ""hi""\n{"é" * (i % 97)}{"x" * 150}",{i * 1.5}' for i in range(3000)]
+    content = ("id,note,amount\n" + "\n".join(rows) + "\n").encode()
+    # pandas reads 256 KiB at a time, and the second buffer boundary falls inside a quoted field
+    assert content[: 2 * 2**18].count(b'"') % 2 == 1
+    chunks = list(iter_csv_chunks(make_upload(content, "x.csv"), chunk_rows=700, first_chunk_rows=100))
+    assert [len(chunk) for chunk, _ in chunks] == [100, 700, 700, 700, 700, 100]
+    data = convert_string_data(pd.concat([chunk for chunk, _ in chunks], ignore_index=True))
+    pd.testing.assert_frame_equal(data, load_data_from_file(make_upload(content, "x.csv")))
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+import pytest
+from diskcache import Cache
+from scipy.optimize import curve_fit
+
+import rating_curve_helpers
+from rating_curve_helpers import (
+    MIN_WINDOW_DAYS,
+    FitCache,
+    fit_power_law_params,
+    polynomial_window_fits,
+    power_law,
+    power_law_initial_guess,
+    power_law_result,
+    power_law_window_fits,
+    rolling_fits,
+)
+from water_data_helpers import WaterSeries
+
+
+@pytest.fixture
+def rating_data():
+    rng = np.random.default_rng(0)
+    stage = rng.uniform(1, 10, 400)
+    discharge = 35 * stage**1.6 * rng.lognormal(0, 0.05, len(stage))
+    return stage, discharge
+
+
+@pytest.fixture
+def fit_cache(tmp_path):
+    with Cache(str(tmp_path / "fits")) as cache:
+        yield FitCache(cache, max_neighbours=3)
+
+
+def test_initial_guess_is_a_log_log_regression(rating_data):
+    stage, discharge = rating_data
+    a, b = power_law_initial_guess(stage, discharge)
+    assert a == pytest.approx(35, rel=0.05) and b == pytest.approx(1.6, rel=0.02)
+    assert power_law_initial_guess(np.array([0.0, 1.0]), np.array([1.0, 2.0])).tolist() == [1.0, 1.0]
+
+
+def test_power_law_fit_matches_a_cold_curve_fit(rating_data):
+    stage, discharge = rating_data
+    expected = curve_fit(power_law, stage, discharge, p0=[1, 1], maxfev=5000)[0]
+    assert np.allclose(fit_power_law_params(stage, discharge), expected, rtol=1e-5)
+    # a poor starting point still ends at the same fit
+    assert np.allclose(fit_power_law_params(stage, discharge, np.array([1e6, -5.0])), expected, rtol=1e-5)
+
+
+def test_power_law_result(rating_data):
+    stage, discharge = rating_data
+    params = fit_power_law_params(stage, discharge)
+    result = power_law_result(params, stage, discharge, "2020-01-01", "2020-12-31")
+    assert result.rmse == pytest.approx(np.sqrt(np.mean((discharge - power_law(stage, *params)) ** 2)))
+    assert np.allclose(result.predict(result.stage_fit), result.discharge_fit)
+    assert result.predict(stage, normalized=True).max() <= 1.01
+
+
+def test_fit_cache_get_or_fit_fits_once(fit_cache):
+    calls = []
+
+    def fit(initial_guess):
+        calls.append(initial_guess)
+        return np.array([2.0, 3.0])
+
+    start, end = pd.Timestamp("2020-01-01"), pd.Timestamp("2020-06-30")
+    assert fit_cache.get_or_fit("data", "power-law", start, end, fit).tolist() == [2.0, 3.0]
+    assert fit_cache.get_or_fit("data", "power-law", start, end, fit).tolist() == [2.0, 3.0]
+    assert calls == [None]
+    # another dataset or model doesn't share the fit
+    fit_cache.get_or_fit("other", "power-law", start, end, fit)
+    fit_cache.get_or_fit("data", "polynomial-2", start, end, fit)
+    assert calls == [None, None, None]
+
+
+def test_fit_cache_starts_from_the_nearest_range(fit_cache):
+    days = pd.date_range("2020-01-01", periods=400)
+    for i, (start, end) in enumerate([(0, 100), (50, 200), (300, 390)]):
+        fit_cache.put("data", "power-law", days[start], days[end], np.array([float(i), 0.0]))
+
+    def reference(start, end):
+        ranges = {(0, 100): 0, (50, 200): 1, (300, 390): 2}
+        return min(ranges.items(), key=lambda item: abs(item[0][0] - start) + abs(item[0][1] - end))[1]
+
+    queries = [(0, 90), (60, 190), (280, 399), (150, 300)]
+    nearest = fit_cache.nearest_many("data", "power-law", days[[q[0] for q in queries]], days[[q[1] for q in queries]])
+    assert [params[0] for params in nearest] == [reference(*query) for query in queries]
+    assert fit_cache.nearest("data", "power-law", days[1], days[99])[0] == 0
+    assert fit_cache.nearest("data", "polynomial-2", days[1], days[99]) is None
+
+
+def test_fit_cache_forgets_the_least_recent_ranges(fit_cache):
+    days = pd.date_range("2020-01-01", periods=10)
+    for i in range(4):
+        fit_cache.put("data", "power-law", days[i], days[i + 5], np.array([float(i), 0.0]))
+    # the first range is no longer a starting point, though its fit is still cached
+    assert fit_cache.nearest("data", "power-law", days[0], days[5])[0] == 1
+    assert fit_cache.get_many("data", "power-law", [days[0]], [days[5]])[0].tolist() == [0.0, 0.0]
+
+
+def test_fit_cache_batches(fit_cache):
+    days = pd.date_range("2020-01-01", periods=10)
+    params = np.arange(8, dtype=float).reshape(4, 2)
+    fit_cache.put_many("data", "power-law", days[:4], days[4:8], params)
+    cached = fit_cache.get_many("data", "power-law", days[:5], days[4:9])
+    assert [None if p is None else p.tolist() for p in cached] == [*params.tolist(), None]
+    # batched fits aren't remembered as starting points
+    assert fit_cache.nearest("data", "power-law", days[0], days[4]) is None
+
+
+@pytest.fixture
+def water_series():
+    rng = np.random.default_rng(1)
+    days = pd.date_range("2020-01-01", "2021-12-31")
+    days = days[rng.random(len(days)) > 0.1]
+    # the rating shifts slowly, as a channel does
+    drift = np.linspace(0, 0.3, len(days))
+    stage = rng.uniform(2, 8, len(days))
+    discharge = 30 * stage ** (1.5 + drift) * rng.lognormal(0, 0.03, len(days))
+    return WaterSeries(pd.DataFrame({"date": days, "stage_val": stage, "discharge_rate": discharge}))
+
+
+@pytest.mark.parametrize("degree", [1, 2, 3])
+def test_polynomial_window_fits_match_polyfit(degree):
+    rng = np.random.default_rng(degree)
+    # a window with a narrow range of large stages, which is ill conditioned without scaling
+    stage = np.concatenate([rng.uniform(0, 10, 500), 1000 + rng.uniform(0, 0.05, 40)])
+    discharge = 3 + 2 * stage - 0.01 * stage**2 + rng.normal(0, 0.1, len(stage))
+    lo = np.array([0, 10, 250, 480, 500])
+    hi = np.array([30, 11 + degree, 500, 540, 540])
+    coefficients, rmse = polynomial_window_fits(stage, discharge, lo, hi, degree, block_values=100)
+    for i, (first, last) in enumerate(zip(lo, hi)):
+        expected = np.polyval(np.polyfit(stage[first:last], discharge[first:last], degree), stage[first:last])
+        predicted = np.polyval(coefficients[i], stage[first:last])
+        # evaluating the powers of stages near 1000 loses the last few digits, in either fit
+        assert np.allclose(predicted, expected, rtol=1e-5, atol=1e-6)
+        # and the fit is at least as close as polyfit's
+        assert rmse[i] <= np.sqrt(np.mean((expected - discharge[first:last]) ** 2)) + 1e-9
+
+
+def test_polynomial_window_fits_of_no_windows():
+    coefficients, rmse = polynomial_window_fits(np.ones(5), np.ones(5), np.array([], int), np.array([], int), 2)
+    assert coefficients.shape == (0, 3) and rmse.shape == (0,)
+
+
+@pytest.mark.parametrize("min_pool_windows", [1000, 2])
+def test_power_law_window_fits_match_separate_fits(water_series, monkeypatch, min_pool_windows):
+    monkeypatch.setattr(rating_curve_helpers, "POOL_MIN_WINDOWS", min_pool_windows)
+    _, lo, hi = water_series.windows(window_days=120, stride_days=60)
+    stage = water_series.data["stage_val"].to_numpy()
+    discharge = water_series.data["discharge_rate"].to_numpy()
+    params = power_law_window_fits(stage, discharge, lo, hi)
+    for i, (first, last) in enumerate(zip(lo, hi)):
+        expected = fit_power_law_params(stage[first:last], discharge[first:last])
+        assert np.allclose(params[i], expected, rtol=1e-4)
+
+
+def test_rolling_polynomial_fits(water_series):
+    result = rolling_fits(water_series, "polynomial", window_days=90, stride_days=30, degree=2)
+    parameters = result.parameters
+    assert result.parameter_names == ["c2", "c1", "c0"]
+    assert (parameters["Days"] >= MIN_WINDOW_DAYS).all()
+    assert len(result.fits) == len(parameters)
+    for fit, row in zip(result.fits, parameters.itertuples()):
+        window = water_series.between(row[1], row[2])
+        assert row.Days == len(window)
+        expected = np.polyfit(window["stage_val"], window["discharge_rate"], 2)
+        assert np.allclose([row.c2, row.c1, row.c0], expected, rtol=1e-6)
+        assert fit.rmse == pytest.approx(row.RMSE)
+
+
+def test_rolling_power_law_fits_use_the_cache(water_series, fit_cache, monkeypatch):
+    result = rolling_fits(water_series, "power-law", 120, 60, fit_cache=fit_cache, dataset="site")
+    assert result.parameters["b"].iloc[-1] > result.parameters["b"].iloc[0]
+
+    def _no_fits(*args, **kwargs):
+        raise AssertionError("every window should be cached")
+
+    monkeypatch.setattr(rating_curve_helpers, "power_law_window_fits", _no_fits)
+    cached = rolling_fits(water_series, "power-law", 120, 60, fit_cache=fit_cache, dataset="site")
+    pd.testing.assert_frame_equal(cached.parameters, result.parameters)
+    with pytest.raises(RuntimeError):
+        rolling_fits(water_series, "spline", 120, 60)
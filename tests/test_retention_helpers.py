@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from retention_helpers import (
+    StudentIdError,
+    detect_id_column,
+    normalize_ids,
+    retention_column,
+    retention_tables,
+    student_ids,
+)
+
+
+def _reference_normalize(value):
+    if value is None:
+        return None
+    value = value.strip()
+    for i, character in enumerate(value):
+        if character.isspace():
+            value = value[:i]
+            break
+    return value.upper() or None
+
+
+def test_normalize_ids_matches_reference():
+    raw = [" 123456 Smith", "ab12\xa0Jones", "X-9", "  ", None, "\t777\t", "9 8 7", "s001"]
+    normalized = normalize_ids(pd.Series(raw, dtype=object))
+    assert normalized.dtype == "string[pyarrow]"
+    assert [None if pd.isna(value) else value for value in normalized] == [_reference_normalize(v) for v in raw]
+
+
+@pytest.mark.parametrize("column", ["State ID", "state_id", "SSID", "Student Id"])
+def test_detect_id_column_by_name(column):
+    data = pd.DataFrame({"Name": ["a"], column: ["1"]})
+    assert detect_id_column(data) == column
+
+
+def test_detect_id_column_by_values():
+    rng = np.random.default_rng(1)
+    data = pd.DataFrame(
+        {
+            "Grade": rng.choice(["9", "10", "11", "12"], 500),
+            "Name": [f"Student {i}" for i in range(500)],
+            "Number": [f"{i:06d} Last" for i in rng.permutation(500)],
+        }
+    )
+    assert detect_id_column(data) == "Number"
+    with pytest.raises(StudentIdError):
+        detect_id_column(data[["Grade", "Name"]].assign(Name="same"))
+
+
+def test_student_ids_reports_what_normalizing_found():
+    data = pd.DataFrame({"SSID": ["100 Ann", "100", " 200 ", "", None, "300 Cy", "abc"]})
+    ids, report = student_ids(data)
+    assert ids.tolist() == ["100", "200", "300", "ABC"]
+    assert (report.column, report.rows, report.blank, report.trimmed, report.duplicates) == ("SSID", 7, 2, 2, 1)
+
+
+@pytest.fixture
+def yearly_ids():
+    rng = np.random.default_rng(0)
+    population = [f"S{i:05d}" for i in range(3000)]
+    return [set(rng.choice(population, size, replace=False)) for size in (1200, 1000, 1500, 900)]
+
+
+def test_retention_matches_set_arithmetic(yearly_ids):
+    years = ["2020", "2021", "2022", "2023"]
+    columns = [retention_column([pd.Index(sorted(ids)) for ids in yearly_ids[: j + 1]]) for j in range(len(years))]
+    summary, retained, persisted = retention_tables(years, columns)
+
+    for j, current in enumerate(yearly_ids):
+        for i in range(j + 1):
+            assert retained.iat[i, j] == len(yearly_ids[i] & current)
+            assert persisted.iat[i, j] == len(set.intersection(*yearly_ids[i : j + 1]))
+        assert retained.iloc[j + 1 :, j].isna().all()
+
+    for j in range(1, len(years)):
+        previous, current = yearly_ids[j - 1], yearly_ids[j]
+        row = summary.iloc[j]
+        assert row["Students"] == len(current)
+        assert row["Returning"] == len(previous & current)
+        assert row["New"] == len(current - previous)
+        assert row["Left"] == len(previous - current)
+        assert row["Retention"] == pytest.approx(len(previous & current) / len(previous))
+    assert summary.iloc[0][["Returning", "New", "Left", "Retention"]].isna().all()
+
+
+def test_retention_of_one_year():
+    column = retention_column([pd.Index(["A", "B"])])
+    assert (column.students, column.retained, column.persisted) == (2, [2], [2])
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from sketches import DatasetSketch, HyperLogLog, ReservoirSample, SpaceSaving, _bit_length
+
+
+def _reference_registers(hashes: np.ndarray, precision: int) -> np.ndarray:
+    """HyperLogLog registers computed one hash at a time with Python integers."""
+    registers = np.zeros(2**precision, dtype=np.uint8)
+    remaining_bits = 64 - precision
+    for value in hashes.tolist():
+        idx = value >> remaining_bits
+        rank = remaining_bits - (value & ((1 << remaining_bits) - 1)).bit_length() + 1
+        registers[idx] = max(registers[idx], rank)
+    return registers
+
+
+def test_bit_length_matches_python():
+    rng = np.random.default_rng(0)
+    values = np.concatenate(
+        [
+            np.array([0, 1, 2**32 - 1, 2**32, 2**53 + 1, 2**64 - 1], dtype=np.uint64),
+            rng.integers(0, 2**64 - 1, 1000, dtype=np.uint64) >> rng.integers(0, 64, 1000).astype(np.uint64),
+        ]
+    )
+    assert _bit_length(values).tolist() == [value.bit_length() for value in values.tolist()]
+
+
+@pytest.mark.parametrize("precision", [4, 10, 26])
+def test_hyperloglog_registers_match_reference(precision):
+    hashes = np.random.default_rng(precision).integers(0, 2**64 - 1, 5000, dtype=np.uint64)
+    sketch = HyperLogLog(precision)
+    sketch.update(hashes[:2000])
+    sketch.update(hashes[2000:])
+    sketch.update(hashes[:0])
+    assert np.array_equal(sketch.registers, _reference_registers(hashes, precision))
+
+
+@pytest.mark.parametrize("num_distinct", [10, 1000, 200_000])
+def test_hyperloglog_estimate_is_within_its_error(num_distinct):
+    values = pd.Series(np.arange(num_distinct)).sample(frac=3, replace=True, random_state=0)
+    hashes = pd.util.hash_pandas_object(pd.concat([values, pd.Series(np.arange(num_distinct))]), index=False)
+    sketch = HyperLogLog()
+    sketch.update(hashes.to_numpy())
+    assert abs(sketch.estimate() - num_distinct) <= 4 * sketch.relative_error * num_distinct + 1
+
+
+def test_hyperloglog_merge_equals_sketch_of_union():
+    hashes = np.random.default_rng(1).integers(0, 2**64 - 1, 10_000, dtype=np.uint64)
+    left, right, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    left.update(hashes[:6000])
+    right.update(hashes[4000:])
+    union.update(hashes)
+    left.merge(right)
+    assert np.array_equal(left.registers, union.registers)
+
+
+def test_space_saving_bounds_hold_exact_counts():
+    rng = np.random.default_rng(2)
+    values = pd.Series(rng.zipf(1.3, 50_000) % 5000)
+    summary = SpaceSaving(capacity=32)
+    for start in range(0, len(values), 4096):
+        summary.update(values.iloc[start : start + 4096].value_counts(sort=False))
+
+    exact = values.value_counts()
+    top = summary.top(len(summary.counts))
+    assert len(top) == 32
+    for item, high, low in top.itertuples(index=False):
+        assert low <= exact[item] <= high
+    # the most frequent items are all tracked
+    assert set(exact.index[:5]) <= set(top["Item"])
+
+
+def test_dataset_sketch_matches_exact_statistics():
+    rng = np.random.default_rng(3)
+    data = pd.DataFrame(
+        {
+            "n": rng.integers(0, 500, 20_000),
+            "s": pd.Series(rng.choice(["a", "b", "c", None], 20_000, p=[0.7, 0.1, 0.1, 0.1])).astype("category"),
+            "lists": pd.Series([[1], [1, 2], [1], None] * 5000, dtype=object),
+        }
+    )
+    sketch = DatasetSketch.from_dataframe(data, batch_rows=3000)
+    from_batches = DatasetSketch.from_batches(pa.Table.from_pandas(data.drop(columns="lists")).to_batches(3000))
+    assert sketch.num_rows == from_batches.num_rows == len(data)
+
+    details = sketch.details().set_index("Column Name")
+    for column in ["n", "s"]:
+        assert details.loc[column, "Missing Values"] == data[column].isna().sum()
+        error = details.loc[column, "Unique Items ±"]
+        assert abs(details.loc[column, "Unique Items (approx.)"] - data[column].nunique()) <= error
+        assert from_batches.columns[column].approx_distinct == sketch.columns[column].approx_distinct
+    assert details.loc["s", "Most Common Item"] == "a"
+    assert details.loc["s", "Data Type"] == "category"
+    # unhashable cells, such as grouped rows' lists, are sketched by their text
+    assert sketch.columns["lists"].approx_distinct == 2
+    assert sketch.columns["lists"].heavy_hitters.top(1)["Item"].iloc[0] == "[1]"
+
+
+def test_dataset_sketch_of_nothing():
+    sketch = DatasetSketch.from_dataframe(pd.DataFrame({"x": pd.Series([], dtype=float)}))
+    assert sketch.num_rows == 0
+    assert sketch.details().empty
+
+
+def _sample_stream(data: pd.DataFrame, capacity: int, chunk_rows: int, seed: int) -> ReservoirSample:
+    reservoir = ReservoirSample(capacity, seed=seed)
+    for start in range(0, len(data), chunk_rows):
+        reservoir.update(data.iloc[start : start + chunk_rows])
+    return reservoir
+
+
+def test_reservoir_sample_keeps_stream_order_and_exact_counts():
+    data = pd.DataFrame({"x": np.arange(1000), "y": np.where(np.arange(1000) % 4 == 0, np.nan, 1.0)})
+    reservoir = _sample_stream(data, capacity=50, chunk_rows=64, seed=0)
+    sample = reservoir.sample()
+    assert len(sample) == 50
+    assert sample["x"].is_monotonic_increasing and sample["x"].is_unique
+    assert sample.equals(data.iloc[sample["x"]].reset_index(drop=True))
+    assert reservoir.num_rows == 1000
+    assert reservoir.null_counts == {"x": 0, "y": 250}
+
+
+def test_reservoir_sample_of_a_short_stream_is_the_stream():
+    data = pd.DataFrame({"x": np.arange(30)})
+    assert _sample_stream(data, capacity=50, chunk_rows=7, seed=0).sample().equals(data)
+    assert ReservoirSample(10).sample().empty
+
+
+def test_reservoir_sample_is_uniform():
+    # as with sequential Algorithm R, every row is kept with probability capacity / num_rows
+    num_rows, capacity, trials = 200, 20, 400
+    data = pd.DataFrame({"x": np.arange(num_rows)})
+    kept = np.zeros(num_rows)
+    for seed in range(trials):
+        kept[_sample_stream(data, capacity, chunk_rows=37, seed=seed).sample()["x"]] += 1
+    expected = trials * capacity / num_rows
+    assert np.abs(kept - expected).max() < 5 * np.sqrt(expected)
+    # early and late rows, and the rows of each chunk, are equally likely
+    assert abs(kept[:100].sum() - kept[100:].sum()) < 5 * np.sqrt(kept.sum())
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from water_data_helpers import WaterSeries, build_water_store, load_water_data, read_usgs_rdb, store_path
+
+RDB_HEADER = """# ---------------------------------- WARNING ----------------------------------------
+# Some of the data that you have obtained from this U.S. Geological Survey database
+agency_cd\tsite_no\tdatetime\t1234_00060_00003\t1234_00060_00003_cd\t5678_00065_00003\t5678_00065_00003_cd
+5s\t15s\t20d\t14n\t10s\t14n\t10s
+"""
+
+
+@pytest.fixture
+def rdb_file(tmp_path):
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2019-01-01", "2021-12-31")
+    discharge = rng.gamma(2, 500, len(days)).round(1).astype(str)
+    stage = rng.normal(5, 1, len(days)).round(2).astype(str)
+    discharge[10], stage[20] = "Ice", "Eqp"
+    lines = [
+        f"USGS\t01234567\t{day:%Y-%m-%d}\t{q}\tA\t{h}\tA" for day, q, h in zip(days[::-1], discharge[::-1], stage[::-1])
+    ]
+    path = tmp_path / "site.rdb"
+    path.write_text(RDB_HEADER + "\n".join(lines) + "\n")
+    return path
+
+
+def test_read_usgs_rdb_types_sorts_and_normalizes(rdb_file):
+    data = read_usgs_rdb(rdb_file)
+    raw = pd.read_csv(rdb_file, sep="\t", comment="#", skiprows=[3], dtype=str)
+    assert len(data) == len(raw) - 2  # the days reported as "Ice" and "Eqp"
+    assert data["date"].is_monotonic_increasing
+    assert data["discharge_rate"].dtype == "float64"
+    for column in ["stage_val", "discharge_rate"]:
+        expected = (data[column] - data[column].min()) / (data[column].max() - data[column].min())
+        assert np.allclose(data[f"{column}_norm"], expected)
+
+
+def test_read_usgs_rdb_needs_both_parameters(tmp_path):
+    path = tmp_path / "site.tsv"
+    path.write_text("agency_cd\tdatetime\t1234_00060_00003\nUSGS\t2020-01-01\t1.0\n")
+    with pytest.raises(RuntimeError, match="00065"):
+        read_usgs_rdb(path)
+
+
+def test_store_round_trips_the_parsed_data(rdb_file):
+    data = load_water_data(rdb_file)
+    store = store_path(rdb_file)
+    assert store.exists()
+    expected = read_usgs_rdb(rdb_file)
+    pd.testing.assert_frame_equal(data, expected)
+    assert data.attrs["water_ranges"] == {
+        column: (expected[column].min(), expected[column].max()) for column in ["stage_val", "discharge_rate"]
+    }
+    assert not list(rdb_file.parent.glob("*.tmp"))
+
+
+def test_stale_store_is_rebuilt(rdb_file):
+    store = build_water_store(rdb_file)
+    os.utime(store, (0, 0))
+    rdb_file.write_text(rdb_file.read_text().replace("\t2021-12-31\t", "\t2022-01-01\t"))
+    assert load_water_data(rdb_file)["date"].iloc[-1] == pd.Timestamp("2022-01-01")
+    assert store.stat().st_mtime > 0
+
+
+def test_unwritable_store_falls_back_to_parsing(rdb_file, monkeypatch):
+    def _read_only(source, store=None):
+        raise PermissionError(f"read-only: {store}")
+
+    monkeypatch.setattr("water_data_helpers.build_water_store", _read_only)
+    data = load_water_data(rdb_file)
+    pd.testing.assert_frame_equal(data, read_usgs_rdb(rdb_file))
+    assert set(data.attrs["water_ranges"]) == {"stage_val", "discharge_rate"}
+    assert not store_path(rdb_file).exists()
+
+
+@pytest.fixture
+def gappy_days() -> pd.DataFrame:
+    # missing days, as where USGS reported ice or equipment failures
+    rng = np.random.default_rng(1)
+    days = pd.date_range("2020-01-01", "2020-12-31")
+    days = days[rng.random(len(days)) > 0.2]
+    return pd.DataFrame({"date": days, "stage_val": rng.normal(size=len(days))})
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        ("2020-03-01", "2020-03-31"),
+        ("2019-06-01", "2020-01-15"),
+        ("2020-12-20", "2021-02-01"),
+        ("2020-05-05 12:00", "2020-05-09"),
+        ("2020-07-01", "2020-06-01"),
+        ("2021-01-01", "2021-12-31"),
+    ],
+)
+def test_between_matches_a_boolean_mask(gappy_days, start, end):
+    expected = gappy_days[(gappy_days["date"] >= start) & (gappy_days["date"] <= end)]
+    result = WaterSeries(gappy_days).between(start, end)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_windows_match_a_boolean_mask(gappy_days):
+    starts, lo, hi = WaterSeries(gappy_days).windows(window_days=30, stride_days=7)
+    assert starts[0] == gappy_days["date"].iloc[0]
+    assert starts[-1] + pd.Timedelta(days=29) <= gappy_days["date"].iloc[-1]
+    assert starts[-1] + pd.Timedelta(days=36) > gappy_days["date"].iloc[-1]
+    for start, first, last in zip(starts, lo, hi):
+        mask = (gappy_days["date"] >= start) & (gappy_days["date"] < start + pd.Timedelta(days=30))
+        assert np.flatnonzero(mask).tolist() == list(range(first, last))
+
+
+def test_windows_of_too_little_data():
+    series = WaterSeries(pd.DataFrame({"date": pd.to_datetime(["2020-01-01", "2020-01-05"])}))
+    starts, lo, hi = series.windows(window_days=30, stride_days=7)
+    assert len(starts) == len(lo) == len(hi) == 0
+    starts, lo, hi = WaterSeries(pd.DataFrame({"date": pd.to_datetime([])})).windows(30, 7)
+    assert len(starts) == 0